@@ -0,0 +1,254 @@
+"""
+In-process search index over Productos.tipo_producto (GET /api/productos/search/).
+
+Names like "TIRANTE 2x4 3.05" are split into words (lowercase, without
+accents, decimal comma as point). Every word of the query must be the
+prefix of some word of the name, so "tir 2x" and "2x4 tirante" both find
+it. Words live in one sorted list, and a prefix is a bisect plus a scan
+of the words that start with it.
+
+The state is an immutable _Instantanea: a search reads one reference, and
+updates build a new snapshot and swap it, so a search running during an
+update never mixes old and new lists.
+
+Products created, renamed or deleted through the ORM are recorded by the
+Productos signals in a change log in the shared cache (a sequence number
+plus one entry per committed change, see registrar_cambios). Each process
+applies the entries it hasn't seen by reading just those products again.
+The INDICE_PRODUCTOS version forces a full rebuild instead; it is bumped
+by the bulk paths that skip signals (import_products) and whenever the log
+can't be trusted (missing entries, a reset sequence). Changes to price or
+stock don't touch the index: the matched rows are read from the database.
+"""
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from heapq import nsmallest
+
+from django.core.cache import cache, caches
+from django.core.files import locks
+
+from .versiones import invalidar_tablas, version_tablas
+
+# Version key bumped to rebuild the index in every process
+INDICE_PRODUCTOS = 'indice:productos'
+# Change log: sequence number and one entry (changed ids) per number
+SECUENCIA_CAMBIOS = 'api:indice:productos:secuencia'
+CAMBIO = 'api:indice:productos:cambio:%d'
+# Entries older than this, or more than MAX_CAMBIOS behind, mean a rebuild
+CAMBIOS_TIMEOUT = 24 * 3600
+MAX_CAMBIOS = 200
+
+LIMITE = 20
+MAX_LIMITE = 100
+_PALABRA = re.compile(r'[\w./]+')
+
+
+def palabras(texto):
+    """'Tirante 2x4 3,05' -> ['tirante', '2x4', '3.05']"""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).replace(',', '.')
+    return _PALABRA.findall(texto)
+
+
+@contextmanager
+def _exclusivo():
+    """
+    Lock other processes out of the change log. FileBasedCache's add and
+    incr are a read and then a write, so two processes could take the same
+    number; the lock file sits next to the cache files (clear() and the
+    culling only delete *.djcache). The other backends need no lock: locmem
+    is per process and db's add is atomic.
+    """
+    directorio = getattr(caches['default'], '_dir', None)
+    if directorio is None:
+        yield
+        return
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, 'indice_productos.lock'), 'ab') as archivo:
+        locks.lock(archivo, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(archivo)
+
+
+def registrar_cambios(ids):
+    """
+    Record that the products `ids` were created, renamed or deleted (after
+    commit). A sequence number the cache can't hand out only once (cache.add
+    of its entry fails) falls back to rebuilding every index.
+    """
+    if not ids:
+        return
+    with _exclusivo():
+        if cache.add(SECUENCIA_CAMBIOS, 0, timeout=None):
+            # New or evicted sequence: numbers already seen by some index are
+            # handed out again, so those indexes can't tell they are behind
+            invalidar_tablas(INDICE_PRODUCTOS)
+        try:
+            numero = cache.incr(SECUENCIA_CAMBIOS)
+        except ValueError:  # evicted in between
+            numero = None
+        if numero is None or not cache.add(CAMBIO % numero, sorted(ids), timeout=CAMBIOS_TIMEOUT):
+            invalidar_tablas(INDICE_PRODUCTOS)
+
+
+def _clave_orden(pk, lista):
+    """Last tiebreak of the results: fewer words, then alphabetically"""
+    return len(lista), ' '.join(lista), pk
+
+
+class _Instantanea:
+    """Immutable state of the index for one (version, secuencia) of the cache"""
+
+    def __init__(self, version, secuencia, nombres, orden, por_palabra, por_primera, anterior=None):
+        self.version = version
+        self.secuencia = secuencia
+        self.nombres = nombres  # id -> words of the name
+        self.orden = orden  # id -> sort key of the name
+        self.por_palabra = por_palabra  # word -> ids of the products that have it
+        self.por_primera = por_primera  # the same for the first word of each name
+        self.palabras = self._ordenadas(por_palabra, anterior and anterior.palabras)
+        self.ids_palabras = [por_palabra[palabra] for palabra in self.palabras]
+        self.primeras = self._ordenadas(por_primera, anterior and anterior.primeras)
+        self.ids_primeras = [por_primera[palabra] for palabra in self.primeras]
+
+    @staticmethod
+    def _ordenadas(indice, anteriores):
+        """Sorted words of indice, editing the previous sorted list when there is one"""
+        if anteriores is None:
+            return sorted(indice)
+        if len(anteriores) == len(indice) and all(palabra in indice for palabra in anteriores):
+            return anteriores
+        palabras = [palabra for palabra in anteriores if palabra in indice]
+        vistas = set(palabras)
+        for palabra in indice.keys() - vistas:
+            insort(palabras, palabra)
+        return palabras
+
+    @classmethod
+    def construir(cls, version, secuencia):
+        from .models import Productos
+
+        nombres, orden, por_palabra, por_primera = {}, {}, {}, {}
+        for pk, nombre in Productos.objects.values_list('id', 'tipo_producto').iterator(chunk_size=5000):
+            lista = palabras(nombre)
+            nombres[pk] = lista
+            orden[pk] = _clave_orden(pk, lista)
+            for palabra in set(lista):
+                por_palabra.setdefault(palabra, []).append(pk)
+            if lista:
+                por_primera.setdefault(lista[0], []).append(pk)
+        return cls(version, secuencia, nombres, orden, por_palabra, por_primera)
+
+    def con_cambios(self, secuencia, ids):
+        """New snapshot with the current names of `ids` (missing ones were deleted)"""
+        from .models import Productos
+
+        actuales = dict(Productos.objects.filter(id__in=ids).values_list('id', 'tipo_producto'))
+        # Shallow copies: the lists of ids are replaced, never modified in place
+        nombres, orden = dict(self.nombres), dict(self.orden)
+        por_palabra, por_primera = dict(self.por_palabra), dict(self.por_primera)
+        for pk in ids:
+            anterior = nombres.pop(pk, None)
+            orden.pop(pk, None)
+            if anterior:
+                for palabra in set(anterior):
+                    _quitar(por_palabra, palabra, pk)
+                _quitar(por_primera, anterior[0], pk)
+            if pk in actuales:
+                lista = palabras(actuales[pk])
+                nombres[pk] = lista
+                orden[pk] = _clave_orden(pk, lista)
+                for palabra in set(lista):
+                    por_palabra[palabra] = por_palabra.get(palabra, []) + [pk]
+                if lista:
+                    por_primera[lista[0]] = por_primera.get(lista[0], []) + [pk]
+        return _Instantanea(self.version, secuencia, nombres, orden, por_palabra, por_primera, anterior=self)
+
+
+def _quitar(indice, palabra, pk):
+    ids = [i for i in indice.get(palabra, ()) if i != pk]
+    if ids:
+        indice[palabra] = ids
+    else:
+        indice.pop(palabra, None)
+
+
+class IndiceProductos:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.instantanea = None
+
+    def _estado_cache(self):
+        return version_tablas(INDICE_PRODUCTOS), cache.get(SECUENCIA_CAMBIOS) or 0
+
+    def _vigente(self):
+        """The current snapshot, brought up to date first if the cache moved on"""
+        version, secuencia = self._estado_cache()
+        instantanea = self.instantanea
+        if instantanea is not None and (instantanea.version, instantanea.secuencia) == (version, secuencia):
+            return instantanea
+        with self.lock:
+            instantanea = self.instantanea
+            if instantanea is None or instantanea.version != version or not (
+                instantanea.secuencia <= secuencia <= instantanea.secuencia + MAX_CAMBIOS
+            ):
+                instantanea = _Instantanea.construir(version, secuencia)
+            elif instantanea.secuencia < secuencia:
+                claves = [CAMBIO % numero for numero in range(instantanea.secuencia + 1, secuencia + 1)]
+                cambios = cache.get_many(claves)
+                if len(cambios) < len(claves):
+                    instantanea = _Instantanea.construir(version, secuencia)
+                else:
+                    ids = set().union(*cambios.values())
+                    instantanea = instantanea.con_cambios(secuencia, ids)
+            self.instantanea = instantanea
+        return instantanea
+
+    @staticmethod
+    def _con_prefijo(prefijo, palabras, ids):
+        """Ids of every word of the sorted `palabras` that starts with prefijo"""
+        resultado = set()
+        i = bisect_left(palabras, prefijo)
+        while i < len(palabras) and palabras[i].startswith(prefijo):
+            resultado.update(ids[i])
+            i += 1
+        return resultado
+
+    def buscar(self, texto, limite=LIMITE):
+        """
+        Ids of the best `limite` matches, best first: names where every word
+        typed is a whole word, then names whose first word starts with the
+        first word typed, then shorter names, alphabetically.
+        """
+        consulta = list(dict.fromkeys(palabras(texto)))
+        if not consulta:
+            return []
+        # One reference for the whole search: updates swap in a new snapshot
+        indice = self._vigente()
+        candidatos = None
+        # Longest words first: usually the smallest sets
+        for palabra in sorted(consulta, key=len, reverse=True):
+            ids = self._con_prefijo(palabra, indice.palabras, indice.ids_palabras)
+            candidatos = ids if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+
+        # The tiers are set operations, so only the sort key is looked up per id
+        exactos = candidatos.intersection(*(indice.por_palabra.get(palabra, ()) for palabra in consulta))
+        parciales = candidatos - exactos
+        inicio = self._con_prefijo(consulta[0], indice.primeras, indice.ids_primeras)
+        resultado = []
+        for grupo in (exactos & inicio, exactos - inicio, parciales & inicio, parciales - inicio):
+            resultado += nsmallest(limite - len(resultado), grupo, key=indice.orden.__getitem__)
+            if len(resultado) >= limite:
+                break
+        return resultado
+
+
+indice_productos = IndiceProductos()
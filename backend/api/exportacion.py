@@ -0,0 +1,116 @@
+"""
+Streaming export of movimientos (GET /api/movimientos/export/).
+
+Rows are read with values_list() in keyset batches of CHUNK_SIZE transactions
+((fecha, id) > last one, ORDER BY fecha, id, LIMIT), so neither model instances
+nor the full result are ever held in memory, not even by drivers that buffer
+the whole result set client side (mysqlclient). CSV is written to the response
+as it is produced and XLSX goes through openpyxl's write-only mode (rows are
+flushed to a temporary file, not kept in the workbook).
+"""
+import csv
+import tempfile
+
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+
+CHUNK_SIZE = 2000
+
+# (header, lookup)
+COLUMNAS_MOVIMIENTO = [
+    ('id', 'id'),
+    ('fecha', 'fecha'),
+    ('tipo', 'tipo'),
+    ('numero_comprobante', 'numero_comprobante'),
+    ('cuenta_id', 'cuenta_id'),
+    ('cuenta', 'cuenta__nombre'),
+    ('total', 'total'),
+    ('descuento_total', 'descuento_total'),
+    ('estado', 'estado'),
+    ('concepto', 'concepto'),
+    ('saldo_diferencia', 'saldo_diferencia'),
+]
+COLUMNAS_ITEM = [
+    ('item_id', 'transaccionitems__id'),
+    ('producto_id', 'transaccionitems__producto_id'),
+    ('producto', 'transaccionitems__nombre_producto'),
+    ('precio_unitario', 'transaccionitems__precio_unitario'),
+    ('cantidad', 'transaccionitems__cantidad'),
+    ('descuento_item', 'transaccionitems__descuento_item'),
+]
+
+
+class ExportNegotiation(DefaultContentNegotiation):
+    """?format= picks the file type of the export, not a DRF renderer"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def filas_movimientos(queryset, con_items=False, chunk_size=CHUNK_SIZE):
+    """
+    Header row followed by one tuple per transaction, or per item line when
+    con_items is set (LEFT JOIN: a transaction without items still gets one
+    row with empty item columns).
+    """
+    columnas = COLUMNAS_MOVIMIENTO + (COLUMNAS_ITEM if con_items else [])
+    valores = [lookup for _, lookup in columnas]
+    queryset = queryset.select_related(None).prefetch_related(None).order_by('fecha', 'id')
+    yield [titulo for titulo, _ in columnas]
+    ultimo = None
+    while True:
+        lote = queryset if ultimo is None else queryset.filter(
+            Q(fecha__gt=ultimo[0]) | Q(fecha=ultimo[0], id__gt=ultimo[1])
+        )
+        if con_items:
+            # The batch is of transactions, whatever their number of item lines
+            claves = list(lote.values_list('fecha', 'id')[:chunk_size])
+            filas = queryset.filter(id__in=[pk for _, pk in claves]).order_by(
+                'fecha', 'id', 'transaccionitems__id'
+            ).values_list(*valores) if claves else []
+        else:
+            filas = list(lote.values_list(*valores)[:chunk_size])
+            claves = [(fila[1], fila[0]) for fila in filas]  # id and fecha lead COLUMNAS_MOVIMIENTO
+        yield from filas
+        if len(claves) < chunk_size:
+            return
+        ultimo = claves[-1]
+
+
+class _Eco:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, valor):
+        return valor
+
+
+def respuesta_csv(filas, nombre):
+    escritor = csv.writer(_Eco())
+
+    def generar():
+        yield '\ufeff'  # BOM so Excel opens the accents correctly
+        for fila in filas:
+            yield escritor.writerow(['' if valor is None else valor for valor in fila])
+
+    response = StreamingHttpResponse(generar(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+    return response
+
+
+def respuesta_xlsx(filas, nombre):
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Movimientos')
+    for fila in filas:
+        hoja.append(fila)
+    archivo = tempfile.TemporaryFile()
+    libro.save(archivo)
+    archivo.seek(0)
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=f'{nombre}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
@@ -0,0 +1,329 @@
+"""
+Synthetic data sets for benchmarks and local testing (manage.py seed_dataset
+and manage.py benchmark).
+
+crear_tablas() creates the unmanaged api tables (the real schema lives in
+MySQL) on an empty database such as a local SQLite.
+
+generar_dataset(items) writes cuentas, productos, every tipo of transaccion
+and the item lines, shaped like production data:
+- a few cuentas and productos get most of the movement (Zipf weights);
+- facturas have 1 to 12 lines, most of them short;
+- most facturas are paid with one or more pagos/cobranzas that use the same
+  numero_comprobante, and the recent ones are often still pending;
+- volume follows the season and the weekday;
+- sueldos, alquiler, impuestos, aguinaldo, jornales and the other expense
+  tipos come on their usual dates.
+
+A given semilla always produces the same rows. Rows are written in
+chronological order with executemany INSERTs, which cost far less than
+bulk_create at millions of rows, while the recompute signal handlers are
+suspended. Balances, stock, estado, saldo_diferencia and the rollup are
+recomputed once at the end, as after an import.
+"""
+import heapq
+import math
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+
+from .models import (Cuentas, Productos, Saldo, TransaccionItems, Transacciones, insertar_filas,
+                     recalcular_movimientos, recalculos_suspendidos)
+
+LOTE = 20000
+NOMBRES = ['TIRANTE', 'TABLA', 'LISTON', 'MACHIMBRE', 'VIGA', 'POSTE', 'CLAVADERA', 'ZOCALO', 'TERCIADO']
+MADERAS = ['PINO', 'ALAMO', 'EUCALIPTO', 'QUEBRACHO', 'SAUCE', 'FENOLICO']
+LARGOS = ['2.44', '3.05', '3.66', '4.27', '4.88', '5.50']
+# Lines per factura: 1 to 12, mean about 3
+PESOS_LINEAS = [30, 22, 15, 10, 7, 5, 4, 3, 2, 1, 0.6, 0.4]
+# Volume by month (construction season) and by weekday (Sunday closed)
+PESOS_MES = [0.7, 0.75, 1.1, 1.15, 1.1, 0.95, 0.9, 1.0, 1.1, 1.2, 1.2, 0.85]
+PESOS_DIA = [1.1, 1.0, 1.0, 1.0, 1.15, 0.45, 0.0]
+CAMPOS_TRANSACCION = ['id', 'tipo', 'fecha', 'cuenta_id', 'total', 'numero_comprobante',
+                      'descuento_total', 'concepto', 'estado']
+CAMPOS_ITEM = ['transaccion_id', 'producto_id', 'nombre_producto', 'precio_unitario', 'cantidad', 'descuento_item']
+CENTAVO = Decimal('0.01')
+
+
+def crear_tablas():
+    """
+    Create the unmanaged api tables that don't exist yet, with an index on
+    every foreign key as InnoDB has in MySQL.
+    """
+    existentes = connection.introspection.table_names()
+    with connection.schema_editor() as editor:
+        for modelo in apps.get_app_config('api').get_models():
+            if modelo._meta.managed or modelo._meta.db_table in existentes:
+                continue
+            editor.create_model(modelo)
+            for campo in modelo._meta.concrete_fields:
+                if campo.is_relation:
+                    editor.add_index(modelo, models.Index(
+                        fields=[campo.name], name=f'{modelo._meta.db_table}_{campo.column}'[:30]
+                    ))
+
+
+def tamanios(items):
+    """Rows of the lookup tables for a data set of `items` item lines"""
+    return {
+        'cuentas': min(5000, max(10, items // 200)),
+        'productos': min(20000, max(20, items // 50)),
+    }
+
+
+def _siguiente_id(modelo):
+    return (modelo.objects.aggregate(maximo=models.Max('pk'))['maximo'] or 0) + 1
+
+
+def _reiniciar_secuencias(*modelos):
+    """
+    Move the id sequences past the rows inserted with explicit ids, or the
+    next ORM insert collides with them (PostgreSQL). MySQL and SQLite carry
+    on from the highest id by themselves, so there is no SQL for them.
+    """
+    sentencias = connection.ops.sequence_reset_sql(no_style(), modelos)
+    if sentencias:
+        with connection.cursor() as cursor:
+            for sentencia in sentencias:
+                cursor.execute(sentencia)
+
+
+def _zipf(cantidad, azar, exponente=1.0):
+    """Cumulative Zipf weights for `cantidad` elements, ranks in random order"""
+    pesos = [1 / (rango ** exponente) for rango in range(1, cantidad + 1)]
+    azar.shuffle(pesos)
+    return list(accumulate(pesos))
+
+
+def _monto(valor):
+    return Decimal(valor).quantize(CENTAVO)
+
+
+class _Generador:
+    def __init__(self, items, semilla, cuentas, productos, desde, meses, lote, progreso):
+        self.azar = random.Random(semilla)
+        self.items = items
+        self.cantidades = {**tamanios(items), 'facturas': 0, 'pagos': 0, 'gastos': 0, 'items': 0}
+        if cuentas:
+            self.cantidades['cuentas'] = cuentas
+        if productos:
+            self.cantidades['productos'] = productos
+        self.desde = desde
+        self.hasta = date(desde.year + (desde.month - 1 + meses) // 12, (desde.month - 1 + meses) % 12 + 1, 1) \
+            - timedelta(days=1)
+        self.lote = lote
+        self.progreso = progreso
+        self.transacciones, self.lineas = [], []
+        self.numeros = {}  # (cuenta, tipo) -> last numero_comprobante
+        self.pagos_pendientes = []  # heap of (fecha, order, row) written when the day comes
+
+    def generar(self):
+        azar = self.azar
+        self.crear_cuentas()
+        self.crear_productos()
+        self.siguiente_transaccion = _siguiente_id(Transacciones)
+        self.orden = 0
+
+        dias = [self.desde + timedelta(days=i) for i in range((self.hasta - self.desde).days + 1)]
+        pesos = [PESOS_MES[d.month - 1] * PESOS_DIA[d.weekday()] * (1 + 0.3 * i / len(dias))  # growth
+                 for i, d in enumerate(dias)]
+        lineas_media = sum(n * p for n, p in enumerate(PESOS_LINEAS, start=1)) / sum(PESOS_LINEAS)
+        por_peso = self.items / lineas_media / sum(pesos)
+        cum_lineas = list(accumulate(PESOS_LINEAS))
+
+        restantes = self.items
+        for i, dia in enumerate(dias):
+            self.pagos_del_dia(dia)
+            self.gastos_del_dia(dia)
+            esperadas = pesos[i] * por_peso
+            facturas = int(esperadas) + (azar.random() < esperadas - int(esperadas))
+            if i == len(dias) - 1:
+                facturas = max(facturas, 1)
+            while restantes > 0 and (facturas > 0 or i == len(dias) - 1):
+                lineas = min(restantes, azar.choices(range(1, len(PESOS_LINEAS) + 1), cum_weights=cum_lineas)[0])
+                self.factura(dia, lineas)
+                restantes -= lineas
+                facturas -= 1
+            if len(self.lineas) >= self.lote:
+                self.escribir()
+        self.pagos_del_dia(None)
+        self.escribir()
+
+    def avisar(self):
+        if self.progreso:
+            self.progreso(self.cantidades)
+
+    def crear_cuentas(self):
+        azar = self.azar
+        primera = _siguiente_id(Cuentas)
+        filas = []
+        for i in range(self.cantidades['cuentas']):
+            proveedor = azar.random() < 0.2
+            filas.append((
+                primera + i,
+                f'{"Proveedor" if proveedor else "Cliente"} {i:05d}',
+                f'cuenta{i}@example.com' if azar.random() < 0.6 else None,
+                f'11{azar.randrange(10 ** 8):08d}' if azar.random() < 0.5 else None,
+                'proveedor' if proveedor else 'cliente',
+                0,
+            ))
+        insertar_filas(Cuentas, ['id', 'nombre', 'contacto_mail', 'contacto_telefono', 'tipo_cuenta', 'monto'], filas)
+        self.clientes = [f[0] for f in filas if f[4] == 'cliente'] or [filas[0][0]]
+        self.proveedores = [f[0] for f in filas if f[4] == 'proveedor'] or [filas[-1][0]]
+        self.pesos_clientes = _zipf(len(self.clientes), azar)
+        self.pesos_proveedores = _zipf(len(self.proveedores), azar)
+        self.cuenta_ids = [f[0] for f in filas]
+
+    def crear_productos(self):
+        azar = self.azar
+        primera = _siguiente_id(Productos)
+        filas = []
+        for i in range(self.cantidades['productos']):
+            costo = round(azar.uniform(500, 50000), 2)
+            cantidad_inicial = azar.randint(0, 500)
+            filas.append((
+                primera + i,
+                f'{azar.choice(NOMBRES)} {azar.choice(MADERAS)} {azar.randint(1, 6)}x{azar.randint(1, 12)} '
+                f'{azar.choice(LARGOS)} #{i}',
+                round(costo * azar.uniform(1.25, 1.6), 2),
+                costo,
+                cantidad_inicial,
+                cantidad_inicial,
+            ))
+        insertar_filas(Productos, ['id', 'tipo_producto', 'precio_venta_unitario', 'costo_unitario', 'cantidad',
+                              'cantidad_inicial'], filas)
+        self.productos = [(f[0], f[1], Decimal(str(f[2])), Decimal(str(f[3]))) for f in filas]
+        self.pesos_productos = _zipf(len(self.productos), azar, exponente=0.9)
+
+    def transaccion(self, tipo, fecha, cuenta_id, total, numero=None, descuento=Decimal('0.00'), concepto=None):
+        pk = self.siguiente_transaccion
+        self.siguiente_transaccion += 1
+        self.transacciones.append((pk, tipo, fecha.isoformat(), cuenta_id, str(total), numero,
+                                   str(descuento), concepto, 'pendiente'))
+        return pk
+
+    def factura(self, dia, lineas):
+        azar = self.azar
+        venta = azar.random() < 0.8
+        if venta:
+            tipo, cuenta_id = 'factura_venta', azar.choices(self.clientes, cum_weights=self.pesos_clientes)[0]
+        else:
+            tipo, cuenta_id = 'factura_compra', azar.choices(self.proveedores, cum_weights=self.pesos_proveedores)[0]
+        numero = self.numeros[cuenta_id, tipo] = self.numeros.get((cuenta_id, tipo), 0) + 1
+        pk = self.siguiente_transaccion
+        bruto = Decimal('0.00')
+        for producto_id, nombre, precio_venta, costo in (
+            self.productos[i] for i in self.indices_productos(lineas)
+        ):
+            precio = precio_venta if venta else costo
+            cantidad = Decimal(min(int(azar.paretovariate(1.6)), 200))
+            descuento = _monto(precio * cantidad * Decimal(azar.randint(5, 15)) / 100) \
+                if azar.random() < 0.1 else Decimal('0.00')
+            bruto += precio * cantidad - descuento
+            self.lineas.append((pk, producto_id, nombre, str(precio), str(cantidad), str(descuento)))
+        descuento_total = _monto(bruto * Decimal('0.05')) if azar.random() < 0.05 else Decimal('0.00')
+        total = _monto(bruto - descuento_total)
+        self.transaccion(tipo, dia, cuenta_id, total, numero, descuento_total)
+        self.cantidades['facturas'] += 1
+        self.cantidades['items'] += lineas
+        self.programar_pagos(tipo, dia, cuenta_id, numero, total)
+
+    def indices_productos(self, lineas):
+        """Distinct products of one factura"""
+        elegidos = set()
+        while len(elegidos) < min(lineas, len(self.productos)):
+            elegidos.update(self.azar.choices(range(len(self.productos)), cum_weights=self.pesos_productos,
+                                              k=lineas - len(elegidos)))
+        return elegidos
+
+    def programar_pagos(self, tipo, dia, cuenta_id, numero, total):
+        azar = self.azar
+        reciente = (self.hasta - dia).days < 60
+        sorteo = azar.random()
+        if sorteo < (0.55 if reciente else 0.15):
+            return  # still pending
+        tipo_pago = Transacciones.TIPO_PAGO_FACTURA[tipo]
+        if sorteo < 0.8:
+            cuotas = [total]
+        else:
+            # Paid in installments, the last one sometimes missing
+            partes = azar.randint(2, 4)
+            cuota = _monto(total / partes)
+            cuotas = [cuota] * (partes - 1) + [total - cuota * (partes - 1)]
+            if azar.random() < 0.3:
+                cuotas.pop()
+        fecha = dia
+        for cuota in cuotas:
+            fecha += timedelta(days=azar.choice((0, 0, 7, 15, 30, 30, 45, 60)))
+            if fecha > self.hasta:
+                break
+            self.orden += 1
+            heapq.heappush(self.pagos_pendientes, (fecha, self.orden, (tipo_pago, cuenta_id, cuota, numero)))
+
+    def pagos_del_dia(self, dia):
+        """Write the pagos/cobranzas due up to `dia` (all of them with None)"""
+        while self.pagos_pendientes and (dia is None or self.pagos_pendientes[0][0] <= dia):
+            fecha, _, (tipo, cuenta_id, total, numero) = heapq.heappop(self.pagos_pendientes)
+            self.transaccion(tipo, fecha, cuenta_id, total, numero)
+            self.cantidades['pagos'] += 1
+
+    def gastos_del_dia(self, dia):
+        azar = self.azar
+        gastos = []
+        empleados = max(2, len(self.cuenta_ids) // 40)
+        if dia.day == 1:
+            gastos.append(('alquiler', 1, 350000, 'Alquiler del mes'))
+            gastos.append(('sueldo', empleados, 600000, f'Sueldo {dia:%m/%Y}'))
+        if dia.day in (10, 20):
+            gastos.append(('impuestos', azar.randint(1, 3), 120000, 'Impuestos'))
+        if (dia.month, dia.day) in ((6, 30), (12, 18)):
+            gastos.append(('aguinaldo', empleados, 300000, f'Aguinaldo {dia:%m/%Y}'))
+        if dia.weekday() == 4:
+            gastos.append(('jornal', azar.randint(1, 4), 45000, 'Jornales de la semana'))
+        if dia.weekday() < 6:
+            gastos.append(('factura_c_varios', int(azar.random() < 0.5), 30000, 'Gastos varios'))
+            gastos.append(('servicio_cepillado', int(azar.random() < 0.3), 25000, 'Cepillado'))
+        for tipo, cantidad, monto, concepto in gastos:
+            for _ in range(cantidad):
+                cuenta_id = azar.choices(self.proveedores, cum_weights=self.pesos_proveedores)[0]
+                total = _monto(monto * math.exp(azar.gauss(0, 0.25)))
+                self.transaccion(tipo, dia, cuenta_id, total, concepto=concepto)
+                self.cantidades['gastos'] += 1
+
+    def escribir(self):
+        insertar_filas(Transacciones, CAMPOS_TRANSACCION, self.transacciones)
+        insertar_filas(TransaccionItems, CAMPOS_ITEM, self.lineas)
+        self.transacciones, self.lineas = [], []
+        self.avisar()
+
+    def recalcular(self):
+        recalcular_movimientos(self.cuenta_ids, [p[0] for p in self.productos], [self.desde, self.hasta])
+        Transacciones.actualizar_todos_saldos_diferencia()
+
+
+def generar_dataset(items, semilla=0, cuentas=None, productos=None, desde=date(2023, 1, 1), meses=24,
+                    lote=LOTE, progreso=None):
+    """
+    Insert a data set with `items` item lines over `meses` months and return
+    the row counts. cuentas/productos override the sizes from tamanios().
+    progreso(counts) is called after every batch written.
+    """
+    inicio = time.perf_counter()
+    generador = _Generador(items, semilla, cuentas, productos, desde, meses, lote, progreso)
+    with transaction.atomic(), recalculos_suspendidos():
+        Saldo.get_singleton()
+        generador.generar()
+        _reiniciar_secuencias(Cuentas, Productos, Transacciones, TransaccionItems)
+        generado = time.perf_counter()
+        generador.recalcular()
+    cantidades = generador.cantidades
+    cantidades['transacciones'] = cantidades['facturas'] + cantidades['pagos'] + cantidades['gastos']
+    cantidades['segundos_insercion'] = round(generado - inicio, 2)
+    cantidades['segundos'] = round(time.perf_counter() - inicio, 2)
+    return cantidades
@@ -0,0 +1,325 @@
+"""
+Bulk import of historical movimientos (manage.py import_movimientos and
+POST /api/movimientos/import/).
+
+The file (.csv or .xlsx) uses the layout of /api/movimientos/export/?items=1:
+one row per item line with the transaction columns repeated. Rows with the
+same `id` (the reference of the source system, it is not stored) form one
+transaction wherever they are in the file; without an `id` consecutive rows
+with the same fecha, tipo, cuenta and numero_comprobante do.
+
+Rows are read as a stream and grouped first (so the whole file is held in
+memory), then inserted in chunks with bulk_create while the recompute
+signal handlers are suspended. Balances, stock, estado,
+saldo_diferencia and the rollup are recomputed once, set-based, at the end.
+A transaction with an invalid row is skipped and the error reported with
+its row number; the rest of the file is still imported.
+"""
+import csv
+import io
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import (Cuentas, Productos, TransaccionItems, Transacciones, crear_con_ids,
+                     recalcular_movimientos, recalculos_suspendidos)
+
+CHUNK_SIZE = 1000
+FACTURAS = ('factura_venta', 'factura_compra')
+COLUMNAS_ITEM = ('producto_id', 'producto', 'precio_unitario', 'cantidad', 'descuento_item')
+
+
+class ErrorFila(ValueError):
+    def __init__(self, numero, mensaje):
+        super().__init__(mensaje)
+        self.numero = numero
+
+
+def leer_filas(archivo, nombre):
+    """
+    (row number, {header: value}) for every data row of a .csv/.xlsx path or
+    binary file object, read as a stream. Headers are lowercased.
+    """
+    if nombre.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            filas = libro.worksheets[0].iter_rows(values_only=True)
+            encabezados = [str(h or '').strip().lower() for h in next(filas, ())]
+            for numero, fila in enumerate(filas, start=2):
+                if any(valor not in (None, '') for valor in fila):
+                    yield numero, dict(zip(encabezados, fila))
+        finally:
+            libro.close()
+        return
+
+    if isinstance(archivo, str):
+        texto = open(archivo, newline='', encoding='utf-8-sig')
+    else:
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    with texto:
+        lector = csv.reader(texto)
+        encabezados = [h.strip().lower() for h in next(lector, [])]
+        for numero, fila in enumerate(lector, start=2):
+            if any(valor.strip() for valor in fila):
+                yield numero, dict(zip(encabezados, fila))
+
+
+def _vacio(valor):
+    return valor is None or (isinstance(valor, str) and not valor.strip())
+
+
+def _agrupado(texto, separador):
+    """'1.234.567' with separador '.': thousands groups of 3 digits after a first group of 1 to 3"""
+    return re.fullmatch(r'[1-9]\d{0,2}(?:%s\d{3})+' % re.escape(separador), texto) is not None
+
+
+def leer_numero(valor):
+    """
+    Decimal of a number cell as users type or paste it (also
+    import_products). The app shows amounts with toLocaleString('es-AR'):
+
+        '1.234,56', '$ 1.500,00', '1234,56', '1.234', '12.345.678,90'
+        and '1,234.56', '1234.56'
+
+    With both separators the last one is the decimal one and the other must
+    group thousands. A lone '.' followed by exactly 3 digits groups
+    thousands ('1.234' is 1234, '3.05' is 3.05); a lone ',' like that is
+    rejected, since '1,234' is 1234 or 1,234. Raises ValueError instead of
+    guessing.
+    """
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return Decimal(str(valor))
+    texto = re.sub(r'[\s$€]', '', str(valor or ''))
+    signo = ''
+    if texto[:1] in ('-', '+'):
+        signo, texto = texto[0], texto[1:]
+    if not re.fullmatch(r'[\d.,]*\d[\d.,]*', texto):
+        raise ValueError(f'número inválido: {valor!r}')
+
+    puntos, comas = texto.count('.'), texto.count(',')
+    if puntos and comas:
+        decimal = '.' if texto.rfind('.') > texto.rfind(',') else ','
+        miles = ',' if decimal == '.' else '.'
+        entero, _, fraccion = texto.rpartition(decimal)
+        if not _agrupado(entero, miles):
+            raise ValueError(f'número inválido: {valor!r}')
+        entero = entero.replace(miles, '')
+    elif puntos > 1 or comas > 1:
+        separador = '.' if puntos else ','
+        if not _agrupado(texto, separador):
+            raise ValueError(f'número inválido: {valor!r}')
+        entero, fraccion = texto.replace(separador, ''), ''
+    elif puntos or comas:
+        separador = '.' if puntos else ','
+        entero, _, fraccion = texto.partition(separador)
+        if len(fraccion) == 3 and _agrupado(texto, separador):
+            if separador == ',':
+                raise ValueError(f'número ambiguo: {valor!r} (para miles escribir 1234 o 1.234)')
+            entero, fraccion = entero + fraccion, ''
+    else:
+        entero, fraccion = texto, ''
+    return Decimal(f'{signo}{entero or 0}.{fraccion or 0}')
+
+
+def _decimal(valor, campo, numero, requerido=True):
+    if _vacio(valor):
+        if requerido:
+            raise ErrorFila(numero, f'{campo} es obligatorio')
+        return Decimal('0.00')
+    try:
+        return leer_numero(valor).quantize(Decimal('0.01'))
+    except (ValueError, InvalidOperation):
+        raise ErrorFila(numero, f'{campo} inválido: {valor!r}')
+
+
+def _entero(valor, campo, numero):
+    if _vacio(valor):
+        return None
+    try:
+        return int(float(str(valor).strip()))
+    except ValueError:
+        raise ErrorFila(numero, f'{campo} inválido: {valor!r}')
+
+
+def _fecha(valor, numero):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor or '').strip()
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ErrorFila(numero, f'fecha inválida: {valor!r} (AAAA-MM-DD o DD/MM/AAAA)')
+
+
+class ImportadorMovimientos:
+    """
+    importar(filas) -> resumen. progreso(resumen) is called after every chunk.
+    With dry_run the file is fully validated but nothing is written.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, dry_run=False, progreso=None):
+        self.chunk_size = max(1, chunk_size)
+        self.dry_run = dry_run
+        self.progreso = progreso
+        self.resumen = {'filas': 0, 'transacciones': 0, 'items': 0, 'omitidas': 0, 'errores': []}
+        self.cuentas_afectadas = set()
+        self.productos_afectados = set()
+        self.fechas = []
+        self.inicio = None
+
+    def importar(self, filas):
+        self.inicio = time.perf_counter()
+        # One query per lookup table instead of one per row
+        self.cuentas = dict(Cuentas.objects.values_list('id', 'nombre'))
+        self.cuentas_por_nombre = {nombre: pk for pk, nombre in self.cuentas.items()}
+        self.productos = dict(Productos.objects.values_list('id', 'tipo_producto'))
+        self.productos_por_nombre = {nombre: pk for pk, nombre in self.productos.items()}
+        self.comprobantes = set(
+            Transacciones.objects.filter(tipo__in=FACTURAS)
+            .values_list('cuenta_id', 'tipo', 'numero_comprobante')
+        )
+
+        with transaction.atomic():
+            lote = []
+            with recalculos_suspendidos():
+                for grupo in self._agrupar(filas):
+                    try:
+                        lote.append(self._construir(grupo))
+                    except ErrorFila as e:
+                        self.resumen['omitidas'] += 1
+                        self.resumen['errores'].append({'fila': e.numero, 'error': str(e)})
+                        continue
+                    if len(lote) >= self.chunk_size:
+                        self._insertar(lote)
+                        lote = []
+                self._insertar(lote)
+            if not self.dry_run and self.resumen['transacciones']:
+                self._recalcular()
+
+        self.resumen['segundos'] = round(time.perf_counter() - self.inicio, 2)
+        return self.resumen
+
+    def _agrupar(self, filas):
+        """
+        Rows of each transaction, in order of first appearance: every row of
+        an id, and each run of consecutive rows without id with the same
+        transaction columns.
+        """
+        grupos = {}
+        anterior, corridas = None, 0
+        for numero, fila in filas:
+            self.resumen['filas'] += 1
+            clave = self._clave(fila)
+            if isinstance(clave, tuple):
+                # The same columns after other rows are another transaction
+                corridas += clave != anterior
+                anterior = clave
+                clave = (corridas, clave)
+            else:
+                anterior = None
+            grupos.setdefault(clave, []).append((numero, fila))
+        return grupos.values()
+
+    @staticmethod
+    def _clave(fila):
+        # Rows without an id (blank cells in an exported file too) group by
+        # their transaction columns, not all together under ''
+        if not _vacio(fila.get('id')):
+            return str(fila['id']).strip()
+        return tuple(str(fila.get(campo) or '').strip() for campo in (
+            'fecha', 'tipo', 'cuenta_id', 'cuenta', 'numero_comprobante'
+        ))
+
+    def _cuenta(self, fila, numero):
+        if not _vacio(fila.get('cuenta_id')):
+            cuenta_id = _entero(fila['cuenta_id'], 'cuenta_id', numero)
+            if cuenta_id not in self.cuentas:
+                raise ErrorFila(numero, f'La cuenta {cuenta_id} no existe')
+            return cuenta_id
+        nombre = str(fila.get('cuenta') or '').strip()
+        if nombre not in self.cuentas_por_nombre:
+            raise ErrorFila(numero, f"La cuenta '{nombre}' no existe" if nombre else 'cuenta es obligatoria')
+        return self.cuentas_por_nombre[nombre]
+
+    def _construir(self, grupo):
+        numero, fila = grupo[0]
+        tipo = str(fila.get('tipo') or '').strip()
+        if tipo not in dict(Transacciones.TIPO_CHOICES):
+            raise ErrorFila(numero, f'tipo inválido: {tipo!r}')
+        cuenta_id = self._cuenta(fila, numero)
+        numero_comprobante = _entero(fila.get('numero_comprobante'), 'numero_comprobante', numero)
+        if tipo in FACTURAS:
+            if not numero_comprobante:
+                raise ErrorFila(numero, 'El número de comprobante es obligatorio.')
+            if (cuenta_id, tipo, numero_comprobante) in self.comprobantes:
+                raise ErrorFila(numero, f'Ya existe el comprobante {numero_comprobante} para esta cuenta y tipo.')
+
+        transaccion = Transacciones(
+            tipo=tipo,
+            fecha=_fecha(fila.get('fecha'), numero),
+            cuenta_id=cuenta_id,
+            total=_decimal(fila.get('total'), 'total', numero),
+            numero_comprobante=numero_comprobante,
+            descuento_total=_decimal(fila.get('descuento_total'), 'descuento_total', numero, requerido=False),
+            concepto=str(fila.get('concepto') or '').strip() or None,
+            estado='pendiente' if tipo in FACTURAS else (str(fila.get('estado') or '').strip() or 'pendiente'),
+        )
+        items = [self._item(numero, fila) for numero, fila in grupo
+                 if any(not _vacio(fila.get(campo)) for campo in COLUMNAS_ITEM)]
+        if tipo in FACTURAS:
+            self.comprobantes.add((cuenta_id, tipo, numero_comprobante))
+        return transaccion, items
+
+    def _item(self, numero, fila):
+        producto_id = _entero(fila.get('producto_id'), 'producto_id', numero)
+        nombre = str(fila.get('producto') or '').strip()
+        if producto_id is not None and producto_id not in self.productos:
+            raise ErrorFila(numero, f'El producto {producto_id} no existe')
+        if producto_id is None and nombre in self.productos_por_nombre:
+            producto_id = self.productos_por_nombre[nombre]
+        if producto_id is None and not nombre:
+            raise ErrorFila(numero, 'El item no tiene producto')
+        return TransaccionItems(
+            producto_id=producto_id,
+            nombre_producto=nombre or self.productos[producto_id],
+            precio_unitario=_decimal(fila.get('precio_unitario'), 'precio_unitario', numero),
+            cantidad=_decimal(fila.get('cantidad'), 'cantidad', numero),
+            descuento_item=_decimal(fila.get('descuento_item'), 'descuento_item', numero, requerido=False),
+        )
+
+    def _insertar(self, lote):
+        if not lote:
+            return
+        transacciones = [t for t, _ in lote]
+        items = []
+        if not self.dry_run:
+            crear_con_ids(transacciones, lote=self.chunk_size)
+            for t, items_transaccion in lote:
+                for item in items_transaccion:
+                    item.transaccion = t
+                items += items_transaccion
+            TransaccionItems.objects.bulk_create(items, batch_size=self.chunk_size)
+        else:
+            items = [item for _, items_transaccion in lote for item in items_transaccion]
+
+        self.cuentas_afectadas.update(t.cuenta_id for t in transacciones)
+        self.productos_afectados.update(i.producto_id for i in items if i.producto_id)
+        self.fechas += [min(t.fecha for t in transacciones), max(t.fecha for t in transacciones)]
+        self.resumen['transacciones'] += len(transacciones)
+        self.resumen['items'] += len(items)
+        if self.progreso:
+            self.progreso(self.resumen)
+
+    def _recalcular(self):
+        """One set-based recompute of everything the suspended signals would have updated"""
+        recalcular_movimientos(self.cuentas_afectadas, self.productos_afectados, self.fechas)
+        Transacciones.actualizar_todos_saldos_diferencia()
@@ -0,0 +1,267 @@
+import json
+import platform
+import sqlite3
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.generador import crear_tablas, generar_dataset
+from api.models import Cuentas, Productos, Transacciones
+from api.reportes import VENTAS_PRODUCTO
+from api.versiones import invalidar_tablas
+
+# Item lines of each data scale
+ESCALAS = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+DIRECTORIO = Path(settings.BASE_DIR) / 'benchmarks'
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the movimientos/cuentas/productos endpoints, the batch recomputes and the ventas '
+        'por producto report on a fresh SQLite database per data scale (item lines: '
+        f'{", ".join(ESCALAS)}). Saves times and query counts as JSON and compares them with a '
+        'stored baseline. Run with DATABASE_URL=sqlite:///benchmark.sqlite3.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(ESCALAS), action='append',
+                            help='Data scale, can be repeated (default: 1k and 100k)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per scenario, the median is reported')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data')
+        parser.add_argument('--only', action='append', help='Only the scenarios whose name contains this text')
+        parser.add_argument('--max-list-rows', type=int, default=100_000,
+                            help='Skip unpaginated lists of tables bigger than this')
+        parser.add_argument('--output', default=str(DIRECTORIO / 'resultado.json'))
+        parser.add_argument('--baseline', default=str(DIRECTORIO / 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store these results as the baseline of the scales that were run')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Slowdown over the baseline reported as a regression (0.25 = 25%%)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if a scenario got slower or runs more queries')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                'The benchmark runs on SQLite: DATABASE_URL=sqlite:///benchmark.sqlite3 python manage.py benchmark'
+            )
+        self.options = options
+        resultados = {
+            'meta': {
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'plataforma': platform.platform(),
+                'semilla': options['seed'],
+                'repeticiones': options['repeat'],
+                'fast_serialization': getattr(settings, 'FAST_SERIALIZATION', False),
+            },
+            'escalas': {},
+        }
+        for escala in options['scale'] or ['1k', '100k']:
+            resultados['escalas'][escala] = self.correr_escala(escala)
+
+        self.guardar(options['output'], resultados)
+        self.stdout.write(f'Resultados en {options["output"]}')
+        baseline = Path(options['baseline'])
+        if options['save_baseline']:
+            guardado = json.loads(baseline.read_text()) if baseline.exists() else {'escalas': {}}
+            guardado['meta'] = resultados['meta']
+            guardado['escalas'].update(resultados['escalas'])
+            self.guardar(baseline, guardado)
+            self.stdout.write(self.style.SUCCESS(f'Baseline actualizado: {baseline}'))
+        elif baseline.exists():
+            regresiones = self.comparar(resultados, json.loads(baseline.read_text()))
+            if regresiones and options['fail_on_regression']:
+                raise CommandError(f'{regresiones} escenarios empeoraron respecto de {baseline}')
+        else:
+            self.stdout.write(f'Sin baseline en {baseline} (--save-baseline para crearlo)')
+
+    @staticmethod
+    def guardar(ruta, datos):
+        ruta = Path(ruta)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(json.dumps(datos, indent=2, ensure_ascii=False) + '\n')
+
+    def correr_escala(self, escala):
+        """Fresh test database with the generated data, then every scenario"""
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            crear_tablas()
+            # Versions and cached reports of the previous database
+            for cache in caches.all():
+                cache.clear()
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Escala {escala}: generando datos...'))
+            filas = generar_dataset(ESCALAS[escala], semilla=self.options['seed'])
+            self.stdout.write(
+                f"  {filas['cuentas']} cuentas, {filas['productos']} productos, "
+                f"{filas['facturas']} facturas, {filas['pagos']} pagos, {filas['gastos']} gastos, {filas['items']} items "
+                f"({filas['segundos']}s)"
+            )
+            self.stdout.write(f'  {"escenario":<46} {"mediana ms":>11} {"mín ms":>9} {"queries":>8}')
+            escenarios = {}
+            for nombre, funcion, preparar in self.escenarios(filas):
+                if self.options['only'] and not any(texto in nombre for texto in self.options['only']):
+                    continue
+                escenarios[nombre] = resultado = self.medir(funcion, preparar, filas)
+                if 'omitido' in resultado:
+                    self.stdout.write(f'  {nombre:<46} {"omitido: " + resultado["omitido"]}')
+                else:
+                    self.stdout.write(
+                        f'  {nombre:<46} {resultado["ms"]:>11.2f} {resultado["min_ms"]:>9.2f} '
+                        f'{resultado["queries"]:>8}'
+                    )
+            return {'filas': filas, 'escenarios': escenarios}
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+    def medir(self, funcion, preparar, filas):
+        tiempos, consultas, estado = [], 0, None
+        for i in range(max(1, self.options['repeat'])):
+            if preparar:
+                if preparar(filas) is False:
+                    return {'omitido': f'más de {self.options["max_list_rows"]} filas'}
+            # Counted with an execute_wrapper: CaptureQueriesContext reads the
+            # growth of connection.queries_log, which stops at 9000 entries
+            ejecutadas = []
+            with connection.execute_wrapper(lambda execute, *args: ejecutadas.append(1) or execute(*args)):
+                inicio = time.perf_counter()
+                respuesta = funcion(i)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas = len(ejecutadas)
+            estado = getattr(respuesta, 'status_code', None)
+            if estado is not None and estado >= 400:
+                raise CommandError(f'HTTP {estado}: {respuesta.content[:500]!r}')
+        return {
+            'ms': round(statistics.median(tiempos), 3),
+            'min_ms': round(min(tiempos), 3),
+            'max_ms': round(max(tiempos), 3),
+            'queries': consultas,
+            'status': estado,
+        }
+
+    def escenarios(self, filas):
+        """(name, function of the run number, check before each run or None)"""
+        usuario, _ = get_user_model().objects.get_or_create(username='benchmark', defaults={'is_staff': True})
+        cliente = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(usuario)}')
+        cuenta = Cuentas.objects.filter(tipo_cuenta='cliente').order_by('id').first()
+        producto = Productos.objects.order_by('id').first()
+        factura = Transacciones.objects.filter(tipo='factura_venta').order_by('id').first()
+        maximo = self.options['max_list_rows']
+
+        def listado(filas_tabla):
+            return lambda filas: filas[filas_tabla] <= maximo
+
+        def ventas_sin_cache(filas):
+            invalidar_tablas(VENTAS_PRODUCTO)
+
+        def json_post(url, datos):
+            return cliente.post(url, datos, content_type='application/json')
+
+        def json_patch(url, datos):
+            return cliente.patch(url, datos, content_type='application/json')
+
+        def nueva_factura(i):
+            return json_post('/api/movimientos/', {
+                'tipo': 'factura_venta', 'fecha': '2024-06-15', 'cuenta': cuenta.pk,
+                'total': '300.00', 'numero_comprobante': 10_000_000 + i,
+                'items': [
+                    {'producto': producto.pk, 'nombre_producto': producto.tipo_producto,
+                     'precio_unitario': '100.00', 'cantidad': '1.00', 'descuento_item': '0.00'}
+                    for _ in range(3)
+                ],
+            })
+
+        return [
+            ('GET movimientos', lambda i: cliente.get('/api/movimientos/'), listado('transacciones')),
+            ('GET movimientos?expand=items', lambda i: cliente.get('/api/movimientos/?expand=items'),
+             listado('items')),
+            ('GET movimientos?page_size=100',
+             lambda i: cliente.get('/api/movimientos/?page_size=100'), None),
+            ('GET movimientos?page_size=100&expand=items',
+             lambda i: cliente.get('/api/movimientos/?page_size=100&expand=items'), None),
+            ('GET movimientos/<id>/?expand=items',
+             lambda i: cliente.get(f'/api/movimientos/{factura.pk}/?expand=items'), None),
+            ('POST movimientos (factura, 3 items)', nueva_factura, None),
+            ('PATCH movimientos/<id>/ total',
+             lambda i: json_patch(f'/api/movimientos/{factura.pk}/', {'total': f'{1000 + i}.00'}), None),
+            ('GET cuentas', lambda i: cliente.get('/api/cuentas/'), listado('cuentas')),
+            ('POST cuentas', lambda i: json_post('/api/cuentas/', {
+                'nombre': f'Benchmark {i}', 'tipo_cuenta': 'cliente', 'monto': 0,
+            }), None),
+            ('PATCH cuentas/<id>/',
+             lambda i: json_patch(f'/api/cuentas/{cuenta.pk}/', {'contacto_telefono': f'11{i:08d}'}), None),
+            ('GET productos', lambda i: cliente.get('/api/productos/'), listado('productos')),
+            ('POST productos', lambda i: json_post('/api/productos/', {
+                'tipo_producto': f'BENCHMARK {i}', 'precio_venta_unitario': 100,
+                'costo_unitario': 70, 'cantidad_inicial': 10,
+            }), None),
+            ('PATCH productos/<id>/',
+             lambda i: json_patch(f'/api/productos/{producto.pk}/', {'precio_venta_unitario': 100 + i}), None),
+            ('POST movimientos/batch_recalculate_balances/',
+             lambda i: json_post('/api/movimientos/batch_recalculate_balances/', {}), None),
+            ('POST productos/batch_recalculate_quantities/',
+             lambda i: json_post('/api/productos/batch_recalculate_quantities/', {}), None),
+            ('GET ventas-producto (sin cache)', lambda i: cliente.get('/api/ventas-producto/'), ventas_sin_cache),
+            ('GET ventas-producto (cache)', lambda i: cliente.get('/api/ventas-producto/'), None),
+            ('Cuentas.recalcular_monto', lambda i: cuenta.recalcular_monto(), None),
+            ('Productos.recalcular_cantidad', lambda i: producto.recalcular_cantidad(), None),
+        ]
+
+    def comparar(self, resultados, baseline):
+        """Print the changes against the baseline, return the number of regressions"""
+        tolerancia = self.options['tolerance']
+        regresiones = 0
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Comparación con el baseline del {baseline.get("meta", {}).get("fecha", "?")}'
+        ))
+        self.stdout.write(
+            f'  {"escala":<6} {"escenario":<46} {"base ms":>9} {"ms":>9} {"Δ":>7} {"queries":>9}  estado'
+        )
+        for escala, datos in resultados['escalas'].items():
+            base_escala = baseline.get('escalas', {}).get(escala, {}).get('escenarios', {})
+            for nombre, actual in datos['escenarios'].items():
+                base = base_escala.get(nombre)
+                if 'omitido' in actual:
+                    continue
+                if not base or 'omitido' in base:
+                    self.stdout.write(f'  {escala:<6} {nombre:<46} {"":>9} {actual["ms"]:>9.2f}'
+                                      f' {"":>7} {actual["queries"]:>9}  nuevo')
+                    continue
+                estado = []
+                if actual['queries'] > base['queries']:
+                    estado.append('más queries')
+                # Below a millisecond the difference is noise
+                if actual['ms'] > base['ms'] * (1 + tolerancia) and actual['ms'] - base['ms'] > 1:
+                    estado.append('más lento')
+                if estado:
+                    regresiones += 1
+                    texto = self.style.ERROR(', '.join(estado))
+                elif actual['ms'] < base['ms'] / (1 + tolerancia) or actual['queries'] < base['queries']:
+                    texto = self.style.SUCCESS('mejor')
+                else:
+                    texto = 'ok'
+                cambio = (actual['ms'] / base['ms'] - 1) * 100 if base['ms'] else 0
+                consultas = f'{base["queries"]}→{actual["queries"]}'
+                self.stdout.write(
+                    f'  {escala:<6} {nombre:<46} {base["ms"]:>9.2f} {actual["ms"]:>9.2f} {cambio:>+6.0f}%'
+                    f' {consultas:>9}  {texto}'
+                )
+        if regresiones:
+            self.stdout.write(self.style.ERROR(f'{regresiones} regresiones'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Sin regresiones'))
+        return regresiones
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializacion import SerializacionRapida
+from api.views import CuentasViewSet, ProductosViewSet, TransaccionesViewSet, TransaccionItemsViewSet
+
+VIEWSETS = {
+    'movimientos': TransaccionesViewSet,
+    'movimientos-items': TransaccionItemsViewSet,
+    'cuentas': CuentasViewSet,
+    'productos': ProductosViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the DRF serializers with the fast .values() path (api/serializacion.py) on the '
+        'current database: checks that the JSON is byte-identical and reports time and queries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Rows per endpoint (default: all)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path, the best one is reported')
+        parser.add_argument('--only', choices=list(VIEWSETS), action='append')
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        peticion = APIRequestFactory().get('/')
+        distintos = []
+        self.stdout.write(f'{"endpoint":<18} {"filas":>7} {"drf ms":>9} {"rápido ms":>10} {"x":>6} {"queries":>9}')
+        for nombre in options['only'] or VIEWSETS:
+            viewset = VIEWSETS[nombre]
+            # The list queryset of the view (only(), prefetch of the items) for both paths
+            vista = viewset(action='list', request=Request(peticion), format_kwarg=None)
+            queryset = vista.get_queryset().order_by('pk')
+            if options['limit']:
+                queryset = queryset[:options['limit']]
+            serializer_class = vista.get_serializer_class()
+            rapida = SerializacionRapida.para(serializer_class)
+
+            def drf():
+                return renderer.render(serializer_class(list(queryset.all()), many=True).data)
+
+            def rapido():
+                return renderer.render(rapida.serializar(rapida.valores(queryset.all())))
+
+            (t_drf, q_drf, salida_drf) = self.medir(drf, options['repeat'])
+            (t_rapido, q_rapido, salida_rapida) = self.medir(rapido, options['repeat'])
+            if salida_drf != salida_rapida:
+                distintos.append(nombre)
+            filas = queryset.count() if not options['limit'] else len(queryset)
+            self.stdout.write(
+                f'{nombre:<18} {filas:>7} {t_drf:>9.1f} {t_rapido:>10.1f} '
+                f'{t_drf / t_rapido if t_rapido else 0:>6.1f} {f"{q_drf}/{q_rapido}":>9}'
+            )
+
+        if distintos:
+            raise CommandError(f'La salida rápida difiere de la de DRF en: {", ".join(distintos)}')
+        self.stdout.write(self.style.SUCCESS('Salida idéntica en todos los endpoints'))
+
+    @staticmethod
+    def medir(funcion, repeticiones):
+        """(best ms, queries of one run, output)"""
+        mejor = None
+        for _ in range(max(1, repeticiones)):
+            # Counted with an execute_wrapper: CaptureQueriesContext reads the
+            # growth of connection.queries_log, which stops at 9000 entries
+            consultas = []
+            with connection.execute_wrapper(lambda execute, *args: consultas.append(1) or execute(*args)):
+                inicio = time.perf_counter()
+                salida = funcion()
+                duracion = (time.perf_counter() - inicio) * 1000
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor, len(consultas), salida
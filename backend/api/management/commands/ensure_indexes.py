@@ -0,0 +1,122 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Sum
+
+from api.models import TransaccionItems, Transacciones
+
+# The api models are unmanaged (managed = False), so migrations never create
+# these. (table, index name, columns)
+INDICES = [
+    # Duplicate comprobante check in create and actualizar_estado_pago
+    ('transacciones', 'idx_transacciones_cuenta_tipo_comprobante', ['cuenta_id', 'tipo', 'numero_comprobante']),
+    # Reports and tipo filters by date range
+    ('transacciones', 'idx_transacciones_tipo_fecha', ['tipo', 'fecha']),
+    # Keyset pagination of /api/movimientos
+    ('transacciones', 'idx_transacciones_fecha_id', ['fecha', 'id']),
+    ('transaccion_items', 'idx_transaccion_items_transaccion', ['transaccion_id']),
+    ('transaccion_items', 'idx_transaccion_items_producto', ['producto_id']),
+]
+
+
+def consultas_clave():
+    """Hot queries whose plans are reported before and after creating the indexes"""
+    return [
+        ('comprobante duplicado', Transacciones.objects.filter(
+            cuenta_id=1, tipo='factura_venta', numero_comprobante=1
+        )),
+        ('actualizar_estado_pago', Transacciones.objects.filter(
+            cuenta_id=1, numero_comprobante=1, tipo='cobranza'
+        )),
+        ('recalcular_cantidad', TransaccionItems.objects.filter(
+            producto_id=1, transaccion__tipo='factura_compra'
+        ).values('producto_id').annotate(total=Sum('cantidad'))),
+        ('ventas por producto', TransaccionItems.objects.filter(
+            transaccion__tipo='factura_venta'
+        ).values('nombre_producto').annotate(total_vendido=Sum('cantidad'))),
+        ('reporte por tipo y fecha', Transacciones.objects.filter(
+            tipo='factura_venta', fecha__range=('2024-01-01', '2024-12-31')
+        )),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the missing indexes for the hot lookups on transacciones/transaccion_items '
+        '(idempotent) and show EXPLAIN plans of the key queries before and after.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--dry-run', action='store_true', help='Only report the missing indexes')
+        parser.add_argument('--no-explain', action='store_true', help='Skip the EXPLAIN plans')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        explain = not options['no_explain']
+
+        if explain:
+            planes_antes = self.planes(options['database'])
+
+        faltantes = self.indices_faltantes(connection)
+        for tabla, nombre, columnas in INDICES:
+            estado = 'falta' if (tabla, nombre, columnas) in faltantes else 'ok'
+            self.stdout.write(f'{tabla}({", ".join(columnas)}): {estado}')
+
+        if options['dry_run'] or not faltantes:
+            if explain:
+                for titulo, plan in planes_antes.items():
+                    self.stdout.write(self.style.MIGRATE_HEADING(titulo))
+                    self.stdout.write('  actual:\n' + self.indentar(plan))
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(faltantes)} índices faltantes' + (' (dry-run)' if options['dry_run'] else '')
+            ))
+            return
+
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for tabla, nombre, columnas in faltantes:
+                cursor.execute(
+                    f'CREATE INDEX {quote(nombre)} ON {quote(tabla)} '
+                    f'({", ".join(quote(c) for c in columnas)})'
+                )
+                self.stdout.write(self.style.SUCCESS(f'Creado {nombre}'))
+
+        if explain:
+            planes_despues = self.planes(options['database'])
+            for titulo, antes in planes_antes.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(titulo))
+                self.stdout.write('  antes:\n' + self.indentar(antes))
+                self.stdout.write('  después:\n' + self.indentar(planes_despues[titulo]))
+
+    def indices_faltantes(self, connection):
+        """An index is present if some existing index starts with the same columns"""
+        faltantes = []
+        with connection.cursor() as cursor:
+            tablas = set(connection.introspection.table_names(cursor))
+            existentes = {}
+            for tabla in {t for t, _, _ in INDICES} & tablas:
+                existentes[tabla] = [
+                    info['columns']
+                    for info in connection.introspection.get_constraints(cursor, tabla).values()
+                    if info['index'] or info['primary_key'] or info['unique']
+                ]
+        for tabla, nombre, columnas in INDICES:
+            if tabla not in existentes:
+                self.stderr.write(self.style.WARNING(f'La tabla {tabla} no existe, se omite {nombre}'))
+                continue
+            if not any(cols[:len(columnas)] == columnas for cols in existentes[tabla]):
+                faltantes.append((tabla, nombre, columnas))
+        return faltantes
+
+    def planes(self, database):
+        planes = {}
+        for titulo, queryset in consultas_clave():
+            try:
+                planes[titulo] = queryset.using(database).explain()
+            except Exception as e:
+                planes[titulo] = f'EXPLAIN no disponible: {e}'
+        return planes
+
+    @staticmethod
+    def indentar(texto):
+        return '\n'.join('    ' + linea for linea in str(texto).splitlines())
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.usuarios import crear_usuarios_iniciales
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the default superusers (admin, felipe) that are missing. Idempotent; '
+        'servidor.py runs it on start. --reset also restores their passwords.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset password and flags of the existing ones')
+
+    def handle(self, *args, **options):
+        creados = crear_usuarios_iniciales(restablecer=options['reset'])
+        for username, creado in creados.items():
+            estado = 'creado' if creado else ('restablecido' if options['reset'] else 'ya existe')
+            self.stdout.write(f'{username}: {estado}')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importacion import CHUNK_SIZE, ImportadorMovimientos, leer_filas
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical movimientos (transactions and their items) from a .csv/.xlsx file in the '
+        'layout of /api/movimientos/export/?items=1, with one set-based recompute at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Path to the .csv or .xlsx file')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without writing')
+
+    def handle(self, *args, **options):
+        archivo = options['archivo']
+        if not archivo.lower().endswith(('.csv', '.xlsx')):
+            raise CommandError('El archivo debe ser .csv o .xlsx')
+
+        importador = ImportadorMovimientos(
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            progreso=self.progreso if options['verbosity'] > 0 else None,
+        )
+        try:
+            resumen = importador.importar(leer_filas(archivo, archivo))
+        except OSError as e:
+            raise CommandError(f'No se pudo leer {archivo}: {e}')
+
+        errores = resumen['errores']
+        for error in errores[:None if options['verbosity'] > 1 else 50]:
+            self.stderr.write(f"Fila {error['fila']}: {error['error']}")
+        if options['verbosity'] <= 1 and len(errores) > 50:
+            self.stderr.write(f'... {len(errores) - 50} errores más (-v 2 para verlos todos)')
+
+        self.stdout.write(
+            f"Filas leídas: {resumen['filas']}\n"
+            f"Transacciones: {resumen['transacciones']}\n"
+            f"Items: {resumen['items']}\n"
+            f"Transacciones omitidas: {resumen['omitidas']}\n"
+            f"Tiempo: {resumen['segundos']:.2f}s"
+        )
+        mensaje = f"{resumen['transacciones']} transacciones importadas"
+        if options['dry_run']:
+            mensaje += ' (dry-run, no se escribió nada)'
+        self.stdout.write(self.style.SUCCESS(mensaje))
+
+    def progreso(self, resumen):
+        self.stdout.write(
+            f"  {resumen['filas']} filas, {resumen['transacciones']} transacciones, "
+            f"{resumen['items']} items, {len(resumen['errores'])} errores"
+        )
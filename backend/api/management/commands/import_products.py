@@ -0,0 +1,217 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.importacion import leer_numero
+from api.models import Productos
+from api.busqueda import INDICE_PRODUCTOS
+from api.versiones import invalidar_tablas
+
+CAMPOS_ACTUALIZADOS = ['precio_venta_unitario', 'costo_unitario', 'cantidad_inicial']
+
+
+def limpiar_precio(val):
+    """Price cell to float: '$ 1.234,56', '1,234.56' and '1234,56' are accepted (see leer_numero)"""
+    if val is None or val == '':
+        return 0.0
+    if isinstance(val, (int, float)):
+        return float(val)
+    return float(leer_numero(val))
+
+
+def limpiar_entero(val):
+    if val is None or val == '':
+        return 0
+    if isinstance(val, (int, float)):
+        return int(val)
+    return int(float(str(val).replace(',', '.')))
+
+
+def construir_tipo_producto(nombre, largo, ancho):
+    """
+    'nombre largo ancho' without empty parts or repeated spaces. Like the old
+    script, falsy cells (0 included) are left out, so existing names match.
+    """
+    partes = (str(valor).strip() for valor in (nombre, largo, ancho) if valor)
+    return ' '.join(' '.join(partes).split())
+
+
+class Command(BaseCommand):
+    help = (
+        'Import the product price list (nombre, largo, ancho, precio venta, costo, cantidad inicial) '
+        'from an .xlsx sheet. Existing tipo_producto rows are updated, new ones inserted, in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Path to the .xlsx file')
+        parser.add_argument('--sheet', default='STOCK FELI', help='Sheet name (default: STOCK FELI)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Parse and report without writing')
+
+    def handle(self, *args, **options):
+        from openpyxl import load_workbook
+
+        inicio = time.perf_counter()
+        batch_size = max(1, options['batch_size'])
+        try:
+            libro = load_workbook(options['archivo'], read_only=True, data_only=True)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo abrir {options["archivo"]}: {e}')
+        if options['sheet'] not in libro.sheetnames:
+            libro.close()
+            raise CommandError(
+                f"Hoja '{options['sheet']}' no encontrada. Hojas disponibles: {', '.join(libro.sheetnames)}"
+            )
+
+        # tipo_producto -> ids, one query instead of one SELECT per row.
+        # The stored values let unchanged rows be skipped.
+        existentes = {}
+        self.actuales = {}
+        for pk, tipo_producto, *valores in Productos.objects.values_list(
+            'id', 'tipo_producto', *CAMPOS_ACTUALIZADOS
+        ).order_by('id'):
+            existentes.setdefault(tipo_producto, []).append(pk)
+            self.actuales[pk] = tuple(valores)
+
+        self.stats = {
+            'filas': 0, 'insertados': 0, 'actualizados': 0, 'sin_cambios': 0, 'repetidos': 0, 'errores': 0
+        }
+        self.errores = []
+        self.dry_run = options['dry_run']
+        vistos = set()
+        nuevos = {}  # tipo_producto -> Productos pending insert
+        cambios = {}  # tipo_producto -> values pending update
+        actualizados_ids = []
+
+        try:
+            with transaction.atomic():
+                filas = libro[options['sheet']].iter_rows(min_row=2, values_only=True)
+                for numero, fila in enumerate(filas, start=2):
+                    if not fila or all(valor is None for valor in fila):
+                        continue
+                    self.stats['filas'] += 1
+                    try:
+                        tipo_producto, valores = self.leer_fila(fila)
+                    except ValueError as e:
+                        self.registrar_error(numero, e, fila)
+                        continue
+
+                    if tipo_producto in vistos:
+                        # Repeated in the file: the last row wins, as with the old script
+                        self.stats['repetidos'] += 1
+                    vistos.add(tipo_producto)
+                    if tipo_producto in existentes:
+                        cambios[tipo_producto] = valores
+                    elif tipo_producto in nuevos:
+                        for campo, valor in valores.items():
+                            setattr(nuevos[tipo_producto], campo, valor)
+                        nuevos[tipo_producto].cantidad = valores['cantidad_inicial']
+                    else:
+                        nuevos[tipo_producto] = Productos(
+                            tipo_producto=tipo_producto, cantidad=valores['cantidad_inicial'], **valores
+                        )
+
+                    if len(nuevos) >= batch_size:
+                        self.insertar(nuevos, existentes)
+                    if len(cambios) >= batch_size:
+                        actualizados_ids += self.actualizar(cambios, existentes)
+
+                self.insertar(nuevos, existentes)
+                actualizados_ids += self.actualizar(cambios, existentes)
+                if actualizados_ids and not self.dry_run:
+                    # cantidad_inicial may have changed, so the stock of those products too
+                    Productos.recalcular_cantidades(ids=actualizados_ids)
+        finally:
+            libro.close()
+
+        self.resumen(time.perf_counter() - inicio, options['verbosity'])
+
+    def leer_fila(self, fila):
+        fila = tuple(fila) + (None,) * (6 - len(fila))
+        tipo_producto = construir_tipo_producto(*fila[:3])
+        if not tipo_producto:
+            raise ValueError('Nombre de producto vacío')
+        try:
+            valores = {
+                'precio_venta_unitario': limpiar_precio(fila[3]),
+                'costo_unitario': limpiar_precio(fila[4]),
+                'cantidad_inicial': limpiar_entero(fila[5]),
+            }
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'Valor numérico inválido ({e})')
+        return tipo_producto, valores
+
+    def registrar_error(self, numero, error, fila):
+        self.stats['errores'] += 1
+        self.errores.append((numero, str(error), fila))
+
+    def insertar(self, nuevos, existentes):
+        if not nuevos:
+            return
+        if not self.dry_run:
+            creados = Productos.objects.bulk_create(list(nuevos.values()))
+            invalidar_tablas(Productos._meta.db_table, INDICE_PRODUCTOS)
+            if any(producto.pk is None for producto in creados):
+                # MySQL does not return the ids of a multi-row INSERT
+                for pk, tipo_producto in Productos.objects.filter(
+                    tipo_producto__in=list(nuevos)
+                ).values_list('id', 'tipo_producto'):
+                    nuevos[tipo_producto].pk = pk
+        for tipo_producto, producto in nuevos.items():
+            # Later rows with the same tipo_producto become updates
+            existentes[tipo_producto] = [producto.pk]
+        self.stats['insertados'] += len(nuevos)
+        nuevos.clear()
+
+    def actualizar(self, cambios, existentes):
+        """
+        Every row of each tipo_producto (duplicates in the table included) whose
+        values changed, written as one multi-row INSERT ... ON CONFLICT/ON
+        DUPLICATE KEY UPDATE on the primary key per batch.
+        """
+        if not cambios:
+            return []
+        productos = []
+        for tipo_producto, valores in cambios.items():
+            nuevos_valores = tuple(valores[campo] for campo in CAMPOS_ACTUALIZADOS)
+            ids = [pk for pk in existentes[tipo_producto] if pk is not None]
+            cambiados = [pk for pk in ids if self.actuales.get(pk) != nuevos_valores]
+            if cambiados:
+                self.stats['actualizados'] += 1
+            elif ids:
+                self.stats['sin_cambios'] += 1
+            productos += [Productos(pk=pk, tipo_producto=tipo_producto, **valores) for pk in cambiados]
+        if productos and not self.dry_run:
+            Productos.objects.bulk_create(
+                productos,
+                update_conflicts=True,
+                update_fields=CAMPOS_ACTUALIZADOS,
+                # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+                unique_fields=['id'] if connection.features.supports_update_conflicts_with_target else None,
+            )
+            invalidar_tablas(Productos._meta.db_table)
+        cambios.clear()
+        return [producto.pk for producto in productos]
+
+    def resumen(self, segundos, verbosity):
+        for numero, error, fila in self.errores[:None if verbosity > 1 else 20]:
+            self.stderr.write(f'Fila {numero}: {error} {fila}')
+        if verbosity <= 1 and len(self.errores) > 20:
+            self.stderr.write(f'... {len(self.errores) - 20} errores más (-v 2 para verlos todos)')
+
+        stats = self.stats
+        validas = stats['insertados'] + stats['actualizados'] + stats['sin_cambios']
+        self.stdout.write(
+            f"Filas leídas: {stats['filas']}\n"
+            f"Productos insertados: {stats['insertados']}\n"
+            f"Productos actualizados: {stats['actualizados']}\n"
+            f"Sin cambios: {stats['sin_cambios']}\n"
+            f"Repetidos en el archivo: {stats['repetidos']}\n"
+            f"Errores: {stats['errores']}\n"
+            f"Tiempo: {segundos:.2f}s ({stats['filas'] / segundos if segundos else 0:.0f} filas/s)"
+        )
+        mensaje = f'{validas} productos importados'
+        if self.dry_run:
+            mensaje += ' (dry-run, no se escribió nada)'
+        self.stdout.write(self.style.SUCCESS(mensaje))
@@ -0,0 +1,61 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a server process imports before its first request (see servidor.cargar)
+CARGA = (
+    'import backend.wsgi\n'
+    'from django.urls import get_resolver\n'
+    'get_resolver().url_patterns\n'
+)
+LINEA = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| *(\S+)')
+
+
+def medir_importaciones(codigo=CARGA):
+    """[(module, self µs, cumulative µs)] from `python -X importtime` in a fresh process"""
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', codigo],
+        cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+    )
+    if proceso.returncode:
+        # The last line of the traceback, not the imports done while exiting
+        errores = [linea for linea in proceso.stderr.splitlines() if linea.strip() and not LINEA.match(linea)]
+        raise CommandError(errores[-1] if errores else f'El proceso terminó con código {proceso.returncode}')
+    return [
+        (modulo, int(propio), int(acumulado))
+        for propio, acumulado, modulo in LINEA.findall(proceso.stderr)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Import the app and the URLconf in a fresh `python -X importtime` process and report '
+        'the import cost per module and per top-level package (cold start of a server process).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help='Rows per table')
+        parser.add_argument('--module', help='Import this module instead of the app (e.g. api.views)')
+
+    def handle(self, *args, **options):
+        codigo = f"import django\ndjango.setup()\nimport {options['module']}\n" if options['module'] else CARGA
+        modulos = medir_importaciones(codigo)
+        total = sum(propio for _, propio, _ in modulos)
+
+        paquetes = defaultdict(int)
+        for modulo, propio, _ in modulos:
+            paquetes[modulo.split('.')[0]] += propio
+
+        self.stdout.write(f'{len(modulos)} módulos importados en {total / 1000:.0f} ms\n')
+        self.stdout.write(f"{'acumulado ms':>12} {'propio ms':>10}  módulo")
+        for modulo, propio, acumulado in sorted(modulos, key=lambda m: -m[2])[:options['limit']]:
+            self.stdout.write(f'{acumulado / 1000:12.1f} {propio / 1000:10.1f}  {modulo}')
+
+        self.stdout.write(f"\n{'propio ms':>12} {'%':>6}  paquete")
+        for paquete, propio in sorted(paquetes.items(), key=lambda p: -p[1])[:options['limit']]:
+            self.stdout.write(f'{propio / 1000:12.1f} {100 * propio / total:6.1f}  {paquete}')
@@ -0,0 +1,27 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from api.models import ResumenDiario
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the resumen_diario rollup (fecha, tipo, cuenta, producto) from '
+        'transaccion_items. The signals keep it up to date afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--desde', type=date.fromisoformat, help='Only rebuild from this fecha (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=date.fromisoformat, help='Only rebuild up to this fecha (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        filas = ResumenDiario.reconstruir(
+            batch_size=options['batch_size'], desde=options['desde'], hasta=options['hasta']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'resumen_diario reconstruido: {filas} filas en {time.perf_counter() - inicio:.2f}s'
+        ))
@@ -0,0 +1,127 @@
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('api.metrics')
+
+DEFAULT_REQUEST_METRICS = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'MAX_QUERIES': 50,
+    'SLOWEST_SQL': 3,
+    'HEADERS': True,
+}
+
+
+class _QueryTimer:
+    """execute_wrapper that counts and times every query of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.count += 1
+            self.total += duracion
+            self.queries.append((duracion, sql))
+
+    def slowest(self, n):
+        return sorted(self.queries, key=lambda q: q[0], reverse=True)[:n]
+
+
+class RequestMetricsMiddleware:
+    """
+    Records route name, wall time, query count and DB time of every request
+    without needing DEBUG=True. The numbers are returned in a Server-Timing
+    header, and requests over SLOW_REQUEST_MS or MAX_QUERIES are logged as one
+    JSON line (with the slowest SQL statements) on the 'api.metrics' logger.
+    A streamed body (the export) is measured while it is sent and logged
+    after its last chunk; its Server-Timing, sent first, leaves it out.
+
+    Enabled with REQUEST_METRICS = {'ENABLED': True, ...} in settings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = {**DEFAULT_REQUEST_METRICS, **getattr(settings, 'REQUEST_METRICS', {})}
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        inicio = time.perf_counter()
+        with self._midiendo(timer):
+            response = self.get_response(request)
+
+        if self.config['HEADERS']:
+            # Sent before a streamed body, so only the work up to here
+            response['Server-Timing'] = self._server_timing(inicio, timer)
+        if response.streaming and not getattr(response, 'is_async', False):
+            # The body (export batches) runs its queries while it is sent
+            response.streaming_content = self._cuerpo_medido(
+                iter(response.streaming_content), request, response, inicio, timer
+            )
+        else:
+            self._registrar(request, response, inicio, timer)
+        return response
+
+    @staticmethod
+    @contextmanager
+    def _midiendo(timer):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            yield
+
+    def _cuerpo_medido(self, partes, request, response, inicio, timer):
+        """The chunks of partes with their queries counted, logged once all are sent"""
+        try:
+            while True:
+                with self._midiendo(timer):
+                    parte = next(partes, None)
+                if parte is None:
+                    break
+                yield parte
+        finally:
+            self._registrar(request, response, inicio, timer)
+
+    @staticmethod
+    def _server_timing(inicio, timer):
+        total_ms = (time.perf_counter() - inicio) * 1000
+        db_ms = timer.total * 1000
+        return (
+            f'app;dur={total_ms - db_ms:.1f}, '
+            f'db;dur={db_ms:.1f};desc="{timer.count} queries", '
+            f'total;dur={total_ms:.1f}'
+        )
+
+    def _registrar(self, request, response, inicio, timer):
+        total_ms = (time.perf_counter() - inicio) * 1000
+        db_ms = timer.total * 1000
+        if total_ms >= self.config['SLOW_REQUEST_MS'] or timer.count > self.config['MAX_QUERIES']:
+            match = getattr(request, 'resolver_match', None)
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'route': match.view_name if match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'queries': timer.count,
+                'slowest_sql': [
+                    {'ms': round(duracion * 1000, 1), 'sql': sql}
+                    for duracion, sql in timer.slowest(self.config['SLOWEST_SQL'])
+                ],
+            }))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_apinote_authgroup_authgrouppermissions_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo', models.CharField(max_length=20)),
+                ('cuenta_id', models.IntegerField()),
+                ('producto_id', models.IntegerField(default=0)),
+                ('cantidad', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('bruto', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('descuento', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('lineas', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'resumen_diario',
+                'indexes': [models.Index(fields=['tipo', 'fecha'], name='idx_resumen_tipo_fecha')],
+                'unique_together': {('fecha', 'tipo', 'cuenta_id', 'producto_id')},
+            },
+        ),
+    ]
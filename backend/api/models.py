@@ -1,8 +1,25 @@
 from django.db import models
 from decimal import Decimal
-from django.db.models.signals import post_save, post_delete
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
+from contextlib import contextmanager
+import threading
+
+from .busqueda import registrar_cambios
+from .reportes import VENTAS_PRODUCTO
+from .versiones import invalidar_tablas
+
+
+# Signo con el que cada tipo afecta el balance de la cuenta: (total, valor de items)
+EFECTO_BALANCE = {
+    'factura_venta': (1, -1),
+    'factura_compra': (-1, 1),
+    'cobranza': (1, 0),
+    'pago': (-1, 0),
+}
 
 class ApiNote(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -98,65 +115,71 @@ class Cuentas(models.Model):
     
     def recalcular_monto(self):
         """
-        Recalculate the account balance based on all related transactions
-        Business Logic:
+        Recalculate the account balance based on all related transactions.
+        The signals keep monto up to date incrementally (see aplicar_deltas_monto);
+        this full rescan is only a repair path.
+        Business Logic (EFECTO_BALANCE):
         - factura_venta: +total, -items_value
-        - factura_compra: -total, +items_value  
+        - factura_compra: -total, +items_value
         - cobranza: +total
         - pago: -total
         - Other types don't affect balance
+        Summed in the database with one aggregate, as recalcular_montos does,
+        instead of a query per transaction.
         """
-        total_balance = Decimal('0.00')
-        
-        # Get all transactions for this account
-        transacciones = self.transacciones_set.all()
-        
-        for transaccion in transacciones:
-            transaction_total = transaccion.total or Decimal('0.00')
-            
-            if transaccion.tipo == 'factura_venta':
-                # Add total (money client owes)
-                total_balance += transaction_total
-                # Subtract items value (products delivered)
-                items_value = self._calculate_items_value(transaccion)
-                total_balance -= items_value
-                
-            elif transaccion.tipo == 'factura_compra':
-                # Subtract total (money you paid)
-                total_balance -= transaction_total
-                # Add items value (products received)
-                items_value = self._calculate_items_value(transaccion)
-                total_balance += items_value
-                
-            elif transaccion.tipo == 'cobranza':
-                # Add total (money received)
-                total_balance += transaction_total
-                
-            elif transaccion.tipo == 'pago':
-                # Subtract total (money paid)
-                total_balance -= transaction_total
-                
-            # jornal, aguinaldo, alquiler, impuestos, sueldo don't affect balance
-        
-        # Update the monto field
-        self.monto = float(total_balance)
+        balance = Transacciones.objects.filter(
+            cuenta_id=self.pk, tipo__in=EFECTO_BALANCE.keys()
+        ).aggregate(balance=models.Sum(_expresion_balance_transaccion()))['balance']
+        self.monto = float(Decimal(str(balance or 0)).quantize(Decimal('0.0001')))
         self.save(update_fields=['monto'])
-        
         return self.monto
-    
-    def _calculate_items_value(self, transaccion):
-        """Calculate total value of items in a transaction"""
-        items_value = Decimal('0.00')
-        
-        for item in transaccion.transaccionitems_set.all():
-            precio = item.precio_unitario or Decimal('0.00')
-            cantidad = item.cantidad or Decimal('0.00')
-            descuento = item.descuento_item or Decimal('0.00')
-            
-            item_total = (precio * cantidad) - descuento
-            items_value += item_total
-            
-        return items_value
+
+    @classmethod
+    def recalcular_montos(cls, ids=None):
+        """
+        Set-based version of recalcular_monto for many accounts at once:
+        one grouped aggregate over transacciones (items valued through a
+        correlated subquery) and one bulk UPDATE of the rows that changed.
+        Returns (updated_count, total_accounts).
+        """
+        cuentas = cls.objects.all()
+        transacciones = Transacciones.objects.filter(tipo__in=EFECTO_BALANCE.keys())
+        if ids is not None:
+            cuentas = cuentas.filter(pk__in=ids)
+            transacciones = transacciones.filter(cuenta_id__in=ids)
+
+        balances = {
+            row['cuenta_id']: row['balance']
+            for row in transacciones.values('cuenta_id').annotate(
+                balance=models.Sum(_expresion_balance_transaccion())
+            ).order_by()
+        }
+
+        cambiadas = []
+        total = 0
+        for cuenta in cuentas.only('id', 'monto'):
+            total += 1
+            nuevo = float(Decimal(str(balances.get(cuenta.id) or 0)).quantize(Decimal('0.0001')))
+            if cuenta.monto != nuevo:
+                cuenta.monto = nuevo
+                cambiadas.append(cuenta)
+        if cambiadas:
+            cls.objects.bulk_update(cambiadas, ['monto'], batch_size=500)
+            invalidar_tablas(cls._meta.db_table)
+        return len(cambiadas), total
+
+    @staticmethod
+    def aplicar_deltas_monto(deltas):
+        """
+        Apply {cuenta_id: delta} to monto with one UPDATE per account,
+        using F() so concurrent writers don't overwrite each other.
+        """
+        actualizadas = 0
+        for cuenta_id, delta in deltas.items():
+            if cuenta_id and delta:
+                actualizadas += Cuentas.objects.filter(pk=cuenta_id).update(monto=F('monto') + float(delta))
+        if actualizadas:
+            invalidar_tablas(Cuentas._meta.db_table)
 
 
 
@@ -247,6 +270,61 @@ class Productos(models.Model):
         super().save(update_fields=['cantidad'])
         return self.cantidad
 
+    @classmethod
+    def recalcular_cantidades(cls, ids=None):
+        """
+        Set-based version of recalcular_cantidad: compras/ventas of every
+        product in one grouped query, then one bulk UPDATE of the rows that
+        changed. ids limits the recompute to those products.
+        Returns (updated_count, total_products).
+        """
+        productos = cls.objects.all()
+        items = TransaccionItems.objects.filter(
+            producto_id__isnull=False,
+            transaccion__tipo__in=['factura_compra', 'factura_venta']
+        )
+        if ids is not None:
+            productos = productos.filter(pk__in=ids)
+            items = items.filter(producto_id__in=ids)
+
+        movimientos = {
+            row['producto_id']: row
+            for row in items.values('producto_id').annotate(
+                compras=models.Sum('cantidad', filter=models.Q(transaccion__tipo='factura_compra')),
+                ventas=models.Sum('cantidad', filter=models.Q(transaccion__tipo='factura_venta')),
+            ).order_by()
+        }
+
+        cambiados = []
+        total = 0
+        for producto in productos.only('id', 'cantidad', 'cantidad_inicial'):
+            total += 1
+            row = movimientos.get(producto.id, {})
+            cantidad_total = (
+                Decimal(producto.cantidad_inicial or 0)
+                + Decimal(row.get('compras') or 0)
+                - Decimal(row.get('ventas') or 0)
+            )
+            nueva = int(cantidad_total)
+            if producto.cantidad != nueva:
+                producto.cantidad = nueva
+                cambiados.append(producto)
+        if cambiados:
+            # Stock values repeat a lot (0, 1, ...): when they do, one
+            # UPDATE ... WHERE id IN (...) per value is much cheaper than
+            # bulk_update's per-row CASE
+            grupos = {}
+            for producto in cambiados:
+                grupos.setdefault(producto.cantidad, []).append(producto.pk)
+            if len(grupos) * 4 <= len(cambiados):
+                for cantidad, pks in grupos.items():
+                    for i in range(0, len(pks), 500):
+                        cls.objects.filter(pk__in=pks[i:i + 500]).update(cantidad=cantidad)
+            else:
+                cls.objects.bulk_update(cambiados, ['cantidad'], batch_size=500)
+            invalidar_tablas(cls._meta.db_table)
+        return len(cambiados), total
+
 
 class Saldo(models.Model):
     id = models.IntegerField(primary_key=True)
@@ -261,8 +339,10 @@ class Saldo(models.Model):
         # Siempre usar id=1
         self.id = 1
         super().save(*args, **kwargs)
-        # Eliminar cualquier otra fila (si existiera)
-        Saldo.objects.exclude(id=1).delete()
+        # Eliminar cualquier otra fila (si existiera). Un UPDATE de campos
+        # puntuales de la fila id=1 no puede haber creado otras.
+        if not kwargs.get('update_fields'):
+            Saldo.objects.exclude(id=1).delete()
 
     @classmethod
     def get_singleton(cls):
@@ -322,13 +402,106 @@ class Transacciones(models.Model):
             saldo_obj.save(update_fields=['saldo_actual'])
 
     @classmethod
-    def actualizar_todos_saldos_diferencia(cls):
+    def actualizar_saldos_diferencia(cls, ids=None):
+        """
+        Set-based actualizar_saldo_diferencia: one UPDATE sets
+        saldo_diferencia = saldo_inicial - total on every non-invoice
+        transaction in ids (all of them when ids is None), and saldo_actual
+        is written once, from the last one (ids order, or highest id).
+        """
         saldo_obj = Saldo.get_singleton()
-        for trans in cls.objects.exclude(tipo__in=['factura_venta', 'factura_compra']):
-            trans.saldo_diferencia = saldo_obj.saldo_inicial - float(trans.total)
-            trans.save(update_fields=['saldo_diferencia'])
-            saldo_obj.saldo_actual = trans.saldo_diferencia
-            saldo_obj.save(update_fields=['saldo_actual'])
+        transacciones = cls.objects.exclude(tipo__in=['factura_venta', 'factura_compra'])
+        if ids is not None:
+            transacciones = transacciones.filter(pk__in=ids)
+            totales = dict(transacciones.values_list('id', 'total'))
+            if not totales:
+                return 0
+            ultimo_total = totales[[pk for pk in ids if pk in totales][-1]]
+        else:
+            ultimo_total = transacciones.order_by('-id').values_list('total', flat=True).first()
+            if ultimo_total is None:
+                return 0
+        actualizadas = transacciones.update(saldo_diferencia=models.ExpressionWrapper(
+            models.Value(saldo_obj.saldo_inicial) - F('total'),
+            output_field=models.FloatField()
+        ))
+        invalidar_tablas(cls._meta.db_table)
+        saldo_obj.saldo_actual = saldo_obj.saldo_inicial - float(ultimo_total)
+        saldo_obj.save(update_fields=['saldo_actual'])
+        return actualizadas
+
+    @classmethod
+    def actualizar_todos_saldos_diferencia(cls):
+        return cls.actualizar_saldos_diferencia()
+
+    # Tipo de pago que cancela cada tipo de factura
+    TIPO_PAGO_FACTURA = {'factura_compra': 'pago', 'factura_venta': 'cobranza'}
+
+    @classmethod
+    def anotar_abonado(cls, queryset):
+        """
+        Annotate facturas with abonado (sum of the pagos/cobranzas with the same
+        cuenta and numero_comprobante) and pendiente = total - abonado, computed
+        in the database with one correlated subquery per factura.
+        """
+        decimal = models.DecimalField(max_digits=14, decimal_places=2)
+        tipo_pago = models.Case(
+            *[models.When(tipo=factura, then=models.Value(pago)) for factura, pago in cls.TIPO_PAGO_FACTURA.items()],
+            output_field=models.CharField()
+        )
+        pagos = cls.objects.filter(
+            cuenta_id=models.OuterRef('cuenta_id'),
+            numero_comprobante=models.OuterRef('numero_comprobante'),
+            tipo=models.OuterRef('tipo_pago'),
+        ).values('cuenta_id').annotate(suma=models.Sum('total')).values('suma')
+        return queryset.annotate(tipo_pago=tipo_pago).annotate(
+            abonado=Coalesce(models.Subquery(pagos, output_field=decimal), models.Value(Decimal('0.00')),
+                             output_field=decimal),
+        ).annotate(
+            pendiente=models.ExpressionWrapper(F('total') - F('abonado'), output_field=decimal),
+        )
+
+    @classmethod
+    def actualizar_estados_pago(cls, cuenta_ids=None, lote=500):
+        """
+        Set-based actualizar_estado_pago for every factura (of cuenta_ids),
+        `lote` cuentas at a time: the pagos/cobranzas of the batch are summed
+        with one grouped query per (cuenta, numero_comprobante, tipo) instead
+        of a correlated subquery per factura, and the rows whose estado
+        changes are written with one UPDATE per estado.
+        Returns the number of facturas updated.
+        """
+        facturas = cls.objects.filter(tipo__in=list(cls.TIPO_PAGO_FACTURA))
+        if cuenta_ids is None:
+            cuenta_ids = facturas.values_list('cuenta_id', flat=True).distinct().order_by()
+        cuenta_ids = sorted(set(cuenta_ids))
+        cambios = {}
+        for i in range(0, len(cuenta_ids), lote):
+            cuentas = cuenta_ids[i:i + lote]
+            abonado = {
+                (fila['cuenta_id'], fila['numero_comprobante'], fila['tipo']): fila['suma']
+                for fila in cls.objects.filter(
+                    cuenta_id__in=cuentas,
+                    tipo__in=list(cls.TIPO_PAGO_FACTURA.values()),
+                    numero_comprobante__isnull=False,
+                ).values('cuenta_id', 'numero_comprobante', 'tipo').annotate(suma=models.Sum('total')).order_by()
+            }
+            for fila in facturas.filter(cuenta_id__in=cuentas).values(
+                'id', 'tipo', 'estado', 'total', 'cuenta_id', 'numero_comprobante'
+            ).order_by():
+                suma = abonado.get((fila['cuenta_id'], fila['numero_comprobante'], cls.TIPO_PAGO_FACTURA[fila['tipo']]))
+                if float(suma or 0) >= float(fila['total']):
+                    estado = 'pagado' if fila['tipo'] == 'factura_compra' else 'cobrado'
+                else:
+                    estado = 'pendiente'
+                if estado != fila['estado']:
+                    cambios.setdefault(estado, []).append(fila['id'])
+        for estado, ids in cambios.items():
+            for i in range(0, len(ids), 500):
+                cls.objects.filter(pk__in=ids[i:i + 500]).update(estado=estado)
+        if cambios:
+            invalidar_tablas(cls._meta.db_table)
+        return sum(len(ids) for ids in cambios.values())
 
     def actualizar_estado_pago(self):
         """
@@ -336,14 +509,13 @@ class Transacciones(models.Model):
         """
         if self.tipo not in ['factura_venta', 'factura_compra']:
             return
-        # Buscar todos los pagos/cobranza asociados a este comprobante y cuenta
-        pagos = Transacciones.objects.filter(
-            cuenta=self.cuenta,
+        # Sumar en la base todos los pagos/cobranza asociados a este comprobante y cuenta
+        total_abonado = Transacciones.objects.filter(
+            cuenta_id=self.cuenta_id,
             numero_comprobante=self.numero_comprobante,
-            tipo='pago' if self.tipo == 'factura_compra' else 'cobranza'
-        )
-        total_abonado = sum([float(p.total) for p in pagos])
-        if total_abonado >= float(self.total):
+            tipo=self.TIPO_PAGO_FACTURA[self.tipo]
+        ).aggregate(total=models.Sum('total'))['total'] or 0
+        if float(total_abonado) >= float(self.total):
             self.estado = 'pagado' if self.tipo == 'factura_compra' else 'cobrado'
         else:
             self.estado = 'pendiente'
@@ -372,69 +544,615 @@ class TransaccionItems(models.Model):
         managed = False
         db_table = 'transaccion_items'
 
+    @classmethod
+    def crear_en_lote(cls, transaccion, items):
+        """
+        Insert the items of one transaction with a single bulk_create.
+        bulk_create skips post_save, so the balance delta and the stock
+        recompute of all the items are recorded here in one go.
+        """
+        items = cls.objects.bulk_create(items, batch_size=500)
+        if not items:
+            return items
+        filas = [
+            {
+                'producto_id': i.producto_id,
+                'precio_unitario': i.precio_unitario,
+                'cantidad': i.cantidad,
+                'descuento_item': i.descuento_item,
+            }
+            for i in items
+        ]
+        with recalculos_pendientes() as pendientes:
+            pendientes.invalidar(cls._meta.db_table)
+            pendientes.sumar_items(_datos_transaccion(transaccion), filas, 1)
+        return items
+
+    @classmethod
+    def eliminar_en_lote(cls, transaccion):
+        """
+        Delete every item of one transaction, recording the balance delta and
+        the stock recompute once instead of running the per-row handlers.
+        """
+        items = cls.objects.filter(transaccion_id=transaccion.pk)
+        with recalculos_pendientes() as pendientes:
+            pendientes.invalidar(cls._meta.db_table)
+            pendientes.sumar_items(_datos_transaccion(transaccion), _items_transaccion(transaccion.pk), -1)
+            # One DELETE, not the collector's SELECT plus one per 100 rows
+            borrar_filas(items)
+
+
+class ResumenDiario(models.Model):
+    """
+    Rollup of transaction items per (fecha, tipo, cuenta, producto), kept up to
+    date by the signal handlers below and rebuilt with `manage.py rebuild_rollup`.
+    Unlike the other api tables it is managed by Django (migration 0003).
+    producto_id = 0 groups the items without a product.
+    """
+    fecha = models.DateField()
+    tipo = models.CharField(max_length=20)
+    cuenta_id = models.IntegerField()
+    producto_id = models.IntegerField(default=0)
+    cantidad = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    bruto = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    descuento = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    lineas = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'resumen_diario'
+        unique_together = (('fecha', 'tipo', 'cuenta_id', 'producto_id'),)
+        indexes = [
+            models.Index(fields=['tipo', 'fecha'], name='idx_resumen_tipo_fecha'),
+        ]
+
+    # Keys per locking SELECT: each filters 4 IN lists (SQLite allows 999 parameters)
+    CLAVES_POR_CONSULTA = 200
+
+    @classmethod
+    def aplicar_deltas(cls, deltas):
+        """
+        Add {(fecha, tipo, cuenta_id, producto_id): [cantidad, bruto, descuento, lineas]}
+        to the rollup: locking SELECTs of the affected keys, then one
+        bulk_update, one bulk_create and one DELETE of rows left empty.
+        """
+        deltas = {clave: valores for clave, valores in deltas.items() if any(valores)}
+        if not deltas:
+            return
+        for intento in range(3):
+            try:
+                return cls._aplicar_deltas(deltas)
+            except IntegrityError:
+                # Another process inserted one of the new keys first (the
+                # locking SELECT can't lock rows that don't exist yet): the
+                # retry finds and locks it
+                if intento == 2:
+                    raise
+
+    @classmethod
+    def _aplicar_deltas(cls, deltas):
+        claves = list(deltas)
+        with transaction.atomic():
+            existentes = {}
+            for inicio in range(0, len(claves), cls.CLAVES_POR_CONSULTA):
+                lote = claves[inicio:inicio + cls.CLAVES_POR_CONSULTA]
+                # IN lists instead of one OR term per key (SQLite's expression
+                # depth limit); rows of other key combinations are ignored
+                for fila in cls.objects.select_for_update().filter(
+                    fecha__in={c[0] for c in lote}, tipo__in={c[1] for c in lote},
+                    cuenta_id__in={c[2] for c in lote}, producto_id__in={c[3] for c in lote},
+                ):
+                    clave = (fila.fecha, fila.tipo, fila.cuenta_id, fila.producto_id)
+                    if clave in deltas:
+                        existentes[clave] = fila
+            nuevas, cambiadas, vacias = [], [], []
+            for clave, (cantidad, bruto, descuento, lineas) in deltas.items():
+                fila = existentes.get(clave)
+                if fila is None:
+                    fila = cls(fecha=clave[0], tipo=clave[1], cuenta_id=clave[2], producto_id=clave[3])
+                    nuevas.append(fila)
+                elif fila.lineas + lineas <= 0:
+                    vacias.append(fila.pk)
+                    continue
+                else:
+                    cambiadas.append(fila)
+                fila.cantidad += cantidad
+                fila.bruto += bruto
+                fila.descuento += descuento
+                fila.lineas += lineas
+            if cambiadas:
+                cls.objects.bulk_update(cambiadas, ['cantidad', 'bruto', 'descuento', 'lineas'], batch_size=500)
+            if nuevas:
+                cls.objects.bulk_create(nuevas, batch_size=500)
+            if vacias:
+                borrar_filas(cls.objects.filter(pk__in=vacias))
+
+    @classmethod
+    def reconstruir(cls, batch_size=5000, desde=None, hasta=None):
+        """
+        Rebuild the rollup from transaccion_items with one grouped query,
+        only for fechas between desde and hasta when given. The rows go in
+        as plain tuples (insertar_filas): there can be almost one per item.
+        """
+        items = TransaccionItems.objects.all()
+        existentes = cls.objects.all()
+        if desde is not None:
+            items = items.filter(transaccion__fecha__gte=desde)
+            existentes = existentes.filter(fecha__gte=desde)
+        if hasta is not None:
+            items = items.filter(transaccion__fecha__lte=hasta)
+            existentes = existentes.filter(fecha__lte=hasta)
+        filas = (
+            items
+            .values('transaccion__fecha', 'transaccion__tipo', 'transaccion__cuenta_id')
+            .annotate(
+                producto=Coalesce('producto_id', models.Value(0)),
+                suma_cantidad=models.Sum('cantidad'),
+                suma_bruto=models.Sum(
+                    F('precio_unitario') * F('cantidad'),
+                    output_field=models.DecimalField(max_digits=24, decimal_places=4)
+                ),
+                suma_descuento=models.Sum('descuento_item'),
+                suma_lineas=models.Count('id'),
+            )
+            .order_by()
+        )
+        columnas = ['fecha', 'tipo', 'cuenta_id', 'producto_id', 'cantidad', 'bruto', 'descuento', 'lineas']
+        total = 0
+        with transaction.atomic():
+            # Without the collector: the post_delete receivers would load every
+            # row and delete them 100 at a time (the version is bumped below)
+            borrar_filas(existentes)
+            lote = []
+            for fila in filas.iterator(chunk_size=batch_size):
+                lote.append((
+                    fila['transaccion__fecha'],
+                    fila['transaccion__tipo'],
+                    fila['transaccion__cuenta_id'],
+                    fila['producto'],
+                    _decimal(fila['suma_cantidad']),
+                    Decimal(str(fila['suma_bruto'] or 0)).quantize(Decimal('0.0001')),
+                    _decimal(fila['suma_descuento']),
+                    fila['suma_lineas'],
+                ))
+                if len(lote) >= batch_size:
+                    insertar_filas(cls, columnas, lote)
+                    total += len(lote)
+                    lote = []
+            if lote:
+                insertar_filas(cls, columnas, lote)
+                total += len(lote)
+        invalidar_tablas(cls._meta.db_table)
+        return total
+
+
+def insertar_filas(modelo, columnas, filas):
+    """
+    One executemany INSERT of value tuples, in the order of the `columnas`
+    field names. Far cheaper than bulk_create for millions of rows; no
+    signals, no returned ids and no field conversion beyond the driver's
+    (Decimal, date and str values are fine).
+    """
+    if not filas:
+        return
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(modelo._meta.db_table),
+        ', '.join(connection.ops.quote_name(modelo._meta.get_field(c).column) for c in columnas),
+        ', '.join(['%s'] * len(columnas)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, filas)
+
+
+def crear_con_ids(objetos, lote=500):
+    """
+    bulk_create of unsaved instances of one model that always leaves their
+    ids set, for rows that others point to (items of new transacciones).
+    PostgreSQL, SQLite and MariaDB return them. MySQL doesn't: each batch is
+    then one multi-row INSERT ... VALUES, whose ids InnoDB hands out
+    consecutively from LAST_INSERT_ID(), auto_increment_increment apart.
+    That holds with innodb_autoinc_lock_mode 0 or 1, and with 2 (the MySQL 8
+    default) as long as no INSERT ... SELECT or LOAD DATA writes the same
+    table concurrently, which this app never does.
+    """
+    if not objetos:
+        return objetos
+    modelo = type(objetos[0])
+    if connection.features.can_return_rows_from_bulk_insert:
+        return modelo.objects.bulk_create(objetos, batch_size=lote)
+    for i in range(0, len(objetos), lote):
+        grupo = objetos[i:i + lote]
+        modelo.objects.bulk_create(grupo)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT LAST_INSERT_ID(), @@auto_increment_increment')
+            primero, paso = cursor.fetchone()
+        for n, objeto in enumerate(grupo):
+            objeto.pk = primero + n * paso
+    return objetos
+
+
+def borrar_filas(queryset):
+    """
+    One DELETE of the rows matched by queryset, without the deletion
+    collector: no SELECT first, no batches of 100, no pre/post_delete
+    signals and no cascades, so the caller records what the handlers would.
+    QuerySet._raw_delete is internal to Django (the collector's own fast
+    path, as of 5.2), not public API: this is the one place to check on
+    upgrades.
+    Returns the number of rows deleted.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+def _decimal(valor):
+    """Value as stored by the 2-decimal item columns (floats/ints come from the carrito flow)"""
+    if isinstance(valor, Decimal):
+        return valor
+    return Decimal(str(valor or 0)).quantize(Decimal('0.01'))
+
+
+def _valor_item(precio, cantidad, descuento):
+    """(precio * cantidad) - descuento, treating missing values as 0"""
+    return (_decimal(precio) * _decimal(cantidad)) - _decimal(descuento)
+
+
+CAMPOS_ITEM = ('producto_id', 'precio_unitario', 'cantidad', 'descuento_item')
+
+
+def _items_transaccion(transaccion_id):
+    """Item rows of one transaction (only the columns the recomputes need)"""
+    return list(TransaccionItems.objects.filter(transaccion_id=transaccion_id).values(*CAMPOS_ITEM))
+
+
+def _datos_transaccion(transaccion):
+    return {
+        'id': transaccion.pk,
+        'fecha': transaccion.fecha,
+        'tipo': transaccion.tipo,
+        'cuenta_id': transaccion.cuenta_id,
+    }
+
+
+def _expresion_balance_transaccion():
+    """
+    SQL expression with the contribution of one transaction row to its account
+    balance, following EFECTO_BALANCE (items valued with a correlated subquery).
+    """
+    decimal = models.DecimalField(max_digits=24, decimal_places=4)
+    valor_items = Coalesce(
+        models.Subquery(
+            TransaccionItems.objects.filter(transaccion_id=models.OuterRef('pk'))
+            .values('transaccion_id')
+            .annotate(valor=models.Sum(
+                F('precio_unitario') * F('cantidad') - F('descuento_item'),
+                output_field=decimal
+            ))
+            .values('valor'),
+            output_field=decimal
+        ),
+        models.Value(Decimal('0.00')),
+        output_field=decimal
+    )
+    casos = []
+    for tipo, (signo_total, signo_items) in EFECTO_BALANCE.items():
+        expresion = models.ExpressionWrapper(F('total') * signo_total, output_field=decimal)
+        if signo_items:
+            expresion = models.ExpressionWrapper(expresion + valor_items * signo_items, output_field=decimal)
+        casos.append(models.When(tipo=tipo, then=expresion))
+    return models.Case(*casos, default=models.Value(Decimal('0.00')), output_field=decimal)
+
+
+class RecalculosPendientes:
+    """
+    Balance deltas, products, rollup deltas and saldo_diferencia rows touched
+    by the signal handlers. Inside an atomic block they are collected and
+    applied once on commit, so an invoice with N items costs one UPDATE per
+    account and one stock recompute instead of N of each.
+    """
+
+    def __init__(self):
+        self.montos = {}
+        self.productos = set()
+        self.saldos = {}  # transaccion_id -> None, keeps the save order
+        self.resumen = {}  # (fecha, tipo, cuenta_id, producto_id) -> [cantidad, bruto, descuento, lineas]
+        self.tablas = set()
+        self.indice = set()  # products whose search index entries changed
+        self.saldo_inicial = None
+        self.aplicar_al_confirmar = None
+
+    def sumar_monto(self, cuenta_id, valor):
+        if cuenta_id and valor:
+            self.montos[cuenta_id] = self.montos.get(cuenta_id, Decimal('0.00')) + valor
+
+    def marcar_productos(self, *ids):
+        self.productos.update(pk for pk in ids if pk)
+
+    def sumar_items(self, transaccion, items, signo):
+        """
+        Add (signo=1) or remove (signo=-1) the contribution of item rows that
+        belong to `transaccion` (dict with fecha, tipo and cuenta_id) to the
+        account balance, the product stock and the daily rollup.
+        """
+        if not items or not transaccion:
+            return
+        if transaccion['tipo'] == 'factura_venta':
+            self.invalidar(VENTAS_PRODUCTO)
+        signo_items = EFECTO_BALANCE.get(transaccion['tipo'], (0, 0))[1]
+        fecha = Transacciones._meta.get_field('fecha').to_python(transaccion['fecha'])
+        valor_total = Decimal('0.00')
+        for item in items:
+            cantidad = _decimal(item['cantidad'])
+            precio = _decimal(item['precio_unitario'])
+            descuento = _decimal(item['descuento_item'])
+            valor_total += _valor_item(precio, cantidad, descuento)
+            self.marcar_productos(item['producto_id'])
+            clave = (fecha, transaccion['tipo'], transaccion['cuenta_id'], item['producto_id'] or 0)
+            acumulado = self.resumen.setdefault(clave, [Decimal('0.00'), Decimal('0.0000'), Decimal('0.00'), 0])
+            acumulado[0] += signo * cantidad
+            acumulado[1] += signo * precio * cantidad
+            acumulado[2] += signo * descuento
+            acumulado[3] += signo
+        self.sumar_monto(transaccion['cuenta_id'], signo * signo_items * valor_total)
+        self.invalidar(ResumenDiario._meta.db_table)
+
+    def invalidar(self, tabla):
+        """Table whose ETag version is bumped when this batch is applied"""
+        self.tablas.add(tabla)
+
+    def marcar_saldo(self, transaccion):
+        self.saldos.pop(transaccion.pk, None)
+        self.saldos[transaccion.pk] = None
+        # Keep the in-memory instance consistent for the API response
+        if self.saldo_inicial is None:
+            self.saldo_inicial = Saldo.get_singleton().saldo_inicial
+        transaccion.saldo_diferencia = self.saldo_inicial - float(transaccion.total)
+
+    def aplicar(self):
+        Cuentas.aplicar_deltas_monto(self.montos)
+        if self.productos:
+            Productos.recalcular_cantidades(ids=self.productos)
+        if self.saldos:
+            Transacciones.actualizar_saldos_diferencia(list(self.saldos))
+        ResumenDiario.aplicar_deltas(self.resumen)
+        invalidar_tablas(*self.tablas)
+        registrar_cambios(self.indice)
+
+
+@contextmanager
+def recalculos_pendientes():
+    """
+    Yield the RecalculosPendientes of the current atomic block, registering it
+    with transaction.on_commit the first time. Outside atomic blocks the
+    changes are applied right away. One instance is kept per savepoint level,
+    so work recorded inside a rolled back savepoint is discarded with it.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        pendientes = RecalculosPendientes()
+        yield pendientes
+        pendientes.aplicar()
+        return
+
+    por_nivel = connection.__dict__.setdefault('_recalculos_pendientes', {})
+    nivel = tuple(connection.savepoint_ids)
+    pendientes = por_nivel.get(nivel)
+    if pendientes is None or not any(
+        hook[1] is pendientes.aplicar_al_confirmar for hook in connection.run_on_commit
+    ):
+        pendientes = RecalculosPendientes()
+        por_nivel[nivel] = pendientes
+
+        def aplicar():
+            if por_nivel.get(nivel) is pendientes:
+                del por_nivel[nivel]
+            pendientes.aplicar()
+
+        pendientes.aplicar_al_confirmar = aplicar
+        transaction.on_commit(aplicar)
+    yield pendientes
+
+
+_suspension = threading.local()
+
+
+@contextmanager
+def recalculos_suspendidos():
+    """
+    Skip the balance/stock/saldo signal handlers in this thread. The caller
+    is responsible for recomputing what it changed (bulk paths, imports).
+    """
+    previo = getattr(_suspension, 'activa', False)
+    _suspension.activa = True
+    try:
+        yield
+    finally:
+        _suspension.activa = previo
+
+
+def _recalculos_activos():
+    return not getattr(_suspension, 'activa', False)
+
+
+def recalcular_movimientos(cuenta_ids, producto_ids, fechas):
+    """
+    Set-based recompute after writes made with recalculos_suspendidos():
+    balances of cuenta_ids, stock of producto_ids, estado of their facturas
+    and the rollup between the first and last of fechas. saldo_diferencia is
+    left to the caller (Transacciones.actualizar_saldos_diferencia).
+    """
+    cuenta_ids = sorted(pk for pk in cuenta_ids if pk)
+    if cuenta_ids:
+        Cuentas.recalcular_montos(ids=cuenta_ids)
+        Transacciones.actualizar_estados_pago(cuenta_ids=cuenta_ids)
+    producto_ids = sorted(pk for pk in producto_ids if pk)
+    if producto_ids:
+        Productos.recalcular_cantidades(ids=producto_ids)
+    fechas = [Transacciones._meta.get_field('fecha').to_python(fecha) for fecha in fechas if fecha]
+    if fechas:
+        ResumenDiario.reconstruir(desde=min(fechas), hasta=max(fechas))
+    invalidar_tablas(Transacciones._meta.db_table, TransaccionItems._meta.db_table, VENTAS_PRODUCTO)
+
+
+CAMPOS_RECALCULO_TRANSACCION = {'tipo', 'fecha', 'total', 'cuenta', 'cuenta_id'}
+CAMPOS_RECALCULO_ITEM = {
+    'transaccion', 'transaccion_id', 'producto', 'producto_id', 'nombre_producto',
+    'precio_unitario', 'cantidad', 'descuento_item'
+}
+
+
+@receiver(pre_save, sender=Transacciones)
+def guardar_valores_previos_transaccion(sender, instance, update_fields=None, **kwargs):
+    """Remember the stored cuenta/tipo/fecha/total so post_save can apply only the difference"""
+    if not _recalculos_activos():
+        return
+    instance._valores_previos = None
+    if update_fields is not None and not CAMPOS_RECALCULO_TRANSACCION & set(update_fields):
+        # e.g. saves of saldo_diferencia or estado: balance and stock are not affected
+        instance._recalculo_pendiente = False
+        return
+    instance._recalculo_pendiente = True
+    if instance.pk is not None and not instance._state.adding:
+        instance._valores_previos = Transacciones.objects.filter(pk=instance.pk).values(
+            'id', 'cuenta_id', 'tipo', 'fecha', 'total'
+        ).first()
+
 
 @receiver(post_save, sender=Transacciones)
 def actualizar_balance_transaccion_save(sender, instance, created, **kwargs):
-    """Update account balance when a transaction is created or updated"""
-    if instance.cuenta_id:
-        with transaction.atomic():
-            instance.cuenta.recalcular_monto()
+    """Record the balance delta (and stock/rollup changes) of a created or updated transaction"""
+    if not _recalculos_activos() or not getattr(instance, '_recalculo_pendiente', True):
+        return
+    previo = getattr(instance, '_valores_previos', None)
+    instance._valores_previos = None
+
+    with recalculos_pendientes() as pendientes:
+        if 'factura_venta' in (instance.tipo, previo and previo['tipo']):
+            pendientes.invalidar(VENTAS_PRODUCTO)
+        signo_total, signo_items = EFECTO_BALANCE.get(instance.tipo, (0, 0))
+        pendientes.sumar_monto(instance.cuenta_id, signo_total * Decimal(instance.total or 0))
+        if previo is None:
+            return
+
+        signo_total_previo = EFECTO_BALANCE.get(previo['tipo'], (0, 0))[0]
+        pendientes.sumar_monto(previo['cuenta_id'], -signo_total_previo * Decimal(previo['total'] or 0))
+        # The items only move (balance, stock, rollup) when the key they hang from changes
+        actual = _datos_transaccion(instance)
+        actual['fecha'] = Transacciones._meta.get_field('fecha').to_python(actual['fecha'])
+        if any(previo[campo] != actual[campo] for campo in ('fecha', 'tipo', 'cuenta_id')):
+            items = _items_transaccion(instance.pk)
+            pendientes.sumar_items(previo, items, -1)
+            pendientes.sumar_items(actual, items, 1)
+
+
+@receiver(pre_delete, sender=Transacciones)
+def guardar_items_transaccion_delete(sender, instance, **kwargs):
+    """Items may be removed by the database along with the transaction, value them first"""
+    if not _recalculos_activos():
+        return
+    instance._items_previos = _items_transaccion(instance.pk)
 
 
 @receiver(post_delete, sender=Transacciones)
 def actualizar_balance_transaccion_delete(sender, instance, **kwargs):
-    """Update account balance when a transaction is deleted"""
-    if instance.cuenta_id:
-        try:
-            with transaction.atomic():
-                instance.cuenta.recalcular_monto()
-        except Cuentas.DoesNotExist:
-            # Account was also deleted, nothing to update
-            pass
+    """Remove the contribution of a deleted transaction from its account"""
+    if not _recalculos_activos():
+        return
+    signo_total = EFECTO_BALANCE.get(instance.tipo, (0, 0))[0]
+    with recalculos_pendientes() as pendientes:
+        if instance.tipo == 'factura_venta':
+            pendientes.invalidar(VENTAS_PRODUCTO)
+        pendientes.sumar_monto(instance.cuenta_id, -signo_total * Decimal(instance.total or 0))
+        pendientes.sumar_items(_datos_transaccion(instance), getattr(instance, '_items_previos', []), -1)
+
+
+@receiver(pre_save, sender=TransaccionItems)
+def guardar_valores_previos_item(sender, instance, update_fields=None, **kwargs):
+    """Remember the stored item values so post_save can apply only the difference"""
+    if not _recalculos_activos():
+        return
+    instance._valores_previos = None
+    if update_fields is not None and not CAMPOS_RECALCULO_ITEM & set(update_fields):
+        instance._recalculo_pendiente = False
+        return
+    instance._recalculo_pendiente = True
+    if instance.pk is not None and not instance._state.adding:
+        instance._valores_previos = TransaccionItems.objects.filter(pk=instance.pk).values(
+            'transaccion_id', *CAMPOS_ITEM
+        ).first()
 
 
 @receiver(post_save, sender=TransaccionItems)
 def actualizar_balance_item_save(sender, instance, created, **kwargs):
-    """Update account balance when transaction items are created or updated"""
-    if instance.transaccion and instance.transaccion.cuenta_id:
-        with transaction.atomic():
-            instance.transaccion.cuenta.recalcular_monto()
+    """Record the balance, stock and rollup changes of a created or updated item"""
+    if not _recalculos_activos() or not getattr(instance, '_recalculo_pendiente', True):
+        return
+    previo = getattr(instance, '_valores_previos', None)
+    instance._valores_previos = None
+    transacciones = {}
+    if TransaccionItems._meta.get_field('transaccion').is_cached(instance):
+        # Usual create path: the parent is already in memory
+        transacciones[instance.transaccion_id] = _datos_transaccion(instance.transaccion)
+    ids = {instance.transaccion_id}
+    if previo is not None:
+        ids.add(previo['transaccion_id'])
+    ids -= transacciones.keys()
+    if ids:
+        transacciones.update(
+            (t['id'], t) for t in Transacciones.objects.filter(pk__in=ids).values('id', 'fecha', 'tipo', 'cuenta_id')
+        )
+
+    with recalculos_pendientes() as pendientes:
+        pendientes.marcar_productos(instance.producto_id)
+        if previo is not None:
+            pendientes.marcar_productos(previo['producto_id'])
+            pendientes.sumar_items(transacciones.get(previo['transaccion_id']), [previo], -1)
+        pendientes.sumar_items(
+            transacciones.get(instance.transaccion_id),
+            [{campo: getattr(instance, campo) for campo in CAMPOS_ITEM}],
+            1
+        )
 
 
 @receiver(post_delete, sender=TransaccionItems)
 def actualizar_balance_item_delete(sender, instance, **kwargs):
-    """Update account balance when transaction items are deleted"""
-    if instance.transaccion and instance.transaccion.cuenta_id:
-        try:
-            with transaction.atomic():
-                instance.transaccion.cuenta.recalcular_monto()
-        except (Cuentas.DoesNotExist, Transacciones.DoesNotExist):
-            # Parent objects were deleted, nothing to update
-            pass
-
-# Optionally, update product quantity when items are saved or deleted
-@receiver(post_save, sender=TransaccionItems)
-def actualizar_cantidad_producto_save(sender, instance, created, **kwargs):
-    """Update product quantity when transaction items are created or updated"""
-    if instance.producto_id:
-        instance.producto.recalcular_cantidad()
-
-@receiver(post_delete, sender=TransaccionItems)
-def actualizar_cantidad_producto_delete(sender, instance, **kwargs):
-    """Update product quantity when transaction items are deleted"""
-    if instance.producto_id:
-        instance.producto.recalcular_cantidad()
+    """Record the balance, stock and rollup changes of a deleted item"""
+    if not _recalculos_activos():
+        return
+    with recalculos_pendientes() as pendientes:
+        pendientes.marcar_productos(instance.producto_id)
+        transaccion = Transacciones.objects.filter(pk=instance.transaccion_id).values(
+            'id', 'fecha', 'tipo', 'cuenta_id'
+        ).first()
+        # Without parent the transaction delete handler already accounted for the item
+        pendientes.sumar_items(transaccion, [{campo: getattr(instance, campo) for campo in CAMPOS_ITEM}], -1)
 
 
 @receiver(post_save, sender=Transacciones)
 def calcular_saldo_diferencia_post_save(sender, instance, created, **kwargs):
     """
-    Ensure saldo_diferencia is calculated and updated on every save.
-    Avoid infinite recursion by skipping signal when saving from actualizar_saldo_diferencia.
+    Ensure saldo_diferencia is calculated on every save. The row and the Saldo
+    singleton are written once per atomic block by RecalculosPendientes.
     """
-    # Only call if not already updating from signal
-    if not getattr(instance, '_skip_signal', False):
-        # Set a flag to avoid recursion
-        instance._skip_signal = True
-        instance.actualizar_saldo_diferencia(skip_signal=True)
-        instance._skip_signal = False
\ No newline at end of file
+    if not _recalculos_activos():
+        return
+    if instance.tipo not in ['factura_venta', 'factura_compra']:
+        with recalculos_pendientes() as pendientes:
+            pendientes.marcar_saldo(instance)
+
+
+@receiver(post_save, sender=Productos)
+@receiver(post_delete, sender=Productos)
+def actualizar_indice_productos(sender, instance, update_fields=None, **kwargs):
+    """The search index (api/busqueda.py) only depends on the ids and tipo_producto"""
+    if update_fields is not None and 'tipo_producto' not in update_fields:
+        return
+    with recalculos_pendientes() as pendientes:
+        pendientes.indice.add(instance.pk)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidar_version_tabla(sender, **kwargs):
+    """Bump the ETag version of any api table written through the ORM (once per atomic block)"""
+    if sender._meta.app_label == 'api':
+        with recalculos_pendientes() as pendientes:
+            pendientes.invalidar(sender._meta.db_table)
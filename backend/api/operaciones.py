@@ -0,0 +1,207 @@
+"""
+Bulk create/update/delete of movimientos (POST /api/movimientos/bulk/).
+
+    {"operations": [
+        {"op": "create", "data": {"tipo": "cobranza", "fecha": "2025-03-01", "cuenta": 3, "total": "1500.00", ...}},
+        {"op": "update", "id": 41, "data": {"total": "990.00"}},
+        {"op": "delete", "id": 42}
+    ]}
+
+Every operation is validated first (comprobante uniqueness with one query
+for the whole batch). If any fails nothing is written and the errors are
+returned per operation; otherwise everything is applied in one transaction
+with bulk writes, the signal handlers suspended and one set-based recompute
+of the affected cuentas, productos, fechas and saldos.
+"""
+from django.db import transaction
+
+from .models import (Cuentas, Productos, TransaccionItems, Transacciones, borrar_filas,
+                     crear_con_ids, recalcular_movimientos, recalculos_suspendidos)
+from .serializers import BulkTransaccionSerializer
+
+OPERACIONES = ('create', 'update', 'delete')
+MAX_OPERACIONES = 1000
+FACTURAS = ('factura_venta', 'factura_compra')
+
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ids_referenciados(operaciones):
+    """cuenta and producto ids mentioned in the payload, to check them with one query each"""
+    cuentas, productos = set(), set()
+    for operacion in operaciones:
+        data = operacion.get('data') if isinstance(operacion, dict) else None
+        if not isinstance(data, dict):
+            continue
+        cuentas.add(_entero(data.get('cuenta')))
+        for item in data.get('items') or []:
+            if isinstance(item, dict):
+                productos.add(_entero(item.get('producto')))
+    cuentas.discard(None)
+    productos.discard(None)
+    return (
+        set(Cuentas.objects.filter(pk__in=cuentas).values_list('id', flat=True)) if cuentas else set(),
+        set(Productos.objects.filter(pk__in=productos).values_list('id', flat=True)) if productos else set(),
+    )
+
+
+def _valor(data, instancia, campo):
+    """Value of campo after the operation: the new one or the stored one"""
+    return data.get(campo, getattr(instancia, campo, None))
+
+
+def aplicar_operaciones(operaciones):
+    """Validate and apply the operations. Returns (ok, results in request order)"""
+    resultados = [{'index': i, 'op': op.get('op') if isinstance(op, dict) else None}
+                  for i, op in enumerate(operaciones)]
+    errores = {}
+
+    # Shape, and the rows that update/delete touch (one query)
+    ids, tocados = {}, set()
+    for i, operacion in enumerate(operaciones):
+        if not isinstance(operacion, dict) or operacion.get('op') not in OPERACIONES:
+            errores[i] = {'op': [f"Debe ser uno de: {', '.join(OPERACIONES)}"]}
+            continue
+        if operacion['op'] in ('update', 'delete'):
+            pk = _entero(operacion.get('id'))
+            if pk is None:
+                errores[i] = {'id': ['Se requiere el id de la transacción.']}
+            elif pk in tocados:
+                errores[i] = {'id': ['Hay otra operación sobre esta transacción.']}
+            else:
+                ids[i] = pk
+                tocados.add(pk)
+                resultados[i]['id'] = pk
+        if operacion['op'] in ('create', 'update') and not isinstance(operacion.get('data'), dict):
+            errores[i] = {'data': ['Se requiere un objeto data.']}
+    existentes = Transacciones.objects.in_bulk(tocados)
+    for i, pk in ids.items():
+        if pk not in existentes:
+            errores[i] = {'id': [f'La transacción {pk} no existe.']}
+
+    # Field validation, with cuentas/productos checked against preloaded ids
+    cuentas, productos = _ids_referenciados(operaciones)
+    contexto = {'cuentas': cuentas, 'productos': productos}
+    validos = {}
+    for i, operacion in enumerate(operaciones):
+        if i in errores or operacion['op'] == 'delete':
+            continue
+        instancia = existentes[ids[i]] if operacion['op'] == 'update' else None
+        serializer = BulkTransaccionSerializer(
+            instancia, data=operacion['data'], partial=instancia is not None, context=contexto
+        )
+        if serializer.is_valid():
+            validos[i] = serializer.validated_data
+        else:
+            errores[i] = serializer.errors
+
+    # Comprobante: required for facturas, unique per cuenta and tipo (one query)
+    claves, vistas = {}, set()
+    for i, data in validos.items():
+        instancia = existentes.get(ids.get(i))
+        tipo = _valor(data, instancia, 'tipo')
+        if tipo not in FACTURAS:
+            continue
+        numero = _valor(data, instancia, 'numero_comprobante')
+        if not numero:
+            errores[i] = {'numero_comprobante': ['El número de comprobante es obligatorio.']}
+            continue
+        clave = (_valor(data, instancia, 'cuenta_id'), tipo, numero)
+        if clave in vistas:
+            errores[i] = {'numero_comprobante': ['Comprobante repetido en esta misma operación.']}
+        else:
+            claves[i] = clave
+            vistas.add(clave)
+    if claves:
+        ocupados = set(
+            Transacciones.objects.filter(
+                tipo__in=FACTURAS,
+                cuenta_id__in={c for c, _, _ in claves.values()},
+                numero_comprobante__in={n for _, _, n in claves.values()},
+            ).exclude(pk__in=tocados).values_list('cuenta_id', 'tipo', 'numero_comprobante')
+        )
+        for i, clave in claves.items():
+            if clave in ocupados:
+                errores[i] = {'numero_comprobante': ['Ya existe una factura con este número para esta cuenta y tipo.']}
+
+    if errores:
+        for i, resultado in enumerate(resultados):
+            resultado.update({'status': 'error', 'errors': errores[i]} if i in errores else {'status': 'valid'})
+        return False, resultados
+
+    _aplicar(operaciones, ids, existentes, validos, resultados)
+    return True, resultados
+
+
+def _aplicar(operaciones, ids, existentes, validos, resultados):
+    cuentas, productos, fechas, saldos = set(), set(), [], []
+    borrar = [ids[i] for i, op in enumerate(operaciones) if op['op'] == 'delete']
+    reemplazar_items = [ids[i] for i, data in validos.items() if i in ids and 'items' in data]
+    # Items kept by an update that changes tipo: their stock effect changes too
+    cambian_tipo = [
+        ids[i] for i, data in validos.items()
+        if i in ids and 'items' not in data and data.get('tipo', existentes[ids[i]].tipo) != existentes[ids[i]].tipo
+    ]
+    creadas, actualizadas, campos, nuevos_items = [], [], set(), []
+
+    with transaction.atomic(), recalculos_suspendidos():
+        for pk in borrar + [ids[i] for i in validos if i in ids]:
+            cuentas.add(existentes[pk].cuenta_id)
+            fechas.append(existentes[pk].fecha)
+        if borrar or reemplazar_items:
+            items = TransaccionItems.objects.filter(transaccion_id__in=borrar + reemplazar_items)
+            productos.update(items.values_list('producto_id', flat=True))
+            borrar_filas(items)
+        if cambian_tipo:
+            productos.update(
+                TransaccionItems.objects.filter(transaccion_id__in=cambian_tipo).values_list('producto_id', flat=True)
+            )
+        if borrar:
+            borrar_filas(Transacciones.objects.filter(pk__in=borrar))
+
+        for i, data in validos.items():
+            data = dict(data)
+            items = data.pop('items', None)
+            if operaciones[i]['op'] == 'update':
+                transaccion = existentes[ids[i]]
+                for campo, valor in data.items():
+                    setattr(transaccion, campo, valor)
+                campos.update(data)
+                actualizadas.append(transaccion)
+            else:
+                if data.get('tipo') in FACTURAS:
+                    # Like create: facturas start pendiente, estado is recomputed below
+                    data['estado'] = 'pendiente'
+                transaccion = Transacciones(**data)
+                creadas.append(transaccion)
+            for item in items or []:
+                nuevos_items.append((transaccion, TransaccionItems(**item)))
+            cuentas.add(transaccion.cuenta_id)
+            fechas.append(transaccion.fecha)
+            if transaccion.tipo not in FACTURAS:
+                saldos.append(transaccion)
+
+        if actualizadas and campos:
+            Transacciones.objects.bulk_update(actualizadas, list(campos), batch_size=500)
+        if creadas:
+            crear_con_ids(creadas)
+        for transaccion, item in nuevos_items:
+            item.transaccion = transaccion
+            productos.add(item.producto_id)
+        TransaccionItems.objects.bulk_create([item for _, item in nuevos_items], batch_size=500)
+
+        recalcular_movimientos(cuentas, productos, fechas)
+        if saldos:
+            Transacciones.actualizar_saldos_diferencia([t.pk for t in saldos])
+
+    estados = {'create': 'created', 'update': 'updated', 'delete': 'deleted'}
+    creadas = iter(creadas)
+    for i, resultado in enumerate(resultados):
+        if operaciones[i]['op'] == 'create':
+            resultado['id'] = next(creadas).pk
+        resultado['status'] = estados[operaciones[i]['op']]
@@ -0,0 +1,143 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over the view's `keyset_ordering` fields.
+
+    The cursor holds the ordering values of the last/first row of the page,
+    so every page is a `WHERE (fecha, id) > (...) ORDER BY fecha, id LIMIT n`
+    and deep pages cost the same as the first one (no OFFSET).
+
+    It is opt-in: without `?cursor=` or `?page_size=` the endpoint keeps
+    returning the full list, as the React client expects today.
+
+    GET /api/movimientos/?page_size=50
+    -> {"next": "...?cursor=...", "prev": null, "results": [...]}
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    default_ordering = ('id',)
+    invalid_cursor_message = 'Cursor inválido'
+    # False to paginate even without ?cursor= / ?page_size= (new endpoints)
+    opt_in = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.opt_in and self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.default_ordering))
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+
+        direccion, posicion = self.decode_cursor(request)
+        reverso = direccion == 'prev'
+        if posicion is not None:
+            queryset = queryset.filter(self._filtro_posicion(posicion, reverso))
+        orden = [('-' + campo) if reverso else campo for campo in self.ordering]
+        filas = list(queryset.order_by(*orden)[:self.page_size + 1])
+
+        hay_mas = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        if reverso:
+            filas.reverse()
+            self.has_next = posicion is not None
+            self.has_prev = hay_mas
+        else:
+            self.has_next = hay_mas
+            self.has_prev = posicion is not None
+        self.page = filas
+        return filas
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'prev': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link('next', self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_prev or not self.page:
+            return None
+        return self._link('prev', self.page[0])
+
+    def _link(self, direccion, fila):
+        posicion = [self._valor(fila, campo) for campo in self.ordering]
+        cursor = base64.urlsafe_b64encode(
+            json.dumps({'d': direccion, 'p': posicion}).encode()
+        ).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    @staticmethod
+    def _valor(fila, campo):
+        valor = fila[campo] if isinstance(fila, dict) else getattr(fila, campo)
+        return valor if valor is None or isinstance(valor, (int, str)) else str(valor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return 'next', None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            direccion, posicion = data['d'], data['p']
+            if direccion not in ('next', 'prev') or len(posicion) != len(self.ordering):
+                raise ValueError
+            posicion = [
+                self.model._meta.get_field(campo).to_python(valor)
+                for campo, valor in zip(self.ordering, posicion)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return direccion, posicion
+
+    def _filtro_posicion(self, posicion, reverso):
+        """(a, b) > (x, y)  ->  a > x OR (a = x AND b > y)"""
+        operador = 'lt' if reverso else 'gt'
+        filtro = Q()
+        iguales = {}
+        for campo, valor in zip(self.ordering, posicion):
+            filtro |= Q(**iguales, **{f'{campo}__{operador}': valor})
+            iguales[campo] = valor
+        return filtro
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,79 @@
+"""
+Cache for report endpoints (settings.REPORT_CACHE).
+
+A report is stored together with the version of the keys it depends on
+(api/versiones.py). The signal handlers bump those versions exactly when
+the report's inputs change, so a cached result is served until then. With
+MAX_STALENESS > 0 an invalidated result may still be served for that many
+seconds, to avoid recomputing on every write during busy periods.
+
+The 'reportes' cache (REPORT_CACHE, by default the same backend as
+API_CACHE) must be shared like the versions: an import run from manage.py
+bumps them in its own process.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .versiones import version_tablas
+
+# Version keys bumped by the signals in api/models.py
+VENTAS_PRODUCTO = 'reporte:ventas_producto'
+
+
+def _config():
+    return {'ALIAS': 'default', 'MAX_STALENESS': 0, 'TIMEOUT': 3600, **getattr(settings, 'REPORT_CACHE', {})}
+
+
+class ReporteCacheado:
+    """Cached result of `calcular()`, invalidated by the versions of `dependencias`"""
+
+    def __init__(self, nombre, dependencias, calcular):
+        self.nombre = nombre
+        self.dependencias = dependencias
+        self.calcular = calcular
+
+    @property
+    def cache(self):
+        return caches[_config()['ALIAS']]
+
+    def _clave(self, sufijo):
+        return f'api:reporte:{self.nombre}:{sufijo}'
+
+    def obtener(self):
+        """Return (data, hit)"""
+        config = _config()
+        version = version_tablas(*self.dependencias)
+        entrada = self.cache.get(self._clave('ultimo'))
+        if entrada is not None:
+            version_cacheada, calculado, data = entrada
+            if version_cacheada == version or (
+                config['MAX_STALENESS'] and time.time() - calculado <= config['MAX_STALENESS']
+            ):
+                self._contar('hits')
+                return data, True
+
+        self._contar('misses')
+        data = self.calcular()
+        self.cache.set(self._clave('ultimo'), (version, time.time(), data), timeout=config['TIMEOUT'])
+        return data, False
+
+    def _contar(self, contador):
+        clave = self._clave(contador)
+        try:
+            self.cache.incr(clave)
+        except ValueError:
+            self.cache.add(clave, 0, timeout=None)
+            self.cache.incr(clave)
+
+    def estadisticas(self):
+        valores = self.cache.get_many([self._clave('hits'), self._clave('misses')])
+        hits = valores.get(self._clave('hits'), 0)
+        misses = valores.get(self._clave('misses'), 0)
+        return {
+            'reporte': self.nombre,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
@@ -0,0 +1,191 @@
+"""
+Fast read-only serialization for list/retrieve (settings.FAST_SERIALIZATION).
+
+SerializacionRapida reads the declared fields of a ModelSerializer once and
+builds the same dicts straight from .values() rows, with one converter per
+field instead of DRF's per-field to_representation machinery. A nested
+many=True serializer (the items of a transaccion) costs one extra query,
+grouped by parent in one pass.
+
+The output must be byte-identical to the serializer's; field types without a
+converter here fall back to the DRF field itself.
+`manage.py benchmark_serialization` checks and times both paths.
+"""
+import decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+def _conversor_decimal(campo):
+    coerce = getattr(campo, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if campo.normalize_output or campo.localize or campo.decimal_places is None:
+        return campo.to_representation
+    exponente = decimal.Decimal('.1') ** campo.decimal_places
+    contexto = decimal.getcontext().copy()
+    if campo.max_digits is not None:
+        contexto.prec = campo.max_digits
+    redondeo = campo.rounding
+
+    def convertir(valor):
+        if not isinstance(valor, decimal.Decimal):
+            valor = decimal.Decimal(str(valor).strip())
+        valor = valor.quantize(exponente, rounding=redondeo, context=contexto)
+        return f'{valor:f}' if coerce else valor
+    return convertir
+
+
+def _conversor_fecha(campo):
+    formato = getattr(campo, 'format', api_settings.DATE_FORMAT)
+    if formato is None or formato.lower() != 'iso-8601':
+        return campo.to_representation
+    return lambda valor: valor if isinstance(valor, str) else (valor.isoformat() if valor else None)
+
+
+def _conversor(campo):
+    """Function value -> representation equivalent to campo.to_representation"""
+    if isinstance(campo, serializers.PrimaryKeyRelatedField) and campo.pk_field is None:
+        return None  # the *_id column already is the representation
+    if isinstance(campo, serializers.DecimalField):
+        return _conversor_decimal(campo)
+    if isinstance(campo, serializers.DateField) and not isinstance(campo, serializers.DateTimeField):
+        return _conversor_fecha(campo)
+    if isinstance(campo, serializers.ChoiceField):
+        return lambda valor: valor if valor in ('', None) else campo.choice_strings_to_values.get(str(valor), valor)
+    if type(campo) is serializers.ReadOnlyField:
+        return None
+    if type(campo) is serializers.IntegerField:
+        return int
+    if type(campo) is serializers.FloatField:
+        return float
+    if type(campo) in (serializers.CharField, serializers.EmailField):
+        return str
+    return campo.to_representation
+
+
+class SerializacionRapida:
+    """
+    Dict rows equivalent to serializer_class(instances, many=True).data for a
+    queryset. Built once per serializer class and field subset (see para()).
+    campos: names of the fields to keep (sparse fieldsets), None for all.
+    """
+
+    def __init__(self, serializer_class, campos=None):
+        serializer = serializer_class()
+        self.modelo = serializer.Meta.model
+        self.campos = []  # (name, values() key, converter)
+        self.anidado = None  # (name, SerializacionRapida, fk attname)
+        self.columnas = []
+        self.opcionales = []  # fields whose source may be an annotation
+        for nombre, campo in serializer.fields.items():
+            if campo.write_only or (campos is not None and nombre not in campos):
+                continue
+            if isinstance(campo, serializers.ListSerializer):
+                hijo = SerializacionRapida(type(campo.child))
+                fk = next(
+                    f.attname for f in hijo.modelo._meta.concrete_fields
+                    if f.is_relation and f.related_model is self.modelo
+                )
+                self.anidado = (nombre, hijo, fk)
+                self.campos.append((nombre, None, None))
+                continue
+            try:
+                campo_modelo = self.modelo._meta.get_field(campo.source)
+                clave = campo_modelo.attname
+                self.columnas.append(clave)
+            except FieldDoesNotExist:
+                # Not a column: only present when the queryset annotates it,
+                # DRF skips it otherwise
+                clave = campo.source
+                self.opcionales.append(clave)
+            self.campos.append((nombre, clave, _conversor(campo)))
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def para(cls, serializer_class, campos=None):
+        return cls(serializer_class, campos)
+
+    def valores(self, queryset, *extra):
+        """queryset as .values() with the columns the representation needs"""
+        anotaciones = [c for c in self.opcionales if c in queryset.query.annotations]
+        columnas = dict.fromkeys(self.columnas + anotaciones + (['id'] if self.anidado else []) + list(extra))
+        return queryset.select_related(None).prefetch_related(None).values(*columnas)
+
+    def serializar(self, filas):
+        filas = list(filas)
+        hijos = self._hijos(filas) if self.anidado else {}
+        return [self._fila(fila, hijos) for fila in filas]
+
+    def _fila(self, fila, hijos):
+        salida = {}
+        for nombre, clave, convertir in self.campos:
+            if clave is None:
+                salida[nombre] = hijos.get(fila['id'], [])
+            elif clave in fila:
+                valor = fila[clave]
+                salida[nombre] = convertir(valor) if convertir is not None and valor is not None else valor
+        return salida
+
+    def _hijos(self, filas):
+        """Nested rows of every parent with one query, grouped in one pass (pk order, as the prefetch)"""
+        _, hijo, fk = self.anidado
+        agrupados = {}
+        if not filas:
+            return agrupados
+        queryset = hijo.modelo._default_manager.filter(**{f'{fk}__in': {fila['id'] for fila in filas}})
+        for fila in hijo.valores(queryset, fk).order_by('pk'):
+            agrupados.setdefault(fila[fk], []).append(hijo._fila(fila, {}))
+        return agrupados
+
+
+def serializacion_rapida_activa(view):
+    return getattr(view, 'serializacion_rapida', True) and getattr(settings, 'FAST_SERIALIZATION', False)
+
+
+class SerializacionRapidaMixin:
+    """
+    list/retrieve through SerializacionRapida when settings.FAST_SERIALIZATION
+    is on (and the view does not set serializacion_rapida = False). Writes and
+    other actions keep using the DRF serializers.
+
+    Views with sparse fieldsets return the field names from
+    campos_serializados().
+    """
+
+    def campos_serializados(self):
+        return None
+
+    def _rapida(self):
+        return SerializacionRapida.para(self.get_serializer_class(), self.campos_serializados())
+
+    def list(self, request, *args, **kwargs):
+        if not serializacion_rapida_activa(self):
+            return super().list(request, *args, **kwargs)
+        rapida = self._rapida()
+        # The keyset cursor is read from the rows even when not in the output
+        filas = rapida.valores(self.filter_queryset(self.get_queryset()), *getattr(self, 'keyset_ordering', ()))
+        pagina = self.paginate_queryset(filas)
+        if pagina is not None:
+            return self.get_paginated_response(rapida.serializar(pagina))
+        return Response(rapida.serializar(filas))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not serializacion_rapida_activa(self):
+            return super().retrieve(request, *args, **kwargs)
+        rapida = self._rapida()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        # Same 404s as GenericAPIView.get_object
+        try:
+            fila = rapida.valores(self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            )).first()
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if fila is None:
+            raise Http404(f'No {rapida.modelo._meta.object_name} matches the given query.')
+        return Response(rapida.serializar([fila])[0])
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
 from .models import (
     ApiNote,
@@ -54,25 +55,81 @@ class VentaProductoSerializer(serializers.Serializer):
     total_vendido    = serializers.DecimalField(max_digits=20, decimal_places=2)
 
 
+class FacturaPendienteSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    tipo = serializers.CharField()
+    fecha = serializers.DateField()
+    cuenta = serializers.IntegerField(source='cuenta_id')
+    cuenta_nombre = serializers.CharField(source='cuenta__nombre')
+    numero_comprobante = serializers.IntegerField(allow_null=True)
+    estado = serializers.CharField()
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    abonado = serializers.DecimalField(max_digits=14, decimal_places=2)
+    pendiente = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
 class SaldoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Saldo
         fields = ['id', 'saldo_actual', 'saldo_inicial']
 
 
+def _pk(campo, valor):
+    """valor as a primary key of the field's model, None if it can't be one"""
+    if valor in (None, '') or isinstance(valor, bool):
+        return None
+    try:
+        return campo.get_queryset().model._meta.pk.to_python(valor)
+    except DjangoValidationError:
+        return None
+
+
+class PrimaryKeyPrecargadoField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that, inside a ListaPrecargada, takes the instance
+    from the rows loaded for the whole list instead of one queryset.get() per item
+    """
+
+    def to_internal_value(self, data):
+        precargados = getattr(self.parent.parent, 'precargados', {}).get(self.field_name)
+        pk = _pk(self, data)
+        if precargados is None or pk is None:
+            return super().to_internal_value(data)
+        if pk not in precargados:
+            self.fail('does_not_exist', pk_value=data)
+        return precargados[pk]
+
+
+class ListaPrecargada(serializers.ListSerializer):
+    """
+    many=True serializer that loads the related rows of every item with one
+    query per PrimaryKeyPrecargadoField before validating them
+    """
+
+    def to_internal_value(self, data):
+        self.precargados = {}
+        if isinstance(data, list):
+            for nombre, campo in self.child.fields.items():
+                if isinstance(campo, PrimaryKeyPrecargadoField) and not campo.read_only:
+                    ids = {_pk(campo, fila.get(nombre)) for fila in data if isinstance(fila, dict)} - {None}
+                    self.precargados[nombre] = campo.get_queryset().in_bulk(ids) if ids else {}
+        return super().to_internal_value(data)
+
+
 class TransaccionItemsSerializer(serializers.ModelSerializer):
-    producto = serializers.PrimaryKeyRelatedField(
+    producto = PrimaryKeyPrecargadoField(
         queryset=Productos.objects.all(),
         allow_null=True,
         required=False
     )
-    transaccion = serializers.PrimaryKeyRelatedField(
+    transaccion = PrimaryKeyPrecargadoField(
         queryset=Transacciones.objects.all(),
         required=False
     )
 
     class Meta:
         model = TransaccionItems
+        list_serializer_class = ListaPrecargada
         fields = [
             'id',
             'transaccion',
@@ -84,7 +141,17 @@ class TransaccionItemsSerializer(serializers.ModelSerializer):
         ]
 
 
-class TransaccionesSerializer(serializers.ModelSerializer):
+class CamposSeleccionablesMixin:
+    """`campos`: names of the fields to keep (sparse fieldsets), None for all"""
+
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+
+class TransaccionesSerializer(CamposSeleccionablesMixin, serializers.ModelSerializer):
     cantidad_productos = serializers.IntegerField(read_only=True)
     items = TransaccionItemsSerializer(
         source='transaccionitems_set',
@@ -106,8 +173,8 @@ class TransaccionesSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         items_data = validated_data.pop('transaccionitems_set', [])
         transaccion = Transacciones.objects.create(**validated_data)
-        for item_data in items_data:
-            TransaccionItems.objects.create(
+        TransaccionItems.crear_en_lote(transaccion, [
+            TransaccionItems(
                 transaccion=transaccion,
                 producto=item_data.get('producto'),
                 nombre_producto=item_data['nombre_producto'],
@@ -115,6 +182,8 @@ class TransaccionesSerializer(serializers.ModelSerializer):
                 cantidad=item_data['cantidad'],
                 descuento_item=item_data.get('descuento_item', 0)
             )
+            for item_data in items_data
+        ])
         return transaccion
 
 class TransaccionesWriteSerializer(serializers.ModelSerializer):
@@ -132,11 +201,10 @@ class TransaccionesWriteSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
         transaccion = Transacciones.objects.create(**validated_data)
-        for item_data in items_data:
-            TransaccionItems.objects.create(
-                transaccion=transaccion,
-                **item_data
-            )
+        TransaccionItems.crear_en_lote(transaccion, [
+            TransaccionItems(transaccion=transaccion, **item_data)
+            for item_data in items_data
+        ])
         return transaccion
 
     def update(self, instance, validated_data):
@@ -145,10 +213,42 @@ class TransaccionesWriteSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         if items_data is not None:
-            instance.transaccionitems_set.all().delete()
-            for item_data in items_data:
-                TransaccionItems.objects.create(
-                    transaccion=instance,
-                    **item_data
-                )
+            TransaccionItems.eliminar_en_lote(instance)
+            TransaccionItems.crear_en_lote(instance, [
+                TransaccionItems(transaccion=instance, **item_data)
+                for item_data in items_data
+            ])
         return instance
+
+
+class BulkItemSerializer(serializers.Serializer):
+    producto = serializers.IntegerField(source='producto_id', allow_null=True, required=False)
+    nombre_producto = serializers.CharField(max_length=255)
+    precio_unitario = serializers.DecimalField(max_digits=12, decimal_places=2)
+    cantidad = serializers.DecimalField(max_digits=10, decimal_places=2)
+    descuento_item = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, default=0)
+
+    def validate_producto(self, value):
+        # Ids preloaded by the bulk endpoint instead of one query per item
+        if value is not None and value not in self.context['productos']:
+            raise serializers.ValidationError(f'El producto {value} no existe.')
+        return value
+
+
+class BulkTransaccionSerializer(serializers.ModelSerializer):
+    """Validation of one create/update of /api/movimientos/bulk/ (the view writes in bulk)"""
+    cuenta = serializers.IntegerField(source='cuenta_id')
+    items = BulkItemSerializer(many=True, required=False)
+
+    class Meta:
+        model = Transacciones
+        fields = [
+            'tipo', 'fecha', 'cuenta', 'total',
+            'numero_comprobante', 'descuento_total', 'concepto', 'items',
+            'estado',
+        ]
+
+    def validate_cuenta(self, value):
+        if value not in self.context['cuentas']:
+            raise serializers.ValidationError(f'La cuenta {value} no existe.')
+        return value
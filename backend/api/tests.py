@@ -1,3 +1,1641 @@
-from django.test import TestCase
+"""
+API tests: python manage.py test api
 
-# Create your tests here.
+Query budgets: every route and action of api/urls.py has a maximum number
+of queries, and it is checked on two data sets of very different size
+(PresupuestoConsultas and PresupuestoConsultasGrande). A view whose queries
+grow with the rows or with the items of a request (N+1) goes over its
+budget on one of them, and the failure lists the SQL that ran.
+
+The classes after them check the behaviour of one feature each (parsers,
+imports, bulk operations, pagination, search...).
+
+The api tables are unmanaged (the schema lives in MySQL), so they are
+created on the test database with api.generador.crear_tablas(). The
+MySQL/SSH connection helpers (test-mysql-*, ssh-*, create-ssh-tunnel) talk
+to other systems and are not covered.
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import partial
+from unittest import mock, skipIf
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+import servidor
+
+from .busqueda import CAMBIO, SECUENCIA_CAMBIOS, indice_productos, registrar_cambios
+from .exportacion import COLUMNAS_ITEM, COLUMNAS_MOVIMIENTO, filas_movimientos
+from .generador import crear_tablas, generar_dataset
+from .importacion import ErrorFila, ImportadorMovimientos, _decimal, leer_numero
+from .management.commands import benchmark
+from .middleware import RequestMetricsMiddleware
+from .models import (Cuentas, Productos, ResumenDiario, Saldo, TransaccionItems, Transacciones,
+                     recalculos_suspendidos)
+from .usuarios import crear_usuarios_iniciales
+
+# Items of the transaction created by the create/update tests: the budget
+# must hold for one and for many
+CANTIDADES_ITEMS = (1, 25)
+
+
+def en_otro_proceso(codigo, **entorno):
+    """Run `codigo` after django.setup() in a new Python process (a management command would)"""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')}
+    env.update(entorno)
+    # None unsets a variable, so settings fall back to their defaults
+    env = {clave: valor for clave, valor in env.items() if valor is not None}
+    proceso = subprocess.run(
+        [sys.executable, '-c', f'import django\ndjango.setup()\n{codigo}'],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if proceso.returncode:
+        raise AssertionError(proceso.stderr)
+    return proceso.stdout
+
+
+@contextmanager
+def caches_por_defecto(prueba):
+    """
+    The default CACHES of a process started without API_CACHE/REPORT_CACHE,
+    in a temporary directory, here and in the processes started with the
+    function it yields.
+    """
+    directorio = tempfile.mkdtemp()
+    prueba.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+    entorno = {'API_CACHE': None, 'REPORT_CACHE': None, 'API_CACHE_LOCATION': directorio}
+    configuracion = en_otro_proceso(
+        'import json\nfrom django.conf import settings\nprint(json.dumps(settings.CACHES))', **entorno
+    )
+    with override_settings(CACHES=json.loads(configuracion)):
+        yield partial(en_otro_proceso, **entorno)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PruebaApi(TestCase):
+    """api tables on the test database, empty caches and an authenticated APIClient"""
+
+    @classmethod
+    def setUpClass(cls):
+        # DDL outside the test transaction (SQLite can't alter the schema inside one)
+        crear_tablas()
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = get_user_model().objects.create_user('presupuesto', password='presupuesto')
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.usuario)}')
+
+    @staticmethod
+    def derivados():
+        """
+        Everything the signals, deltas and set-based recomputes keep up to
+        date. The float columns to the cent: adding deltas to them drifts in
+        the last binary digits.
+        """
+        def centavos(filas):
+            return {pk: None if valor is None else round(valor, 2) for pk, valor in filas}
+
+        return {
+            'monto': centavos(Cuentas.objects.values_list('id', 'monto')),
+            'cantidad': dict(Productos.objects.values_list('id', 'cantidad')),
+            'estado': dict(Transacciones.objects.values_list('id', 'estado')),
+            'saldo_diferencia': centavos(Transacciones.objects.values_list('id', 'saldo_diferencia')),
+            'resumen': set(ResumenDiario.objects.values_list(
+                'fecha', 'tipo', 'cuenta_id', 'producto_id', 'cantidad', 'bruto', 'descuento', 'lineas'
+            )),
+        }
+
+    def assertDerivadosCorrectos(self, *omitidos):
+        """The values left by the incremental paths equal a full recompute (but the `omitidos`)"""
+        antes = self.derivados()
+        # Committed like a request, so nothing it queues leaks into the next one
+        with self.captureOnCommitCallbacks(execute=True):
+            Cuentas.recalcular_montos()
+            Productos.recalcular_cantidades()
+            Transacciones.actualizar_estados_pago()
+            Transacciones.actualizar_todos_saldos_diferencia()
+            ResumenDiario.reconstruir()
+        despues = self.derivados()
+        for nombre, valores in antes.items():
+            if nombre not in omitidos:
+                self.assertEqual(valores, despues[nombre], nombre)
+
+
+class PresupuestoConsultas(PruebaApi):
+    items = 60
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        generar_dataset(cls.items, semilla=1, meses=3)
+        cls.cuenta = Cuentas.objects.filter(tipo_cuenta='cliente').order_by('id').first()
+        cls.producto = Productos.objects.order_by('id').first()
+        cls.factura = (
+            Transacciones.objects.filter(tipo='factura_venta', transaccionitems__isnull=False)
+            .order_by('id').first()
+        )
+        cls.item = TransaccionItems.objects.filter(transaccion=cls.factura).order_by('id').first()
+        cls.numero = 1_000_000
+
+    @contextmanager
+    def presupuesto(self, maximo, nombre):
+        """Fail if the block runs more than `maximo` queries, on-commit work included"""
+        with CaptureQueriesContext(connection) as capturadas, self.captureOnCommitCallbacks(execute=True):
+            yield
+        if len(capturadas) > maximo:
+            sql = '\n'.join(f'{i}. {q["sql"]}' for i, q in enumerate(capturadas.captured_queries, start=1))
+            self.fail(f'{nombre}: {len(capturadas)} queries, presupuesto {maximo} ({self.items} items)\n{sql}')
+
+    def pedir(self, metodo, url, maximo, datos=None, estado=200, **kwargs):
+        if datos is not None and 'format' not in kwargs:
+            kwargs['format'] = 'json'
+        with self.presupuesto(maximo, f'{metodo.upper()} {url}'):
+            respuesta = getattr(self.client, metodo)(url, datos, **kwargs)
+            if respuesta.streaming:
+                # The export queries run while the body is written
+                respuesta.contenido = b''.join(respuesta.streaming_content)
+        self.assertEqual(respuesta.status_code, estado, getattr(respuesta, 'data', respuesta))
+        return respuesta
+
+    def siguiente_numero(self):
+        type(self).numero += 1
+        return self.numero
+
+    def lineas(self, cantidad):
+        productos = list(Productos.objects.order_by('id')[:cantidad])
+        return [
+            {
+                'producto': productos[i % len(productos)].pk,
+                'nombre_producto': productos[i % len(productos)].tipo_producto,
+                'precio_unitario': '100.00', 'cantidad': '2.00', 'descuento_item': '0.00',
+            }
+            for i in range(cantidad)
+        ]
+
+    def factura_nueva(self, cantidad):
+        return {
+            'tipo': 'factura_venta', 'fecha': '2023-02-15', 'cuenta': self.cuenta.pk,
+            'total': '500.00', 'numero_comprobante': self.siguiente_numero(), 'items': self.lineas(cantidad),
+        }
+
+    # movimientos
+
+    def test_movimientos_list(self):
+        self.pedir('get', '/api/movimientos/', 3)
+        self.pedir('get', '/api/movimientos/?expand=items', 3)
+        self.pedir('get', '/api/movimientos/?page_size=20&expand=items&tipo=factura_venta', 3)
+        self.pedir('get', '/api/movimientos/?fields=id,fecha,total', 2)
+        self.pedir('get', '/api/movimientos/?fields=id,cantidad_productos', 1, estado=400)
+
+    def test_movimientos_list_drf(self):
+        with override_settings(FAST_SERIALIZATION=False):
+            self.pedir('get', '/api/movimientos/?expand=items', 3)
+            self.pedir('get', '/api/movimientos/?page_size=20', 3)
+            self.pedir('get', '/api/movimientos/?page_size=20&fields=id,total', 2)
+
+    def test_movimientos_retrieve(self):
+        self.pedir('get', f'/api/movimientos/{self.factura.pk}/', 3)
+        self.pedir('get', f'/api/movimientos/{self.factura.pk}/?fields=id,total', 2)
+        self.pedir('get', f'/api/movimientos/{self.factura.pk}/?expand=items', 3)
+
+    def test_movimientos_create(self):
+        for cantidad in CANTIDADES_ITEMS:
+            self.pedir('post', '/api/movimientos/', 17, self.factura_nueva(cantidad), estado=201)
+            self.assertDerivadosCorrectos()
+
+    def test_movimientos_create_carrito(self):
+        for cantidad in CANTIDADES_ITEMS:
+            datos = self.factura_nueva(0)
+            datos['carrito'] = [{'id': p.pk, 'cantidad': 2} for p in Productos.objects.order_by('id')[:cantidad]]
+            self.pedir('post', '/api/movimientos/', 17, datos, estado=201)
+            self.assertDerivadosCorrectos()
+
+    def test_movimientos_create_cobranza(self):
+        self.pedir('post', '/api/movimientos/', 14, {
+            'tipo': 'cobranza', 'fecha': '2023-03-01', 'cuenta': self.factura.cuenta_id,
+            'total': '10.00', 'numero_comprobante': self.factura.numero_comprobante,
+        }, estado=201)
+        self.assertDerivadosCorrectos()
+
+    def test_movimientos_update(self):
+        for cantidad in CANTIDADES_ITEMS:
+            datos = self.factura_nueva(cantidad)
+            datos['numero_comprobante'] = self.factura.numero_comprobante
+            self.pedir('put', f'/api/movimientos/{self.factura.pk}/', 22, datos)
+            # Editing a factura doesn't recompute its estado, only a new pago/cobranza does
+            self.assertDerivadosCorrectos('estado')
+
+    def test_movimientos_partial_update(self):
+        self.pedir('patch', f'/api/movimientos/{self.factura.pk}/', 8, {'total': '1234.00'})
+        self.assertDerivadosCorrectos('estado')
+        self.pedir('patch', f'/api/movimientos/{self.factura.pk}/', 20, {'items': self.lineas(25)})
+        self.assertDerivadosCorrectos('estado')
+
+    def test_movimientos_destroy(self):
+        self.pedir('delete', f'/api/movimientos/{self.factura.pk}/', 14, estado=204)
+        # MySQL deletes the items with the transaction (ON DELETE CASCADE), the test tables don't
+        TransaccionItems.objects.filter(transaccion_id=self.factura.pk).delete()
+        self.assertDerivadosCorrectos()
+
+    def test_movimientos_acciones(self):
+        self.pedir('post', '/api/movimientos/batch_recalculate_balances/', 5, {})
+        self.pedir('post', f'/api/movimientos/{self.factura.pk}/recalculate_account_balance/', 5, {})
+        self.pedir('get', '/api/movimientos/pendientes/', 2)
+        self.pedir('get', '/api/movimientos/pendientes/?tipo=factura_compra&page_size=10', 2)
+        # Keyset batch of transactions, then their item lines
+        self.pedir('get', '/api/movimientos/export/?format=csv&items=1', 3)
+        self.pedir('get', '/api/movimientos/export/?format=xlsx', 2)
+
+    def test_movimientos_bulk(self):
+        for cantidad in CANTIDADES_ITEMS:
+            operaciones = [{'op': 'create', 'data': self.factura_nueva(2)} for _ in range(cantidad)]
+            operaciones.append({'op': 'update', 'id': self.factura.pk, 'data': {'total': '99.00'}})
+            self.pedir('post', '/api/movimientos/bulk/', 23, {'operations': operaciones})
+            self.assertDerivadosCorrectos()
+
+    def test_movimientos_bulk_cambia_tipo(self):
+        # Only tipo changes: the stock of the items kept must follow it
+        compra = Transacciones.objects.filter(
+            tipo='factura_compra', transaccionitems__producto__isnull=False
+        ).order_by('id').first()
+        for tipo in ('factura_venta', 'cobranza'):
+            self.pedir('post', '/api/movimientos/bulk/', 23, {'operations': [{
+                'op': 'update', 'id': compra.pk, 'data': {'tipo': tipo, 'numero_comprobante': self.siguiente_numero()},
+            }]})
+            self.assertDerivadosCorrectos()
+
+    def test_movimientos_import(self):
+        for cantidad in CANTIDADES_ITEMS:
+            filas = ['fecha,tipo,cuenta_id,numero_comprobante,total,producto_id,producto,precio_unitario,cantidad']
+            for i in range(cantidad):
+                numero = self.siguiente_numero()
+                filas += [
+                    f'2023-02-{1 + i % 28:02d},factura_venta,{self.cuenta.pk},{numero},300.00,'
+                    f'{self.producto.pk},{self.producto.tipo_producto},100.00,{linea}'
+                    for linea in (1, 2)
+                ]
+            archivo = io.BytesIO('\n'.join(filas).encode())
+            archivo.name = 'movimientos.csv'
+            respuesta = self.pedir('post', '/api/movimientos/import/', 24, {'archivo': archivo}, format='multipart')
+            self.assertFalse(respuesta.data.get('errores'), respuesta.data)
+            self.assertDerivadosCorrectos()
+
+    def test_movimientos_import_id_vacio(self):
+        # Exported file (id column) with new rows added by hand: one transaction per row
+        filas = ['id,fecha,tipo,cuenta_id,numero_comprobante,total']
+        filas += [f',2023-02-0{i},factura_venta,{self.cuenta.pk},{self.siguiente_numero()},10.00' for i in (1, 2)]
+        archivo = io.BytesIO('\n'.join(filas).encode())
+        archivo.name = 'movimientos.csv'
+        respuesta = self.pedir('post', '/api/movimientos/import/', 24, {'archivo': archivo}, format='multipart')
+        self.assertEqual(respuesta.data['transacciones'], 2, respuesta.data)
+        self.assertDerivadosCorrectos()
+
+    # movimientos-items
+
+    def test_items(self):
+        self.pedir('get', '/api/movimientos-items/', 2)
+        self.pedir('get', f'/api/movimientos-items/{self.item.pk}/', 2)
+        nuevo = self.pedir('post', '/api/movimientos-items/', 12, {
+            **self.lineas(1)[0], 'transaccion': self.factura.pk,
+        }, estado=201).data
+        self.assertDerivadosCorrectos()
+        self.pedir('put', f'/api/movimientos-items/{nuevo["id"]}/', 14, {
+            **self.lineas(1)[0], 'transaccion': self.factura.pk, 'cantidad': '3.00',
+        })
+        self.assertDerivadosCorrectos()
+        self.pedir('patch', f'/api/movimientos-items/{nuevo["id"]}/', 13, {'cantidad': '4.00'})
+        self.assertDerivadosCorrectos()
+        self.pedir('delete', f'/api/movimientos-items/{nuevo["id"]}/', 12, estado=204)
+        self.assertDerivadosCorrectos()
+
+    # cuentas
+
+    def test_cuentas(self):
+        self.pedir('get', '/api/cuentas/', 2)
+        self.pedir('get', f'/api/cuentas/{self.cuenta.pk}/', 2)
+        nueva = self.pedir('post', '/api/cuentas/', 2, {
+            'nombre': 'Presupuesto', 'tipo_cuenta': 'cliente', 'monto': 0,
+        }, estado=201).data
+        self.pedir('put', f'/api/cuentas/{nueva["id"]}/', 3, {
+            'nombre': 'Presupuesto 2', 'tipo_cuenta': 'cliente', 'monto': 0,
+        })
+        self.pedir('patch', f'/api/cuentas/{nueva["id"]}/', 3, {'contacto_telefono': '1100000000'})
+        self.pedir('delete', f'/api/cuentas/{nueva["id"]}/', 3, estado=204)
+        self.pedir('post', f'/api/cuentas/{self.cuenta.pk}/recalculate_balance/', 4, {})
+
+    # productos
+
+    def test_productos(self):
+        self.pedir('get', '/api/productos/', 2)
+        self.pedir('get', '/api/productos/?page_size=10', 2)
+        self.pedir('get', f'/api/productos/{self.producto.pk}/', 2)
+        nuevo = self.pedir('post', '/api/productos/', 2, {
+            'tipo_producto': 'PRESUPUESTO', 'precio_venta_unitario': 100, 'costo_unitario': 70,
+            'cantidad_inicial': 5,
+        }, estado=201).data
+        self.pedir('put', f'/api/productos/{nuevo["id"]}/', 3, {
+            'tipo_producto': 'PRESUPUESTO 2', 'precio_venta_unitario': 100, 'costo_unitario': 70,
+            'cantidad_inicial': 5,
+        })
+        self.assertDerivadosCorrectos()
+        self.pedir('patch', f'/api/productos/{nuevo["id"]}/', 3, {'precio_venta_unitario': 120})
+        self.pedir('delete', f'/api/productos/{nuevo["id"]}/', 3, estado=204)
+
+    def test_productos_acciones(self):
+        # The first search builds the index
+        self.pedir('get', '/api/productos/search/?q=tir', 3)
+        self.pedir('get', '/api/productos/search/?q=tir&limit=100', 2)
+        # A rename only reads that product again, not the whole table
+        self.pedir('patch', f'/api/productos/{self.producto.pk}/', 3, {'tipo_producto': 'ZAPALLO 9x9'})
+        encontrados = self.pedir('get', '/api/productos/search/?q=zap 9x', 3).data
+        self.assertEqual([p['id'] for p in encontrados], [self.producto.pk])
+        self.pedir('post', '/api/productos/batch_recalculate_quantities/', 5, {})
+        self.pedir('post', '/api/productos/batch_recalculate_quantities/', 5, {
+            'ids': list(Productos.objects.values_list('id', flat=True)),
+        })
+
+    # reportes, saldo y usuarios
+
+    def test_reportes(self):
+        self.pedir('get', '/api/ventas-producto/', 2)
+        # Cached: only the user lookup of the JWT
+        self.pedir('get', '/api/ventas-producto/', 1)
+        self.pedir('get', '/api/reportes/resumen/', 2)
+        self.pedir('get', '/api/reportes/resumen/?agrupar=mes&tipo=factura_venta,factura_compra', 2)
+        self.pedir('get', '/api/reportes/resumen/?agrupar=producto&desde=2023-02-01', 2)
+        self.pedir('get', '/api/reportes/cache-stats/', 1)
+
+    def test_saldo(self):
+        self.pedir('get', '/api/saldo/', 2)
+        self.pedir('patch', '/api/saldo/', 11, {'saldo_inicial': 1000})
+
+    def test_usuarios(self):
+        self.pedir('get', '/api/users/', 2)
+        self.pedir('post', '/api/create-user/', 3, {'username': 'nuevo', 'password': 'nuevo'}, estado=201)
+        self.client.credentials()
+        self.pedir('post', '/api/create-admin-users/', 3, {})
+        self.pedir('post', '/api/create-admin-users/', 3, {})
+        # Start-up bootstrap (servidor.py) once the users exist: one query
+        with self.presupuesto(1, 'crear_usuarios_iniciales'):
+            self.assertEqual(crear_usuarios_iniciales(), {'admin': False, 'felipe': False})
+
+
+class PresupuestoConsultasGrande(PresupuestoConsultas):
+    items = 1500
+
+
+class LecturaNumeros(SimpleTestCase):
+    """Amounts typed or pasted in the import files (es-AR as the app shows them, en-US too)"""
+
+    def test_formatos(self):
+        for texto, esperado in (
+            ('1.234,56', '1234.56'),
+            ('1,234.56', '1234.56'),
+            ('1234,56', '1234.56'),
+            ('1234.56', '1234.56'),
+            ('1.234', '1234'),
+            ('12.345.678,90', '12345678.90'),
+            ('1,234,567', '1234567'),
+            ('$ 1.500,00', '1500'),
+            ('-1.234,5', '-1234.5'),
+            ('3.05', '3.05'),
+            ('0,125', '0.125'),
+            (7, '7'),
+        ):
+            with self.subTest(texto=texto):
+                self.assertEqual(leer_numero(texto), Decimal(esperado))
+
+    def test_rechaza_en_vez_de_adivinar(self):
+        for texto in ('1,234', '1.2.3', '12,34.5', '1.23,4', '1.234.56', 'abc', ''):
+            with self.subTest(texto=texto), self.assertRaises(ValueError):
+                leer_numero(texto)
+
+    def test_importacion(self):
+        self.assertEqual(_decimal('$ 1.500,00', 'total', 2), Decimal('1500.00'))
+        with self.assertRaisesMessage(ErrorFila, 'total inválido'):
+            _decimal('1,234', 'total', 2)
+
+    def test_import_products(self):
+        from .management.commands.import_products import limpiar_precio
+
+        self.assertEqual(limpiar_precio('$ 1.234,56'), 1234.56)
+        self.assertEqual(limpiar_precio('1.234'), 1234.0)
+        self.assertEqual(limpiar_precio(''), 0.0)
+        with self.assertRaises(ValueError):
+            limpiar_precio('1,234')
+
+
+class NombresProductos(SimpleTestCase):
+    """tipo_producto built by import_products from the nombre, largo and ancho cells"""
+
+    def test_tipo_producto(self):
+        from .management.commands.import_products import construir_tipo_producto
+
+        self.assertEqual(construir_tipo_producto(' TIRANTE ', '2x4', 3.05), 'TIRANTE 2x4 3.05')
+        self.assertEqual(construir_tipo_producto('MACHIMBRE  PINO', None, ''), 'MACHIMBRE PINO')
+        # Cells with 0 are left out, as the old script did
+        self.assertEqual(construir_tipo_producto('CLAVOS', 0, 0.0), 'CLAVOS')
+        self.assertEqual(construir_tipo_producto(None, None, None), '')
+
+
+class RespuestasCondicionales(PruebaApi):
+    """ETag / If-None-Match on list and detail"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.producto = Productos.objects.create(tipo_producto='TABLA 1x6', precio_venta_unitario=10, costo_unitario=5)
+
+    def test_304_hasta_que_cambia(self):
+        for url in (f'/api/productos/{self.producto.pk}/', '/api/productos/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                # Saved outside the views (shell, a command): the signals bump the version
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.producto.precio_venta_unitario += 1
+                    self.producto.save()
+                respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_version_compartida_entre_procesos(self):
+        url = f'/api/productos/{self.producto.pk}/'
+        with caches_por_defecto(self) as otro_proceso:
+            etag = self.client.get(url)['ETag']
+            # A management command bumps the version in its own process
+            otro_proceso("from api.versiones import invalidar_tablas\ninvalidar_tablas('productos')")
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ReportesCacheados(PruebaApi):
+    """/api/ventas-producto/ is served from the 'reportes' cache until its inputs change"""
+
+    def test_invalidado_desde_otro_proceso(self):
+        with caches_por_defecto(self) as otro_proceso:
+            self.assertEqual(self.client.get('/api/ventas-producto/')['X-Cache'], 'MISS')
+            self.assertEqual(self.client.get('/api/ventas-producto/')['X-Cache'], 'HIT')
+            # import_movimientos in another process bumps the report's version
+            otro_proceso(
+                'from api.reportes import VENTAS_PRODUCTO\n'
+                'from api.versiones import invalidar_tablas\n'
+                'invalidar_tablas(VENTAS_PRODUCTO)'
+            )
+            self.assertEqual(self.client.get('/api/ventas-producto/')['X-Cache'], 'MISS')
+
+
+class IndiceBusqueda(PruebaApi):
+    """The search index follows product changes made outside the views"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.producto = Productos.objects.create(tipo_producto='TIRANTE 2x4 3,05', precio_venta_unitario=10, costo_unitario=5)
+
+    def buscar(self, texto):
+        return indice_productos.buscar(texto)
+
+    def test_orm(self):
+        self.assertEqual(self.buscar('tir 2x4'), [self.producto.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = Productos.objects.create(tipo_producto='TIRANTE 2x6', precio_venta_unitario=1, costo_unitario=1)
+        self.assertCountEqual(self.buscar('tir 2x'), [self.producto.pk, nuevo.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.tipo_producto = 'LISTON 1x2'
+            nuevo.save()
+        self.assertEqual(self.buscar('tir 2x'), [self.producto.pk])
+        self.assertEqual(self.buscar('liston'), [nuevo.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.delete()
+        self.assertEqual(self.buscar('liston'), [])
+
+    def test_import_products(self):
+        from openpyxl import Workbook
+
+        self.assertEqual(self.buscar('machimbre'), [])
+        libro = Workbook()
+        hoja = libro.active
+        hoja.title = 'STOCK FELI'
+        hoja.append(['nombre', 'largo', 'ancho', 'precio venta', 'costo', 'cantidad'])
+        hoja.append(['MACHIMBRE', '1/2', '3', '1.500,00', '900', 10])
+        hoja.append(['TIRANTE', '2x4', '3,05', '12', '6', 0])
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        archivo = os.path.join(directorio, 'productos.xlsx')
+        libro.save(archivo)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_products', archivo, stdout=io.StringIO())
+        machimbre = Productos.objects.get(tipo_producto='MACHIMBRE 1/2 3')
+        self.assertEqual(self.buscar('machimbre 1/2'), [machimbre.pk])
+        self.assertEqual(self.buscar('tirante'), [self.producto.pk])
+
+    def test_otro_proceso(self):
+        with caches_por_defecto(self) as otro_proceso:
+            self.assertEqual(self.buscar('tirante'), [self.producto.pk])
+            # Renamed without signals, then recorded by another process
+            Productos.objects.filter(pk=self.producto.pk).update(tipo_producto='CANTONERA 2x2')
+            otro_proceso(f'from api.busqueda import registrar_cambios\nregistrar_cambios([{self.producto.pk}])')
+            self.assertEqual(self.buscar('tirante'), [])
+            self.assertEqual(self.buscar('cantonera'), [self.producto.pk])
+
+    def test_secuencia_perdida(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_cambios([self.producto.pk])
+        self.assertEqual(self.buscar('tirante'), [self.producto.pk])
+        # The log is evicted and its numbers start again from the one this index has seen
+        cache.delete_many([SECUENCIA_CAMBIOS, CAMBIO % cache.get(SECUENCIA_CAMBIOS)])
+        Productos.objects.filter(pk=self.producto.pk).update(tipo_producto='CANTONERA 2x2')
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_cambios([self.producto.pk])
+        self.assertEqual(self.buscar('cantonera'), [self.producto.pk])
+
+
+class OperacionesEnLote(PruebaApi):
+    """POST /api/movimientos/bulk/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        cls.producto = Productos.objects.create(
+            tipo_producto='TABLA 1x6', precio_venta_unitario=100, costo_unitario=50, cantidad_inicial=100, cantidad=100
+        )
+
+    def factura(self, numero, *cantidades):
+        return {
+            'tipo': 'factura_venta', 'fecha': '2024-05-02', 'cuenta': self.cuenta.pk, 'total': '300.00',
+            'numero_comprobante': numero,
+            'items': [
+                {'producto': self.producto.pk, 'nombre_producto': 'TABLA 1x6', 'precio_unitario': '100.00',
+                 'cantidad': cantidad}
+                for cantidad in cantidades
+            ],
+        }
+
+    def bulk(self, *operaciones, estado=200):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/movimientos/bulk/', {'operations': operaciones}, format='json')
+        self.assertEqual(respuesta.status_code, estado, respuesta.data)
+        return respuesta.data['results']
+
+    def items(self, transaccion_id):
+        return sorted(TransaccionItems.objects.filter(transaccion_id=transaccion_id).values_list('cantidad', flat=True))
+
+    def test_ids_de_las_creadas(self):
+        resultados = self.bulk(
+            {'op': 'create', 'data': self.factura(1, '1.00', '2.00')},
+            {'op': 'create', 'data': {'tipo': 'cobranza', 'fecha': '2024-05-03', 'cuenta': self.cuenta.pk,
+                                      'total': '300.00', 'numero_comprobante': 1}},
+            {'op': 'create', 'data': self.factura(2, '3.00')},
+        )
+        self.assertEqual([r['status'] for r in resultados], ['created'] * 3)
+        factura, cobranza, otra = (r['id'] for r in resultados)
+        # The items hang from the ids returned
+        self.assertEqual(self.items(factura), [Decimal('1.00'), Decimal('2.00')])
+        self.assertEqual(self.items(otra), [Decimal('3.00')])
+        self.assertEqual(Transacciones.objects.get(pk=cobranza).tipo, 'cobranza')
+        self.assertEqual(Transacciones.objects.get(pk=factura).estado, 'cobrado')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.cantidad, 94)
+        self.assertDerivadosCorrectos()
+
+    def test_borra_y_reemplaza_items(self):
+        primera, segunda = (r['id'] for r in self.bulk(
+            {'op': 'create', 'data': self.factura(1, '1.00')},
+            {'op': 'create', 'data': self.factura(2, '2.00')},
+        ))
+        resultados = self.bulk(
+            {'op': 'delete', 'id': primera},
+            {'op': 'update', 'id': segunda, 'data': {'items': self.factura(2, '5.00', '6.00')['items']}},
+        )
+        self.assertEqual([r['status'] for r in resultados], ['deleted', 'updated'])
+        self.assertFalse(Transacciones.objects.filter(pk=primera).exists())
+        self.assertEqual(self.items(primera), [])
+        self.assertEqual(self.items(segunda), [Decimal('5.00'), Decimal('6.00')])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.cantidad, 89)
+        self.assertDerivadosCorrectos()
+
+    def test_todo_o_nada(self):
+        antes = Transacciones.objects.count()
+        resultados = self.bulk(
+            {'op': 'create', 'data': self.factura(1, '1.00')},
+            {'op': 'delete', 'id': 999999},
+            {'op': 'create', 'data': self.factura(1, '1.00')},
+            estado=400,
+        )
+        self.assertEqual([r['status'] for r in resultados], ['valid', 'error', 'error'])
+        self.assertEqual(Transacciones.objects.count(), antes)
+
+
+class DatosGenerados(PruebaApi):
+    """api.generador.generar_dataset (seed_dataset, benchmark)"""
+
+    def test_secuencias(self):
+        reiniciadas = []
+
+        def sequence_reset_sql(style, modelos):
+            reiniciadas.extend(modelos)
+            return ['SELECT 1']
+
+        # The rows are inserted with explicit ids: the sequences must be moved past them
+        with mock.patch.object(connection.ops, 'sequence_reset_sql', sequence_reset_sql):
+            generar_dataset(200, semilla=1, meses=1)
+        self.assertCountEqual(reiniciadas, [Cuentas, Productos, Transacciones, TransaccionItems])
+
+        maximo = Transacciones.objects.order_by('-id').values_list('id', flat=True).first()
+        nueva = Transacciones.objects.create(
+            tipo='cobranza', fecha='2023-01-31', cuenta=Cuentas.objects.first(), total=1
+        )
+        self.assertGreater(nueva.pk, maximo)
+
+
+class CamposMovimientos(PruebaApi):
+    """?fields= and ?expand= of /api/movimientos list/retrieve"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        producto = Productos.objects.create(tipo_producto='TABLA 1x6', precio_venta_unitario=100, costo_unitario=50)
+        cls.factura = Transacciones.objects.create(
+            tipo='factura_venta', fecha='2024-05-02', cuenta=cuenta, total=200, numero_comprobante=1
+        )
+        TransaccionItems.objects.create(
+            transaccion=cls.factura, producto=producto, nombre_producto='TABLA 1x6', precio_unitario=100, cantidad=2
+        )
+
+    def campos(self, consulta=''):
+        """Keys of the list row and of the detail with the same query string"""
+        lista = self.client.get(f'/api/movimientos/{consulta}')
+        detalle = self.client.get(f'/api/movimientos/{self.factura.pk}/{consulta}')
+        self.assertEqual((lista.status_code, detalle.status_code), (200, 200))
+        fila = lista.data['results'][0] if isinstance(lista.data, dict) else lista.data[0]
+        self.assertEqual(list(fila), list(detalle.data))
+        return detalle.data
+
+    def test_items_por_defecto(self):
+        for rapida in (True, False):
+            with self.subTest(rapida=rapida), override_settings(FAST_SERIALIZATION=rapida):
+                datos = self.campos()
+                self.assertEqual([item['cantidad'] for item in datos['items']], ['2.00'])
+                self.assertIn('cuenta', datos)
+
+    def test_seleccion(self):
+        self.assertEqual(list(self.campos('?fields=total,id')), ['id', 'total'])
+        datos = self.campos('?fields=id&expand=items')
+        self.assertEqual(list(datos), ['id', 'items'])
+        self.assertEqual(len(datos['items']), 1)
+
+    def test_nombres_desconocidos(self):
+        for consulta in ('?fields=id,nada', '?expand=cuenta', '?fields=cantidad_productos'):
+            with self.subTest(consulta=consulta):
+                self.assertEqual(self.client.get(f'/api/movimientos/{consulta}').status_code, 400)
+
+
+class ImportacionMovimientos(PruebaApi):
+    """api.importacion.ImportadorMovimientos (import_movimientos, /api/movimientos/import/)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        cls.producto = Productos.objects.create(tipo_producto='TABLA 1x6', precio_venta_unitario=100, costo_unitario=50)
+
+    def importar(self, *filas):
+        """Import (id, fecha, tipo, numero_comprobante, cantidad) rows; [(tipo, numero, cantidades)] in id order"""
+        filas = [
+            (numero, {
+                'id': id_, 'fecha': fecha, 'tipo': tipo, 'cuenta_id': self.cuenta.pk, 'numero_comprobante': comprobante,
+                'total': '300,00', 'producto_id': self.producto.pk if cantidad else '',
+                'precio_unitario': '100,00' if cantidad else '', 'cantidad': cantidad,
+            })
+            for numero, (id_, fecha, tipo, comprobante, cantidad) in enumerate(filas, start=2)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            resumen = ImportadorMovimientos().importar(filas)
+        self.assertEqual(resumen['errores'], [])
+        self.assertDerivadosCorrectos()
+        return [
+            (t.tipo, t.numero_comprobante, sorted(t.transaccionitems_set.values_list('cantidad', flat=True)))
+            for t in Transacciones.objects.order_by('id')
+        ]
+
+    def test_filas_de_un_id_separadas(self):
+        self.assertEqual(self.importar(
+            ('A', '2024-05-02', 'factura_venta', 1, '1'),
+            ('B', '2024-05-02', 'factura_venta', 2, '1'),
+            ('A', '2024-05-02', 'factura_venta', 1, '2'),
+        ), [
+            ('factura_venta', 1, [Decimal('1.00'), Decimal('2.00')]),
+            ('factura_venta', 2, [Decimal('1.00')]),
+        ])
+
+    def test_sin_id_agrupa_filas_seguidas(self):
+        self.assertEqual(self.importar(
+            ('', '2024-05-02', 'factura_venta', 1, '1'),
+            ('', '2024-05-02', 'factura_venta', 1, '2'),
+            ('', '2024-05-03', 'cobranza', 1, ''),
+            ('', '2024-05-03', 'cobranza', 2, ''),
+            # Same columns after another row: a second cobranza
+            ('', '2024-05-03', 'cobranza', 1, ''),
+        ), [
+            ('factura_venta', 1, [Decimal('1.00'), Decimal('2.00')]),
+            ('cobranza', 1, []),
+            ('cobranza', 2, []),
+            ('cobranza', 1, []),
+        ])
+
+
+@override_settings(REQUEST_METRICS={'ENABLED': True, 'SLOW_REQUEST_MS': 10 ** 6, 'MAX_QUERIES': 2})
+class MetricasPedidos(TestCase):
+    """api.middleware.RequestMetricsMiddleware"""
+
+    def medir(self, vista):
+        with self.assertLogs('api.metrics', 'WARNING') as registro:
+            respuesta = RequestMetricsMiddleware(vista)(RequestFactory().get('/api/movimientos/export/'))
+            if respuesta.streaming:
+                self.assertEqual(registro.records, [])
+                b''.join(respuesta.streaming_content)
+        self.assertEqual(len(registro.records), 1)
+        return respuesta, json.loads(registro.records[0].getMessage())
+
+    def test_cuerpo_en_streaming(self):
+        def vista(request):
+            # Like the export: one batch query per chunk of the body
+            return StreamingHttpResponse(str(Cuentas.objects.count()) for _ in range(3))
+
+        respuesta, registro = self.medir(vista)
+        self.assertIn('desc="0 queries"', respuesta['Server-Timing'])
+        self.assertEqual(registro['queries'], 3)
+
+    def test_respuesta_comun(self):
+        def vista(request):
+            return HttpResponse(str([Cuentas.objects.count() for _ in range(3)]))
+
+        respuesta, registro = self.medir(vista)
+        self.assertIn('desc="3 queries"', respuesta['Server-Timing'])
+        self.assertEqual(registro['queries'], 3)
+
+
+class BalanceCuentas(PruebaApi):
+    """Cuentas.monto kept by per-row deltas in the signal handlers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        cls.otro = Cuentas.objects.create(nombre='OTRO', tipo_cuenta='cliente', monto=0)
+        cls.producto = Productos.objects.create(tipo_producto='TABLA 1x6', precio_venta_unitario=100, costo_unitario=50)
+
+    def montos(self):
+        return [Cuentas.objects.get(pk=c.pk).monto for c in (self.cliente, self.otro)]
+
+    def test_deltas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            factura = Transacciones.objects.create(
+                tipo='factura_venta', fecha='2024-05-02', cuenta=self.cliente, total=300, numero_comprobante=1
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            item = TransaccionItems.objects.create(
+                transaccion=factura, producto=self.producto, nombre_producto='TABLA 1x6',
+                precio_unitario=100, cantidad=2,
+            )
+        # factura_venta: +total, -items
+        self.assertEqual(self.montos(), [100, 0])
+        with self.captureOnCommitCallbacks(execute=True):
+            cobranza = Transacciones.objects.create(tipo='cobranza', fecha='2024-05-03', cuenta=self.cliente, total=50)
+        self.assertEqual(self.montos(), [150, 0])
+        with self.captureOnCommitCallbacks(execute=True):
+            factura.total = 400
+            factura.save()
+        self.assertEqual(self.montos(), [250, 0])
+        with self.captureOnCommitCallbacks(execute=True):
+            item.cantidad = 3
+            item.save()
+        self.assertEqual(self.montos(), [150, 0])
+        with self.captureOnCommitCallbacks(execute=True):
+            cobranza.cuenta = self.otro
+            cobranza.save()
+        self.assertEqual(self.montos(), [100, 50])
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+            factura.delete()
+        self.assertEqual(self.montos(), [0, 50])
+        self.assertDerivadosCorrectos()
+
+    def test_sin_recorrer_el_historial(self):
+        def consultas_cobranza():
+            with CaptureQueriesContext(connection) as capturadas, self.captureOnCommitCallbacks(execute=True):
+                Transacciones.objects.create(tipo='cobranza', fecha='2024-05-03', cuenta=self.cliente, total=1)
+            return len(capturadas)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Saldo.get_singleton()
+        primera = consultas_cobranza()
+        Transacciones.objects.bulk_create([
+            Transacciones(tipo='cobranza', fecha='2024-04-01', cuenta=self.cliente, total=1) for _ in range(50)
+        ])
+        self.assertEqual(consultas_cobranza(), primera)
+
+
+class RecalculoMontos(PruebaApi):
+    """Cuentas.recalcular_montos and /api/movimientos/batch_recalculate_balances/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # monto deliberately wrong: the signals are off while the data is written
+        with recalculos_suspendidos():
+            cls.cliente, cls.proveedor, cls.vacia = (
+                Cuentas.objects.create(nombre=nombre, tipo_cuenta=tipo, monto=999)
+                for nombre, tipo in (('CLIENTE', 'cliente'), ('PROVEEDOR', 'proveedor'), ('VACIA', 'cliente'))
+            )
+            producto = Productos.objects.create(tipo_producto='TABLA', precio_venta_unitario=100, costo_unitario=50)
+            for tipo, cuenta, total, precio, cantidad in (
+                ('factura_venta', cls.cliente, 300, 100, 2),
+                ('factura_compra', cls.proveedor, 500, 50, 4),
+                ('cobranza', cls.cliente, 50, None, None),
+                ('pago', cls.proveedor, 100, None, None),
+            ):
+                transaccion = Transacciones.objects.create(
+                    tipo=tipo, fecha='2024-05-02', cuenta=cuenta, total=total, numero_comprobante=1
+                )
+                if precio:
+                    TransaccionItems.objects.create(
+                        transaccion=transaccion, producto=producto, nombre_producto='TABLA',
+                        precio_unitario=precio, cantidad=cantidad,
+                    )
+
+    def montos(self):
+        return [Cuentas.objects.get(pk=c.pk).monto for c in (self.cliente, self.proveedor, self.vacia)]
+
+    def test_endpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/movimientos/batch_recalculate_balances/')
+        self.assertEqual((respuesta.data['total_accounts'], respuesta.data['unchanged_accounts']), (3, 0))
+        # cliente +300 -200 +50, proveedor -500 +200 -100
+        self.assertEqual(self.montos(), [150, -400, 0])
+        respuesta = self.client.post('/api/movimientos/batch_recalculate_balances/')
+        self.assertEqual(respuesta.data['unchanged_accounts'], 3)
+
+    def test_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Cuentas.recalcular_montos(ids=[self.cliente.pk]), (1, 1))
+        self.assertEqual(self.montos(), [150, 999, 999])
+        # The one-account path gives the same value
+        self.assertEqual(Cuentas.objects.get(pk=self.proveedor.pk).recalcular_monto(), -400)
+
+
+class RecalculoCantidades(PruebaApi):
+    """Productos.recalcular_cantidades and /api/productos/batch_recalculate_quantities/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        with recalculos_suspendidos():
+            cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+            cls.tabla, cls.liston = (
+                Productos.objects.create(tipo_producto=nombre, precio_venta_unitario=1, costo_unitario=1,
+                                         cantidad_inicial=inicial, cantidad=99)
+                for nombre, inicial in (('TABLA', 10), ('LISTON', 5))
+            )
+            # Products without movements and the same stock: one UPDATE per value
+            Productos.objects.bulk_create([
+                Productos(tipo_producto=f'POSTE {i}', precio_venta_unitario=1, costo_unitario=1, cantidad=99)
+                for i in range(8)
+            ])
+            for numero, (tipo, cantidad) in enumerate((('factura_compra', 4), ('factura_venta', 2),
+                                                       ('factura_venta', '1.50'), ('cobranza', 7)), start=1):
+                transaccion = Transacciones.objects.create(
+                    tipo=tipo, fecha='2024-05-02', cuenta=cuenta, total=1, numero_comprobante=numero
+                )
+                TransaccionItems.objects.create(
+                    transaccion=transaccion, producto=cls.tabla, nombre_producto='TABLA',
+                    precio_unitario=1, cantidad=cantidad,
+                )
+
+    def cantidades(self):
+        return dict(Productos.objects.values_list('tipo_producto', 'cantidad'))
+
+    def test_endpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/productos/batch_recalculate_quantities/', {}, format='json')
+        self.assertEqual((respuesta.data['total_products'], respuesta.data['unchanged_products']), (10, 0))
+        # inicial + compras - ventas, truncated; only facturas move stock
+        self.assertEqual(self.cantidades(), {'TABLA': 10, 'LISTON': 5, **{f'POSTE {i}': 0 for i in range(8)}})
+
+    def test_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(
+                '/api/productos/batch_recalculate_quantities/', {'ids': [self.liston.pk]}, format='json'
+            )
+        self.assertEqual(respuesta.data['total_products'], 1)
+        self.assertEqual(self.cantidades()['LISTON'], 5)
+        self.assertEqual(self.cantidades()['TABLA'], 99)
+        respuesta = self.client.post('/api/productos/batch_recalculate_quantities/', {'ids': 3}, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class RecalculosPorTransaccion(PruebaApi):
+    """Signal work collected per atomic block and applied once on commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        cls.productos = Productos.objects.bulk_create([
+            Productos(tipo_producto=f'TABLA {i}', precio_venta_unitario=10, costo_unitario=5, cantidad=0)
+            for i in range(10)
+        ])
+
+    def monto(self):
+        return Cuentas.objects.get(pk=self.cuenta.pk).monto
+
+    def test_una_vez_al_confirmar(self):
+        with CaptureQueriesContext(connection) as capturadas, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                factura = Transacciones.objects.create(
+                    tipo='factura_venta', fecha='2024-05-02', cuenta=self.cuenta, total=500, numero_comprobante=1
+                )
+                for producto in self.productos:
+                    TransaccionItems.objects.create(
+                        transaccion=factura, producto=producto, nombre_producto=producto.tipo_producto,
+                        precio_unitario=10, cantidad=2,
+                    )
+                self.assertEqual(self.monto(), 0)
+        self.assertEqual(self.monto(), 300)
+        sql = [q['sql'] for q in capturadas.captured_queries]
+        self.assertEqual(sum(s.startswith('UPDATE "cuentas"') for s in sql), 1)
+        # One grouped stock recompute for the ten products
+        self.assertEqual(sum(s.startswith('SELECT "transaccion_items"."producto_id"') for s in sql), 1)
+        self.assertEqual(set(Productos.objects.values_list('cantidad', flat=True)), {-2})
+        self.assertDerivadosCorrectos()
+
+    def test_savepoint_revertido(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            Transacciones.objects.create(tipo='cobranza', fecha='2024-05-02', cuenta=self.cuenta, total=50)
+            try:
+                with transaction.atomic():
+                    Transacciones.objects.create(tipo='cobranza', fecha='2024-05-02', cuenta=self.cuenta, total=70)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(self.monto(), 50)
+        self.assertDerivadosCorrectos()
+
+
+class ItemsEnLote(PruebaApi):
+    """Items of a new factura written with one INSERT (carrito and items payloads)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        cls.productos = Productos.objects.bulk_create([
+            Productos(tipo_producto=f'TABLA {i}', precio_venta_unitario=10 * (i + 1), costo_unitario=5, cantidad=0)
+            for i in range(5)
+        ])
+
+    def crear(self, **datos):
+        with CaptureQueriesContext(connection) as capturadas, self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/movimientos/', {
+                'tipo': 'factura_venta', 'fecha': '2024-05-02', 'cuenta': self.cuenta.pk, 'total': '500.00',
+                'numero_comprobante': 1, **datos,
+            }, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        inserts = [q for q in capturadas.captured_queries if q['sql'].startswith('INSERT INTO "transaccion_items"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertDerivadosCorrectos()
+        return list(TransaccionItems.objects.filter(transaccion_id=respuesta.data['id']).order_by('id').values_list(
+            'producto_id', 'nombre_producto', 'precio_unitario', 'cantidad'
+        ))
+
+    def test_carrito(self):
+        primero, segundo = self.productos[:2]
+        items = self.crear(carrito=[
+            {'id': primero.pk, 'cantidad': 2},
+            {'producto_id': segundo.pk, 'cantidad': '3'},
+            {'id': 999999, 'cantidad': 1},  # unknown products are skipped
+            {'id': 'x'},
+        ])
+        # Name and price from the product
+        self.assertEqual(items, [
+            (primero.pk, 'TABLA 0', Decimal('10.00'), Decimal('2.00')),
+            (segundo.pk, 'TABLA 1', Decimal('20.00'), Decimal('3.00')),
+        ])
+
+    def test_items(self):
+        items = self.crear(items=[
+            {'producto': p.pk, 'nombre_producto': p.tipo_producto, 'precio_unitario': '7.00', 'cantidad': '1.00'}
+            for p in self.productos
+        ])
+        self.assertEqual([item[0] for item in items], [p.pk for p in self.productos])
+        self.assertEqual(set(Productos.objects.values_list('cantidad', flat=True)), {-1})
+
+
+class PaginacionKeyset(PruebaApi):
+    """?page_size= / ?cursor= on the list endpoints (api/pagination.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        # Several rows per fecha: the id breaks the ties
+        with recalculos_suspendidos():
+            Transacciones.objects.bulk_create([
+                Transacciones(tipo=('cobranza', 'pago')[i % 2], fecha=f'2024-05-0{1 + i * 7 % 4}', cuenta=cuenta,
+                              total=i)
+                for i in range(13)
+            ])
+        cls.orden = list(Transacciones.objects.order_by('fecha', 'id').values_list('id', flat=True))
+
+    def paginas(self, url):
+        """ids of every page following the links from url, and the last response"""
+        paginas = []
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            paginas.append([fila['id'] for fila in respuesta.data['results']])
+            url = respuesta.data['next']
+        return paginas, respuesta
+
+    def test_recorrido(self):
+        paginas, ultima = self.paginas('/api/movimientos/?page_size=5&fields=id,fecha')
+        self.assertEqual([len(pagina) for pagina in paginas], [5, 5, 3])
+        self.assertEqual(sum(paginas, []), self.orden)
+        # And back from the last page
+        atras, url = [], ultima.data['prev']
+        while url:
+            respuesta = self.client.get(url)
+            atras.insert(0, [fila['id'] for fila in respuesta.data['results']])
+            url = respuesta.data['prev']
+        self.assertEqual(atras, paginas[:-1])
+
+    def test_estable_ante_altas(self):
+        respuesta = self.client.get('/api/movimientos/?page_size=5')
+        vistos = [fila['id'] for fila in respuesta.data['results']]
+        # A row that sorts before the cursor doesn't shift the next pages
+        with recalculos_suspendidos():
+            Transacciones.objects.create(tipo='cobranza', fecha='2024-04-30', cuenta_id=Cuentas.objects.get().pk,
+                                         total=1)
+        paginas, _ = self.paginas(respuesta.data['next'])
+        self.assertEqual(vistos + sum(paginas, []), self.orden)
+
+    def test_filtros_y_parametros(self):
+        paginas, _ = self.paginas('/api/movimientos/?page_size=2&tipo=pago')
+        pagos = list(Transacciones.objects.filter(tipo='pago').order_by('fecha', 'id').values_list('id', flat=True))
+        self.assertEqual(sum(paginas, []), pagos)
+        # Opt-in: without page_size or cursor the full list, as before
+        self.assertEqual(len(self.client.get('/api/movimientos/').data), 13)
+        self.assertEqual(len(self.client.get('/api/movimientos/?page_size=nada').data['results']), 13)
+        self.assertEqual(self.client.get('/api/movimientos/?cursor=nada').status_code, 404)
+
+
+class IndicesEsquema(PruebaApi):
+    """manage.py ensure_indexes"""
+
+    def ejecutar(self, *opciones):
+        salida = io.StringIO()
+        call_command('ensure_indexes', *opciones, stdout=salida, stderr=io.StringIO())
+        return salida.getvalue()
+
+    def faltantes(self):
+        return [linea.split(':')[0] for linea in self.ejecutar('--dry-run', '--no-explain').splitlines()
+                if linea.endswith(': falta')]
+
+    def test_crea_los_que_faltan(self):
+        # The test tables only have the foreign key indexes
+        faltan = self.faltantes()
+        self.assertIn('transacciones(fecha, id)', faltan)
+        self.assertNotIn('transaccion_items(producto_id)', faltan)
+        self.assertEqual(self.faltantes(), faltan)  # --dry-run creates nothing
+
+        salida = self.ejecutar()
+        self.assertEqual(salida.count('Creado '), len(faltan))
+        self.assertIn('después:', salida)
+        self.assertEqual(self.faltantes(), [])
+        self.assertIn('0 índices faltantes', self.ejecutar('--no-explain'))
+
+
+class FacturasPendientes(PruebaApi):
+    """GET /api/movimientos/pendientes/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        cls.proveedor = Cuentas.objects.create(nombre='PROVEEDOR', tipo_cuenta='proveedor', monto=0)
+        filas = [
+            ('factura_venta', cls.cliente, 1, 300, '2024-05-01'),
+            ('cobranza', cls.cliente, 1, 100, '2024-05-02'),
+            ('cobranza', cls.cliente, 1, 50, '2024-05-03'),
+            ('factura_venta', cls.cliente, 2, 200, '2024-05-01'),
+            ('cobranza', cls.cliente, 2, 200, '2024-05-04'),
+            ('factura_compra', cls.proveedor, 1, 500, '2024-04-01'),
+            ('pago', cls.proveedor, 1, 100, '2024-04-02'),
+            # Same número on another cuenta, and a pago for a factura_venta: neither counts
+            ('factura_venta', cls.proveedor, 1, 80, '2024-05-05'),
+            ('pago', cls.cliente, 1, 70, '2024-05-06'),
+        ]
+        with recalculos_suspendidos():
+            cls.ids = [
+                Transacciones.objects.create(tipo=tipo, cuenta=cuenta, numero_comprobante=numero, total=total,
+                                             fecha=fecha).pk
+                for tipo, cuenta, numero, total, fecha in filas
+            ]
+
+    def pendientes(self, consulta=''):
+        respuesta = self.client.get(f'/api/movimientos/pendientes/{consulta}')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        return [(fila['id'], fila['abonado'], fila['pendiente']) for fila in respuesta.data['results']]
+
+    def test_saldos(self):
+        venta, _, _, pagada, _, compra, _, otra, _ = self.ids
+        # Oldest first; fully paid facturas are left out
+        self.assertEqual(self.pendientes(), [
+            (compra, '100.00', '400.00'), (venta, '150.00', '150.00'), (otra, '0.00', '80.00'),
+        ])
+        self.assertEqual(self.pendientes('?tipo=factura_compra'), [(compra, '100.00', '400.00')])
+        self.assertEqual(self.pendientes(f'?cuenta={self.proveedor.pk}&tipo=factura_venta'), [(otra, '0.00', '80.00')])
+        fila = self.client.get('/api/movimientos/pendientes/?tipo=factura_compra').data['results'][0]
+        self.assertEqual((fila['cuenta_nombre'], fila['total']), ('PROVEEDOR', '500.00'))
+
+    def test_paginas_y_errores(self):
+        respuesta = self.client.get('/api/movimientos/pendientes/?page_size=2')
+        self.assertEqual(len(respuesta.data['results']), 2)
+        siguiente = self.client.get(respuesta.data['next']).data
+        self.assertEqual([fila['id'] for fila in siguiente['results']], [self.ids[7]])
+        self.assertIsNone(siguiente['next'])
+        self.assertEqual(self.client.get('/api/movimientos/pendientes/?tipo=cobranza').status_code, 400)
+
+    def test_sigue_a_los_pagos(self):
+        etag = self.client.get('/api/movimientos/pendientes/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/movimientos/', {
+                'tipo': 'cobranza', 'fecha': '2024-05-07', 'cuenta': self.cliente.pk, 'total': '150.00',
+                'numero_comprobante': 1,
+            }, format='json')
+        respuesta = self.client.get('/api/movimientos/pendientes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn(self.ids[0], [fila['id'] for fila in respuesta.data['results']])
+
+
+class SaldoDiferencia(PruebaApi):
+    """Transacciones.actualizar_saldos_diferencia and the Saldo singleton (/api/saldo/)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cuenta = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        with recalculos_suspendidos():
+            cls.factura, cls.cobranza, cls.pago = (
+                Transacciones.objects.create(tipo=tipo, fecha='2024-05-02', cuenta=cuenta, total=total,
+                                             numero_comprobante=1)
+                for tipo, total in (('factura_venta', 500), ('cobranza', 120), ('pago', 30))
+            )
+
+    def saldos(self):
+        return dict(Transacciones.objects.values_list('id', 'saldo_diferencia'))
+
+    def test_patch_saldo_inicial(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.patch('/api/saldo/', {'saldo_inicial': 1000}, format='json')
+        # saldo_inicial - total on every non-factura; saldo_actual from the last one
+        self.assertEqual(self.saldos(), {self.factura.pk: None, self.cobranza.pk: 880, self.pago.pk: 970})
+        self.assertEqual((respuesta.data['saldo_inicial'], respuesta.data['saldo_actual']), (1000, 970))
+
+    def test_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Saldo.objects.update_or_create(id=1, defaults={'saldo_inicial': 200, 'saldo_actual': 0})
+        with CaptureQueriesContext(connection) as capturadas, self.captureOnCommitCallbacks(execute=True):
+            # ids order decides saldo_actual; facturas are ignored
+            self.assertEqual(
+                Transacciones.actualizar_saldos_diferencia([self.pago.pk, self.cobranza.pk, self.factura.pk]), 2
+            )
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "transacciones"') for q in capturadas.captured_queries), 1)
+        self.assertEqual(Saldo.get_singleton().saldo_actual, 80)
+        self.assertEqual(Transacciones.actualizar_saldos_diferencia([self.factura.pk]), 0)
+
+
+class ResumenDiarioRollup(PruebaApi):
+    """ResumenDiario kept by the signals, and GET /api/reportes/resumen/ over it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = Cuentas.objects.create(nombre='CLIENTE', tipo_cuenta='cliente', monto=0)
+        cls.proveedor = Cuentas.objects.create(nombre='PROVEEDOR', tipo_cuenta='proveedor', monto=0)
+        cls.tabla, cls.liston = (
+            Productos.objects.create(tipo_producto=nombre, precio_venta_unitario=1, costo_unitario=1, cantidad=0)
+            for nombre in ('TABLA', 'LISTON')
+        )
+        with recalculos_suspendidos():
+            for numero, (tipo, cuenta, fecha, items) in enumerate((
+                ('factura_venta', cls.cliente, '2024-05-02', [(cls.tabla, 2, 10, 1), (None, 1, 5, 0)]),
+                ('factura_venta', cls.cliente, '2024-06-15', [(cls.tabla, 3, 10, 0)]),
+                ('factura_compra', cls.proveedor, '2024-05-10', [(cls.liston, 4, '2.50', 0)]),
+            ), start=1):
+                transaccion = Transacciones.objects.create(
+                    tipo=tipo, fecha=fecha, cuenta=cuenta, total=1, numero_comprobante=numero
+                )
+                for producto, cantidad, precio, descuento in items:
+                    TransaccionItems.objects.create(
+                        transaccion=transaccion, producto=producto, nombre_producto='ITEM',
+                        cantidad=cantidad, precio_unitario=precio, descuento_item=descuento,
+                    )
+        ResumenDiario.reconstruir()
+
+    def resumen(self, consulta):
+        respuesta = self.client.get(f'/api/reportes/resumen/{consulta}')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return [tuple(fila.values()) for fila in respuesta.json()]
+
+    def test_senales(self):
+        # The fixture skipped the signals: this computes the rest of what they keep
+        self.assertDerivadosCorrectos('monto', 'cantidad', 'estado', 'saldo_diferencia')
+        with self.captureOnCommitCallbacks(execute=True):
+            venta = Transacciones.objects.create(
+                tipo='factura_venta', fecha='2024-05-02', cuenta=self.cliente, total=1, numero_comprobante=9
+            )
+            nuevo, otro = (
+                TransaccionItems.objects.create(transaccion=venta, producto=producto, nombre_producto='ITEM',
+                                                cantidad=1, precio_unitario=7, descuento_item=0)
+                for producto in (self.tabla, self.liston)
+            )
+        # Moved to another day and product, re-priced, and one item deleted
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.cantidad, nuevo.producto, nuevo.descuento_item = Decimal('2.50'), self.liston, 3
+            nuevo.save()
+            otro.delete()
+            venta.fecha = '2024-05-20'
+            venta.save()
+        self.assertEqual(
+            list(ResumenDiario.objects.filter(fecha='2024-05-20').values_list('producto_id', 'cantidad', 'lineas')),
+            [(self.liston.pk, Decimal('2.50'), 1)],
+        )
+        self.assertDerivadosCorrectos()
+
+    def test_agrupar(self):
+        self.assertEqual(self.resumen('?agrupar=mes'), [
+            ('2024-05-01', 'factura_compra', '4.00', '10.00', '0.00', '10.00', 1),
+            ('2024-05-01', 'factura_venta', '3.00', '25.00', '1.00', '24.00', 2),
+            ('2024-06-01', 'factura_venta', '3.00', '30.00', '0.00', '30.00', 1),
+        ])
+        # producto_id 0: the items without a product
+        self.assertEqual(self.resumen('?agrupar=producto&tipo=factura_venta'), [
+            (0, '1.00', '5.00', '0.00', '5.00', 1),
+            (self.tabla.pk, '5.00', '50.00', '1.00', '49.00', 2),
+        ])
+        self.assertEqual(self.resumen('?agrupar=tipo&desde=2024-05-03&hasta=2024-06-30'), [
+            ('factura_compra', '4.00', '10.00', '0.00', '10.00', 1),
+            ('factura_venta', '3.00', '30.00', '0.00', '30.00', 1),
+        ])
+        self.assertEqual(self.resumen(f'?agrupar=cuenta&cuenta={self.proveedor.pk}'), [
+            (self.proveedor.pk, '4.00', '10.00', '0.00', '10.00', 1),
+        ])
+        for consulta in ('?agrupar=anio', '?desde=mayo', '?producto=uno'):
+            self.assertEqual(self.client.get(f'/api/reportes/resumen/{consulta}').status_code, 400, consulta)
+
+
+class ExportacionMovimientos(PruebaApi):
+    """GET /api/movimientos/export/ and api.exportacion.filas_movimientos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cliente = Cuentas.objects.create(nombre='CLIENTE Ñandú', tipo_cuenta='cliente', monto=0)
+        with recalculos_suspendidos():
+            # Two on the same fecha: id breaks the tie, also across batches
+            cls.ventas = [
+                Transacciones.objects.create(tipo='factura_venta', fecha=fecha, cuenta=cls.cliente, total=total,
+                                             numero_comprobante=numero)
+                for numero, (fecha, total) in enumerate(
+                    (('2024-05-03', 300), ('2024-05-01', 100), ('2024-05-03', 50)), start=1
+                )
+            ]
+            cls.cobranza = Transacciones.objects.create(
+                tipo='cobranza', fecha='2024-05-02', cuenta=cls.cliente, total=80, concepto='efectivo, caja'
+            )
+            cls.items = [
+                TransaccionItems.objects.create(transaccion=cls.ventas[0], nombre_producto=nombre,
+                                                precio_unitario=10, cantidad=cantidad)
+                for nombre, cantidad in (('TABLA', 2), ('LISTON', '1.50'))
+            ]
+        cls.orden = [cls.ventas[1].pk, cls.cobranza.pk, cls.ventas[0].pk, cls.ventas[2].pk]
+
+    def exportar(self, consulta=''):
+        respuesta = self.client.get(f'/api/movimientos/export/{consulta}')
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, b''.join(respuesta.streaming_content)
+
+    def csv(self, consulta=''):
+        respuesta, contenido = self.exportar(consulta)
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        texto = contenido.decode('utf-8')
+        self.assertTrue(texto.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(texto[1:])))
+
+    def test_csv(self):
+        encabezado, *filas = self.csv()
+        self.assertEqual(encabezado, [titulo for titulo, _ in COLUMNAS_MOVIMIENTO])
+        self.assertEqual([int(fila[0]) for fila in filas], self.orden)
+        cobranza = dict(zip(encabezado, filas[1]))
+        # Quoted commas, accents, and None as an empty cell
+        self.assertEqual(
+            [cobranza[columna] for columna in ('fecha', 'cuenta', 'total', 'concepto', 'numero_comprobante')],
+            ['2024-05-02', 'CLIENTE Ñandú', '80.00', 'efectivo, caja', ''],
+        )
+
+    def test_items(self):
+        respuesta, _ = self.exportar('?items=1')
+        self.assertIn('movimientos_items.csv', respuesta['Content-Disposition'])
+        encabezado, *filas = self.csv('?items=1')
+        self.assertEqual(encabezado, [titulo for titulo, _ in COLUMNAS_MOVIMIENTO + COLUMNAS_ITEM])
+        posicion = encabezado.index('item_id')
+        # One row per item line; a transaction without items keeps one row
+        self.assertEqual([(int(fila[0]), fila[posicion]) for fila in filas], [
+            (self.orden[0], ''), (self.orden[1], ''),
+            (self.orden[2], str(self.items[0].pk)), (self.orden[2], str(self.items[1].pk)),
+            (self.orden[3], ''),
+        ])
+        self.assertEqual(filas[3][posicion + 2:], ['LISTON', '10.00', '1.50', '0.00'])
+
+    def test_lotes(self):
+        for con_items in (False, True):
+            completo = list(filas_movimientos(Transacciones.objects.all(), con_items=con_items))
+            for chunk_size in (1, 2, 3):
+                self.assertEqual(
+                    list(filas_movimientos(Transacciones.objects.all(), con_items=con_items, chunk_size=chunk_size)),
+                    completo, (con_items, chunk_size),
+                )
+        with self.assertNumQueries(3):
+            # Batches of 2 transactions: 2, 2 and the empty one that ends it
+            list(filas_movimientos(Transacciones.objects.all(), chunk_size=2))
+
+    def test_filtros(self):
+        _, *filas = self.csv('?desde=2024-05-02&hasta=2024-05-02')
+        self.assertEqual([int(fila[0]) for fila in filas], [self.cobranza.pk])
+        _, *filas = self.csv('?tipo=factura_venta&desde=2024-05-03')
+        self.assertEqual([int(fila[0]) for fila in filas], self.orden[2:])
+        for consulta in ('?format=pdf', '?desde=03/05/2024'):
+            self.assertEqual(self.client.get(f'/api/movimientos/export/{consulta}').status_code, 400, consulta)
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        respuesta, contenido = self.exportar('?format=xlsx&items=1')
+        self.assertIn('movimientos_items.xlsx', respuesta['Content-Disposition'])
+        hoja = load_workbook(io.BytesIO(contenido), read_only=True)['Movimientos']
+        encabezado, *filas = hoja.iter_rows(values_only=True)
+        self.assertEqual(list(encabezado), [titulo for titulo, _ in COLUMNAS_MOVIMIENTO + COLUMNAS_ITEM])
+        venta = self.orden[2]
+        self.assertEqual([fila[0] for fila in filas], [*self.orden[:2], venta, venta, self.orden[3]])
+        self.assertEqual(filas[2][encabezado.index('producto')], 'TABLA')
+
+
+class SerializacionRapidaIgual(PruebaApi):
+    """settings.FAST_SERIALIZATION answers list/retrieve byte for byte like the DRF serializers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        with recalculos_suspendidos():
+            cuenta = Cuentas.objects.create(nombre='CLIENTE Ñandú', tipo_cuenta='cliente', monto=0.1 + 0.2)
+            Cuentas.objects.create(nombre='PROVEEDOR', tipo_cuenta='proveedor', monto=-1234.5)
+            cls.producto = Productos.objects.create(tipo_producto='TABLA 1" x 6', precio_venta_unitario=100,
+                                                    costo_unitario=33.333, cantidad=None)
+            Productos.objects.create(tipo_producto='LISTON', precio_venta_unitario=0.1, costo_unitario=0, cantidad=-3)
+            cls.factura = Transacciones.objects.create(
+                tipo='factura_venta', fecha='2024-05-02', cuenta=cuenta, total='1234.50', descuento_total='0.05',
+                numero_comprobante=1, estado='parcial', concepto='con "comillas"',
+            )
+            Transacciones.objects.create(tipo='cobranza', fecha='2024-05-03', cuenta=cuenta, total=7,
+                                         saldo_diferencia=-0.5)
+            for producto, cantidad in ((cls.producto, '2.50'), (None, 1)):
+                TransaccionItems.objects.create(transaccion=cls.factura, producto=producto, nombre_producto='ITEM',
+                                                precio_unitario='10.05', cantidad=cantidad, descuento_item='0.10')
+
+    def test_misma_respuesta(self):
+        item = TransaccionItems.objects.order_by('pk').first()
+        rutas = [
+            '/api/movimientos/', '/api/movimientos/?page_size=1&expand=items', '/api/movimientos/?fields=id,total',
+            f'/api/movimientos/{self.factura.pk}/', f'/api/movimientos/{self.factura.pk}/?fields=fecha&expand=items',
+            '/api/movimientos-items/', f'/api/movimientos-items/{item.pk}/',
+            '/api/cuentas/', '/api/productos/', f'/api/productos/{self.producto.pk}/',
+            # The same 404s as get_object
+            '/api/productos/999999/', '/api/productos/uno/',
+        ]
+        for ruta in rutas:
+            with self.subTest(ruta=ruta):
+                respuestas = []
+                for rapida in (True, False):
+                    with override_settings(FAST_SERIALIZATION=rapida):
+                        respuesta = self.client.get(ruta)
+                    respuestas.append((respuesta.status_code, respuesta.content))
+                self.assertEqual(respuestas[0], respuestas[1])
+
+
+class Benchmark(SimpleTestCase):
+    """manage.py benchmark: a run at the smallest scale, and the comparison with the baseline"""
+
+    def test_corrida_y_baseline(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        resultado, baseline = os.path.join(directorio, 'r.json'), os.path.join(directorio, 'b.json')
+        # Its own SQLite file and caches (the command clears them)
+        correr = partial(
+            en_otro_proceso, DATABASE_URL=f'sqlite:///{directorio}/benchmark.sqlite3',
+            API_CACHE_LOCATION=directorio, API_CACHE=None, REPORT_CACHE=None,
+        )
+        orden = (
+            "from django.core.management import call_command\n"
+            f"call_command('benchmark', scale=['1k'], repeat=1, only=['GET cuentas', 'ventas-producto'], "
+            f"output={resultado!r}, baseline={baseline!r}, %s)"
+        )
+        self.assertIn('Baseline actualizado', correr(orden % 'save_baseline=True'))
+        with open(resultado) as archivo:
+            escala = json.load(archivo)['escalas']['1k']
+        self.assertEqual(escala['filas']['items'], 1000)
+        escenarios = escala['escenarios']
+        self.assertEqual(
+            list(escenarios), ['GET cuentas', 'GET ventas-producto (sin cache)', 'GET ventas-producto (cache)']
+        )
+        self.assertEqual({datos['status'] for datos in escenarios.values()}, {200})
+        self.assertLess(escenarios['GET ventas-producto (cache)']['queries'],
+                        escenarios['GET ventas-producto (sin cache)']['queries'])
+
+        self.assertIn('Sin regresiones', correr(orden % 'tolerance=1000'))
+        # A baseline with fewer queries: the same run is a regression
+        with open(baseline) as archivo:
+            guardado = json.load(archivo)
+        guardado['escalas']['1k']['escenarios']['GET cuentas']['queries'] = 0
+        with open(baseline, 'w') as archivo:
+            json.dump(guardado, archivo)
+        with self.assertRaisesMessage(AssertionError, '1 escenarios empeoraron'):
+            correr(orden % 'tolerance=1000, fail_on_regression=True')
+
+    def test_comparar(self):
+        comando = benchmark.Command(stdout=io.StringIO())
+        comando.options = {'tolerance': 0.25}
+        base = {'ms': 10.0, 'queries': 3}
+        resultados = {'escalas': {'1k': {'escenarios': {
+            'igual': {'ms': 10.5, 'queries': 3},
+            'mas queries': {'ms': 10.0, 'queries': 4},
+            'mas lento': {'ms': 13.0, 'queries': 3},
+            'mejor': {'ms': 5.0, 'queries': 2},
+            'nuevo': {'ms': 99.0, 'queries': 9},
+            'omitido': {'omitido': 'más de 10 filas'},
+        }}}}
+        baseline = {'escalas': {'1k': {'escenarios': {
+            nombre: base for nombre in ('igual', 'mas queries', 'mas lento', 'mejor', 'omitido')
+        }}}}
+        self.assertEqual(comando.comparar(resultados, baseline), 2)
+        # Under a millisecond slower is noise, however large the ratio
+        rapido = {'escalas': {'1k': {'escenarios': {'x': {'ms': 1.5, 'queries': 1}}}}}
+        lento = {'escalas': {'1k': {'escenarios': {'x': {'ms': 0.6, 'queries': 1}}}}}
+        self.assertEqual(comando.comparar(rapido, lento), 0)
+
+    def test_solo_sqlite(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'), self.assertRaisesMessage(CommandError, 'SQLite'):
+            call_command('benchmark', stdout=io.StringIO())
+
+
+class ServidorProduccion(SimpleTestCase):
+    """servidor.py, the launcher Electron runs instead of manage.py runserver"""
+
+    def test_workers(self):
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '3'}):
+            self.assertEqual(servidor.cantidad_workers(), 3)
+        with mock.patch.dict(os.environ), mock.patch('os.cpu_count') as nucleos:
+            os.environ.pop('WEB_CONCURRENCY', None)
+            for cantidad, workers in ((None, 2), (1, 2), (6, 6), (32, 8)):
+                nucleos.return_value = cantidad
+                self.assertEqual(servidor.cantidad_workers(), workers, cantidad)
+
+    def test_argumentos(self):
+        with mock.patch.dict(os.environ, {'SERVER_HOST': '0.0.0.0', 'SERVER_PORT': '9000'}):
+            opciones = servidor.argumentos(['--threads', '2'])
+        self.assertEqual((opciones.host, opciones.port, opciones.threads, opciones.asgi), ('0.0.0.0', 9000, 2, False))
+        for argv in (['--workers', '0'], ['--threads', '-1'], ['--port', 'ocho']):
+            with self.subTest(argv=argv), mock.patch('sys.stderr', io.StringIO()), self.assertRaises(SystemExit):
+                servidor.argumentos(argv)
+
+    def test_configuracion_gunicorn(self):
+        from gunicorn.app.base import BaseApplication
+
+        for argv, clase in (([], 'gthread'), (['--asgi'], 'uvicorn.workers.UvicornWorker')):
+            with self.subTest(argv=argv), mock.patch.object(BaseApplication, 'run', autospec=True) as run:
+                servidor._gunicorn(servidor.argumentos(argv + ['--workers', '3', '--keep-alive', '7']))
+            cfg = run.call_args.args[0].cfg
+            self.assertEqual(
+                (cfg.workers, cfg.worker_class_str, cfg.preload_app, cfg.keepalive, cfg.bind),
+                (3, clase, True, 7, ['127.0.0.1:8000']),
+            )
+
+    def test_stdin(self):
+        for entrada in ('hola\n STOP \nsigue\n', 'hola\n'):
+            detenido = threading.Event()
+            with self.subTest(entrada=entrada), mock.patch('sys.stdin', io.StringIO(entrada)):
+                servidor.escuchar_stdin(detenido.set)
+                self.assertTrue(detenido.wait(5))
+
+    @skipIf(servidor.WINDOWS, 'gunicorn')
+    def test_apagado_por_stdin(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        with socket.socket() as libre:
+            libre.bind(('127.0.0.1', 0))
+            puerto = libre.getsockname()[1]
+        # A database without tables: the users can't be created, and it serves anyway
+        env = {**os.environ, 'DATABASE_URL': f'sqlite:///{directorio}/vacia.sqlite3', 'API_CACHE': 'locmem'}
+        proceso = subprocess.Popen(
+            [sys.executable, 'servidor.py', '--port', str(puerto), '--workers', '1', '--stdin-control'],
+            cwd=settings.BASE_DIR, env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, text=True,
+        )
+        self.addCleanup(proceso.kill)
+        url = f'http://127.0.0.1:{puerto}/api/cuentas/'
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(url, timeout=5)
+            except urllib.error.HTTPError as respuesta:
+                self.assertEqual(respuesta.code, 401)
+                break
+            except OSError:
+                if proceso.poll() is not None:
+                    self.fail(proceso.stderr.read())
+                time.sleep(0.1)
+        else:
+            self.fail('El servidor no respondió')
+        proceso.stdin.write('stop\n')
+        proceso.stdin.flush()
+        self.assertEqual(proceso.wait(30), 0)
+        self.assertIn('No se pudieron crear los usuarios iniciales', proceso.stderr.read())
+
+
+class ArranqueEnFrio(PruebaApi):
+    """Importing api.views without queries or connector modules; ensure_users; import_times"""
+
+    def test_importar_views(self):
+        salida = en_otro_proceso(
+            'import sys\n'
+            'from django.db import connection\n'
+            'consultas = []\n'
+            'with connection.execute_wrapper(lambda execute, *args: consultas.append(1) or execute(*args)):\n'
+            '    import api.views\n'
+            "print(len(consultas), *(modulo in sys.modules for modulo in ('MySQLdb', 'sshtunnel', 'paramiko')))"
+        )
+        self.assertEqual(salida.split(), ['0', 'False', 'False', 'False'])
+
+    def test_ensure_users(self):
+        salida = io.StringIO()
+        call_command('ensure_users', stdout=salida)
+        self.assertEqual(salida.getvalue().splitlines(), ['admin: creado', 'felipe: creado'])
+        usuario = get_user_model().objects.get(username='admin')
+        usuario.set_password('otra')
+        usuario.is_superuser = False
+        usuario.save()
+        salida = io.StringIO()
+        call_command('ensure_users', stdout=salida)
+        self.assertEqual(salida.getvalue().splitlines(), ['admin: ya existe', 'felipe: ya existe'])
+        call_command('ensure_users', reset=True, stdout=io.StringIO())
+        usuario.refresh_from_db()
+        self.assertTrue(usuario.is_superuser and usuario.check_password('admin1234'))
+
+    def test_import_times(self):
+        salida = io.StringIO()
+        call_command('import_times', module='api.usuarios', limit=10_000, stdout=salida)
+        self.assertIn('módulos importados en', salida.getvalue())
+        self.assertRegex(salida.getvalue(), r'\d+\.\d +\d+\.\d  api\.usuarios\n')
+        with self.assertRaisesMessage(CommandError, 'ModuleNotFoundError'):
+            call_command('import_times', module='api.no_existe', stdout=io.StringIO())
@@ -1,7 +1,9 @@
 from django.urls import path, include
 from rest_framework import routers
 from .views import (TransaccionesViewSet, CuentasViewSet, ProductosViewSet, 
-                   TransaccionItemsViewSet, VentasPorProductoAPIView, SaldoSingletonView, 
+                   TransaccionItemsViewSet, VentasPorProductoAPIView, ReportesCacheStatsAPIView,
+                   ResumenAPIView,
+                   SaldoSingletonView, 
                    test_mysql_connection, test_mysql_ssh_tunnel, ssh_status, ssh_install, 
                    ssh_start, create_ssh_tunnel, create_admin_users, create_user, list_users)
 
@@ -18,6 +20,8 @@ urlpatterns = [
         VentasPorProductoAPIView.as_view(),
         name='ventas-producto'
     ),
+    path('reportes/resumen/', ResumenAPIView.as_view(), name='reportes-resumen'),
+    path('reportes/cache-stats/', ReportesCacheStatsAPIView.as_view(), name='reportes-cache-stats'),
     path('saldo/', SaldoSingletonView.as_view(), name='saldo-singleton'),
     path('test-mysql-connection/', test_mysql_connection, name='test-mysql-connection'),
     path('test-mysql-ssh-tunnel/', test_mysql_ssh_tunnel, name='test-mysql-ssh-tunnel'),
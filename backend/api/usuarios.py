@@ -0,0 +1,34 @@
+"""
+Default superusers of a new install.
+
+Created by an explicit, idempotent step (servidor.py on start, `manage.py
+ensure_users`, POST /api/create-admin-users/) instead of on import of
+api/views.py, which ran queries and PBKDF2 hashing in every process and command.
+"""
+from django.contrib.auth import get_user_model
+
+# (username, email, password)
+USUARIOS_INICIALES = (
+    ('admin', 'admin@example.com', 'admin1234'),
+    ('felipe', 'felipe@example.com', 'admin'),
+)
+
+
+def crear_usuarios_iniciales(restablecer=False):
+    """
+    Create the missing default superusers; restablecer=True also resets the
+    password and flags of the existing ones. {username: created}
+    """
+    User = get_user_model()
+    existentes = User.objects.in_bulk([u for u, _, _ in USUARIOS_INICIALES], field_name='username')
+    creados = {}
+    for username, email, password in USUARIOS_INICIALES:
+        usuario = existentes.get(username)
+        creados[username] = usuario is None
+        if usuario is None:
+            User.objects.create_superuser(username, email, password)
+        elif restablecer:
+            usuario.set_password(password)
+            usuario.is_staff = usuario.is_superuser = usuario.is_active = True
+            usuario.save()
+    return creados
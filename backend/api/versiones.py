@@ -0,0 +1,43 @@
+"""
+Per-table change versions used for ETags (see ConditionalGetMixin in views).
+
+Each table has an opaque token in the Django cache that is replaced whenever
+the table changes (signals, bulk writes, recomputes). A missing token (cache
+restart, eviction) is simply regenerated, which only costs one full response.
+Every process that writes must share the cache (API_CACHE=file, the
+default, or db): a version bumped by a management command or another
+worker in a process-local cache would leave the others answering 304.
+"""
+import hashlib
+import uuid
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIJO = 'api:version:'
+
+
+def _nueva_version(tabla):
+    version = uuid.uuid4().hex
+    cache.set(PREFIJO + tabla, version, timeout=None)
+    return version
+
+
+def _invalidar(tablas):
+    for tabla in tablas:
+        _nueva_version(tabla)
+
+
+def invalidar_tablas(*tablas):
+    """Bump the version of the tables once the current transaction commits"""
+    if tablas:
+        transaction.on_commit(partial(_invalidar, set(tablas)))
+
+
+def version_tablas(*tablas):
+    """Combined version of the tables, one cache round trip"""
+    claves = [PREFIJO + tabla for tabla in tablas]
+    versiones = cache.get_many(claves)
+    partes = [versiones.get(PREFIJO + tabla) or _nueva_version(tabla) for tabla in tablas]
+    return hashlib.sha1(':'.join(partes).encode()).hexdigest()
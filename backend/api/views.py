@@ -1,16 +1,18 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
-import MySQLdb
-from sshtunnel import SSHTunnelForwarder
-import subprocess
 import sys
 import platform
+import hashlib
 from threading import Thread
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
@@ -19,28 +21,79 @@ from django.contrib.auth import authenticate
 import logging
 from django.contrib.auth import get_user_model
 
-from .models import Cuentas, Productos, TransaccionItems, Transacciones, Saldo
+from .busqueda import LIMITE, MAX_LIMITE, indice_productos
+from .pagination import KeysetPagination
+from .serializacion import SerializacionRapida, SerializacionRapidaMixin
+from .exportacion import ExportNegotiation, filas_movimientos, respuesta_csv, respuesta_xlsx
+from .importacion import ImportadorMovimientos, leer_filas
+from .operaciones import MAX_OPERACIONES, aplicar_operaciones
+from .usuarios import crear_usuarios_iniciales
+from .versiones import version_tablas
+from .reportes import ReporteCacheado, VENTAS_PRODUCTO
+from .models import Cuentas, Productos, ResumenDiario, TransaccionItems, Transacciones, Saldo
 from .serializers import (CuentasSerializer, ProductosSerializer,
                           TransaccionItemsSerializer, TransaccionesSerializer,
                           TransaccionesWriteSerializer, VentaProductoSerializer,
-                          SaldoSerializer)
+                          SaldoSerializer, FacturaPendienteSerializer)
+
+logger = logging.getLogger(__name__)
 
 # Global reference to keep the tunnel alive (not recommended for production, but works for demo/dev)
 ssh_tunnel_server = None
 
-User = get_user_model()
-if not User.objects.filter(username="admin").exists():
-    User.objects.create_superuser("admin", "admin@example.com", "admin1234")
-if not User.objects.filter(username="felipe").exists():
-    User.objects.create_superuser("felipe", "felipe@example.com", "admin")
 
+class ConditionalGetMixin:
+    """
+    ETag / If-None-Match for list and retrieve. The ETag is derived from the
+    change versions of `etag_tablas` (bumped by the model signals, see
+    api/versiones.py) and the full request path, so an unchanged resource is
+    answered with 304 before touching the database or the serializer.
+    """
+    etag_tablas = ()
+
+    def respuesta_condicional(self, request, generar, tablas=None):
+        version = version_tablas(*(tablas or self.etag_tablas))
+        etag = '"%s"' % hashlib.sha1(f'{version}:{request.get_full_path()}'.encode()).hexdigest()
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [e.strip().removeprefix('W/') for e in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response = generar()
+        if response.status_code == status.HTTP_200_OK:
+            for header, valor in headers.items():
+                response[header] = valor
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.respuesta_condicional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respuesta_condicional(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
 
-class TransaccionesViewSet(viewsets.ModelViewSet):
+
+class TransaccionesViewSet(ConditionalGetMixin, SerializacionRapidaMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = Transacciones.objects.all().select_related('cuenta').prefetch_related('transaccionitems_set')
+    queryset = Transacciones.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('fecha', 'id')
+    etag_tablas = ('transacciones', 'transaccion_items')
+    # Nested fields: in the default output, left out by a ?fields= without
+    # them, and ?expand= adds them back to one
+    expandibles = ('items',)
+    # Serializer fields the queryset never annotates: always left out, so not selectable
+    no_anotados = ('cantidad_productos',)
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Only the columns and relations of the requested fields
+            campos = self.campos_serializados()
+            rapida = SerializacionRapida.para(TransaccionesSerializer, campos)
+            queryset = queryset.only(*rapida.columnas, *self.keyset_ordering)
+            if 'items' in campos:
+                queryset = queryset.prefetch_related('transaccionitems_set')
+        else:
+            queryset = queryset.select_related('cuenta').prefetch_related('transaccionitems_set')
         tipo = self.request.query_params.get('tipo')
         cuenta = self.request.query_params.get('cuenta')
         estado = self.request.query_params.get('estado')
@@ -50,7 +103,6 @@ class TransaccionesViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(cuenta_id=cuenta)
         if estado:
             queryset = queryset.filter(estado=estado)
-        print('[BACKEND] get_queryset:', list(queryset.values('id','tipo','cuenta_id','estado','total','numero_comprobante')), flush=True)
         return queryset
 
     def get_serializer_class(self):
@@ -58,6 +110,38 @@ class TransaccionesViewSet(viewsets.ModelViewSet):
             return TransaccionesWriteSerializer
         return TransaccionesSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('campos', self.campos_serializados())
+        return super().get_serializer(*args, **kwargs)
+
+    def campos_serializados(self):
+        """
+        Output fields of list/retrieve, in serializer order:
+        ?fields=id,fecha,tipo,total (default: all, items included) plus ?expand=items
+        GET /api/movimientos/?fields=fecha,tipo,cuenta,total
+        GET /api/movimientos/5/?fields=id,total&expand=items
+        """
+        if getattr(self, '_campos', None) is None:
+            params = self.request.query_params
+            disponibles = [c for c in TransaccionesSerializer().fields if c not in self.no_anotados]
+            fields = [c.strip() for c in params.get('fields', '').split(',') if c.strip()]
+            expand = [c.strip() for c in params.get('expand', '').split(',') if c.strip()]
+            errores = {}
+            invalidos = [c for c in fields if c not in disponibles]
+            if invalidos:
+                errores['fields'] = [f"Campos desconocidos: {', '.join(invalidos)}"]
+            invalidos = [c for c in expand if c not in self.expandibles]
+            if invalidos:
+                errores['expand'] = [
+                    f"No se puede expandir: {', '.join(invalidos)} (opciones: {', '.join(self.expandibles)})"
+                ]
+            if errores:
+                raise ValidationError(errores)
+            pedidos = set(fields or disponibles) | set(expand)
+            self._campos = tuple(c for c in disponibles if c in pedidos)
+        return self._campos
+
     def perform_create(self, serializer):
         with transaction.atomic():
             instance = serializer.save()
@@ -81,18 +165,12 @@ class TransaccionesViewSet(viewsets.ModelViewSet):
         """
         try:
             with transaction.atomic():
-                cuentas = Cuentas.objects.all()
-                updated_count = 0
-
-                for cuenta in cuentas:
-                    old_monto = cuenta.monto
-                    new_monto = cuenta.recalcular_monto()
-                    if old_monto != new_monto:
-                        updated_count += 1
+                updated_count, total_accounts = Cuentas.recalcular_montos()
 
                 return Response({
                     'message': f'Balances recalculados exitosamente para {updated_count} cuentas',
-                    'total_accounts': cuentas.count()
+                    'total_accounts': total_accounts,
+                    'unchanged_accounts': total_accounts - updated_count
                 }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -100,6 +178,111 @@ class TransaccionesViewSet(viewsets.ModelViewSet):
                 'error': f'Error recalculando balances: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'])
+    def pendientes(self, request):
+        """
+        Open invoices with total, abonado and pendiente, oldest first
+        GET /api/movimientos/pendientes/?tipo=factura_venta&cuenta=3&page_size=50
+        Always paginated (cursor over fecha, id).
+        """
+        return self.respuesta_condicional(
+            request, lambda: self._pendientes(request), tablas=('transacciones', 'cuentas')
+        )
+
+    def _pendientes(self, request):
+        tipo = request.query_params.get('tipo')
+        tipos = [tipo] if tipo else list(Transacciones.TIPO_PAGO_FACTURA)
+        if any(t not in Transacciones.TIPO_PAGO_FACTURA for t in tipos):
+            return Response({
+                'error': 'tipo debe ser factura_venta o factura_compra'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        queryset = Transacciones.objects.filter(tipo__in=tipos)
+        cuenta = request.query_params.get('cuenta')
+        if cuenta:
+            queryset = queryset.filter(cuenta_id=cuenta)
+        queryset = Transacciones.anotar_abonado(queryset).filter(pendiente__gt=0).values(
+            'id', 'tipo', 'fecha', 'cuenta_id', 'cuenta__nombre', 'numero_comprobante',
+            'estado', 'total', 'abonado', 'pendiente'
+        )
+
+        paginator = KeysetPagination()
+        paginator.opt_in = False
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = FacturaPendienteSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], content_negotiation_class=ExportNegotiation)
+    def export(self, request):
+        """
+        Stream movimientos as a file, with constant memory
+        GET /api/movimientos/export/?format=csv|xlsx&desde=2024-01-01&hasta=2024-12-31&items=1
+        Accepts the same tipo/cuenta/estado filters as the list. items=1 writes
+        one row per item line with the transaction columns repeated.
+        """
+        formato = request.query_params.get('format', 'csv')
+        if formato not in ('csv', 'xlsx'):
+            return Response({
+                'error': 'format debe ser csv o xlsx'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset()
+        campo_fecha = Transacciones._meta.get_field('fecha')
+        try:
+            for param, lookup in (('desde', 'fecha__gte'), ('hasta', 'fecha__lte')):
+                if request.query_params.get(param):
+                    queryset = queryset.filter(**{lookup: campo_fecha.to_python(request.query_params[param])})
+        except DjangoValidationError:
+            return Response({
+                'error': 'Las fechas deben tener formato AAAA-MM-DD'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        con_items = request.query_params.get('items', '').lower() in ('1', 'true', 'si')
+        filas = filas_movimientos(queryset, con_items=con_items)
+        nombre = 'movimientos' + ('_items' if con_items else '')
+        if formato == 'xlsx':
+            return respuesta_xlsx(filas, nombre)
+        return respuesta_csv(filas, nombre)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create/update/delete many movimientos in one request and one transaction
+        POST /api/movimientos/bulk/  {"operations": [{"op": "create", "data": {...}},
+                                                     {"op": "update", "id": 5, "data": {...}},
+                                                     {"op": "delete", "id": 7}]}
+        All or nothing: 400 with the errors per operation if any is invalid.
+        """
+        operaciones = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        if not isinstance(operaciones, list) or not operaciones:
+            return Response({
+                'error': 'Se requiere una lista de operaciones en "operations"'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(operaciones) > MAX_OPERACIONES:
+            return Response({
+                'error': f'Máximo {MAX_OPERACIONES} operaciones por pedido'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        ok, resultados = aplicar_operaciones(operaciones)
+        return Response(
+            {'results': resultados},
+            status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def importar(self, request):
+        """
+        Bulk import of historical movimientos from a .csv/.xlsx upload
+        (same layout as export?items=1, see api/importacion.py)
+        POST /api/movimientos/import/  multipart: archivo=<file>, dry_run=1
+        """
+        archivo = request.FILES.get('archivo')
+        if archivo is None or not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            return Response({
+                'error': 'Se requiere un archivo .csv o .xlsx en el campo "archivo"'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.data.get('dry_run', '').lower() in ('1', 'true', 'si')
+        resumen = ImportadorMovimientos(dry_run=dry_run).importar(leer_filas(archivo.file, archivo.name))
+        return Response(resumen, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'])
     def recalculate_account_balance(self, request, pk=None):
         """
@@ -131,7 +314,7 @@ class TransaccionesViewSet(viewsets.ModelViewSet):
 
     def create(self, request, *args, **kwargs):
         # LOG: muestra el payload recibido antes de cualquier procesamiento
-        print("DEBUG BACKEND - RAW PAYLOAD:", request.data)
+        logger.debug("RAW PAYLOAD: %s", request.data)
 
         tipo = request.data.get('tipo')
         carrito = request.data.get('carrito', None)
@@ -191,7 +374,8 @@ class TransaccionesViewSet(viewsets.ModelViewSet):
                 if factura:
                     factura.actualizar_estado_pago()
             if tipo in ['factura_venta', 'factura_compra'] and carrito:
-                print("DEBUG BACKEND - PROCESSED CARRITO:", carrito)
+                logger.debug("PROCESSED CARRITO: %s", carrito)
+                lineas = []
                 for item in carrito:
                     producto_id = None
                     cantidad = 1
@@ -201,33 +385,42 @@ class TransaccionesViewSet(viewsets.ModelViewSet):
                             cantidad = int(item.get('cantidad', 1))
                         except Exception:
                             cantidad = 1
-                    if not producto_id:
-                        continue
                     try:
-                        producto = Productos.objects.get(pk=producto_id)
-                    except Productos.DoesNotExist:
+                        producto_id = int(producto_id)
+                    except (TypeError, ValueError):
                         continue
-                    TransaccionItems.objects.create(
+                    lineas.append((producto_id, cantidad))
+                # Un solo SELECT para todos los productos y un solo INSERT para los items
+                productos = Productos.objects.in_bulk({pid for pid, _ in lineas})
+                TransaccionItems.crear_en_lote(transaccion, [
+                    TransaccionItems(
                         transaccion=transaccion,
-                        producto=producto,
-                        nombre_producto=producto.tipo_producto,
-                        precio_unitario=producto.precio_venta_unitario,
+                        producto=productos[producto_id],
+                        nombre_producto=productos[producto_id].tipo_producto,
+                        precio_unitario=productos[producto_id].precio_venta_unitario,
                         cantidad=cantidad
                     )
+                    for producto_id, cantidad in lineas
+                    if producto_id in productos
+                ])
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class TransaccionItemsViewSet(viewsets.ModelViewSet):
+class TransaccionItemsViewSet(ConditionalGetMixin, SerializacionRapidaMixin, viewsets.ModelViewSet):
     queryset = TransaccionItems.objects.all()
     serializer_class = TransaccionItemsSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    etag_tablas = ('transaccion_items',)
 
 
-class CuentasViewSet(viewsets.ModelViewSet):
+class CuentasViewSet(ConditionalGetMixin, SerializacionRapidaMixin, viewsets.ModelViewSet):
     queryset = Cuentas.objects.all()
     serializer_class = CuentasSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    etag_tablas = ('cuentas',)
 
     @action(detail=True, methods=['post'])
     def recalculate_balance(self, request, pk=None):
@@ -254,7 +447,7 @@ class CuentasViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ProductosViewSet(viewsets.ModelViewSet):
+class ProductosViewSet(ConditionalGetMixin, SerializacionRapidaMixin, viewsets.ModelViewSet):
     """
     CRUD completo para Movimientos:
       - list/retrieve
@@ -264,45 +457,56 @@ class ProductosViewSet(viewsets.ModelViewSet):
     queryset = Productos.objects.all()
     serializer_class = ProductosSerializer
     permission_classes = [IsAuthenticated]
-
-    def list(self, request, *args, **kwargs):
-        # Log and recalculate cantidad for all products before returning
-        import logging
-        logger = logging.getLogger(__name__)
-        for producto in Productos.objects.all():
-            logger.info(f"Verificando cantidad para producto {producto.id} ({producto.tipo_producto}) antes de listar")
-            # If you want to force recalculation and log, uncomment the next line:
-            # producto.recalcular_cantidad()
-        return super().list(request, *args, **kwargs)
+    pagination_class = KeysetPagination
+    etag_tablas = ('productos',)
 
     def create(self, request, *args, **kwargs):
-        print("DEBUG BACKEND - PRODUCTO PAYLOAD:", request.data)
+        logger.debug("PRODUCTO PAYLOAD: %s", request.data)
         return super().create(request, *args, **kwargs)
 
     def update(self, request, *args, **kwargs):
-        print("DEBUG BACKEND - PRODUCTO PAYLOAD (UPDATE):", request.data)
+        logger.debug("PRODUCTO PAYLOAD (UPDATE): %s", request.data)
         return super().update(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Typeahead over tipo_producto: every word typed must start a word of the name
+        GET /api/productos/search/?q=tir 2x4&limit=20
+        Best matches first, at most `limit` (default 20, max 100).
+        """
+        return self.respuesta_condicional(request, lambda: self._search(request))
+
+    def _search(self, request):
+        try:
+            limite = int(request.query_params.get('limit', LIMITE))
+        except ValueError:
+            return Response({'error': 'limit debe ser un número'}, status=status.HTTP_400_BAD_REQUEST)
+        limite = max(1, min(limite, MAX_LIMITE))
+        ids = indice_productos.buscar(request.query_params.get('q', ''), limite)
+        productos = Productos.objects.in_bulk(ids)
+        return Response(ProductosSerializer([productos[pk] for pk in ids if pk in productos], many=True).data)
+
     @action(detail=False, methods=['post'])
     def batch_recalculate_quantities(self, request):
         """
         Manually recalculate all product quantities
         POST /api/productos/batch_recalculate_quantities/
+        Optional payload: {"ids": [1, 2, 3]} to recalculate only those products
         """
+        ids = request.data.get('ids') if hasattr(request.data, 'get') else None
+        if ids is not None and not isinstance(ids, list):
+            return Response({
+                'error': 'ids debe ser una lista de ids de productos'
+            }, status=status.HTTP_400_BAD_REQUEST)
         try:
             with transaction.atomic():
-                productos = Productos.objects.all()
-                updated_count = 0
-
-                for producto in productos:
-                    old_cantidad = producto.cantidad
-                    new_cantidad = producto.recalcular_cantidad()
-                    if old_cantidad != new_cantidad:
-                        updated_count += 1
+                updated_count, total_products = Productos.recalcular_cantidades(ids=ids)
 
                 return Response({
                     'message': f'Cantidades recalculadas exitosamente para {updated_count} productos',
-                    'total_products': productos.count()
+                    'total_products': total_products,
+                    'unchanged_products': total_products - updated_count
                 }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -311,19 +515,112 @@ class ProductosViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _calcular_ventas_por_producto():
+    qs = (
+        TransaccionItems.objects
+        .filter(transaccion__tipo='factura_venta')
+        .values('nombre_producto')
+        .annotate(total_vendido=Sum('cantidad'))
+        .order_by('-total_vendido')
+    )
+    return list(VentaProductoSerializer(qs, many=True).data)
+
+
+reporte_ventas_por_producto = ReporteCacheado(
+    'ventas_producto', (VENTAS_PRODUCTO,), _calcular_ventas_por_producto
+)
+
+
 class VentasPorProductoAPIView(APIView):
     permission_classes = [IsAuthenticated]  # o el permiso que necesites
 
     def get(self, request, *args, **kwargs):
-        qs = (
-            TransaccionItems.objects
-            .filter(transaccion__tipo='factura_venta')
-            .values('nombre_producto')
-            .annotate(total_vendido=Sum('cantidad'))
-            .order_by('-total_vendido')
+        # Cacheado hasta que cambien items o facturas de venta (ver api/reportes.py)
+        data, hit = reporte_ventas_por_producto.obtener()
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+
+class ReportesCacheStatsAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Hit/miss counters of the cached reports
+        GET /api/reportes/cache-stats/
+        """
+        return Response([reporte_ventas_por_producto.estadisticas()])
+
+
+class ResumenAPIView(ConditionalGetMixin, APIView):
+    """
+    Sales/purchases totals for any date range, read from the resumen_diario
+    rollup instead of scanning transaccion_items.
+    GET /api/reportes/resumen/?desde=2025-01-01&hasta=2025-03-31&tipo=factura_venta&agrupar=mes
+    """
+    permission_classes = [IsAuthenticated]
+    etag_tablas = (ResumenDiario._meta.db_table,)
+    # agrupar -> columns of each result row
+    AGRUPACIONES = {
+        'dia': ('fecha', 'tipo'),
+        'mes': ('mes', 'tipo'),
+        'producto': ('producto_id',),
+        'cuenta': ('cuenta_id',),
+        'tipo': ('tipo',),
+    }
+
+    def get(self, request):
+        return self.respuesta_condicional(request, lambda: self.generar(request))
+
+    def generar(self, request):
+        params = request.query_params
+        agrupar = params.get('agrupar', 'dia')
+        if agrupar not in self.AGRUPACIONES:
+            return Response({
+                'error': f"agrupar debe ser uno de: {', '.join(self.AGRUPACIONES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        filtros = {}
+        campo_fecha = ResumenDiario._meta.get_field('fecha')
+        try:
+            for param, lookup in (('desde', 'fecha__gte'), ('hasta', 'fecha__lte')):
+                if params.get(param):
+                    filtros[lookup] = campo_fecha.to_python(params[param])
+            for param, lookup in (('cuenta', 'cuenta_id'), ('producto', 'producto_id')):
+                if params.get(param):
+                    filtros[lookup] = int(params[param])
+        except (ValueError, DjangoValidationError):
+            return Response({
+                'error': 'Fechas (AAAA-MM-DD) o ids inválidos'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('tipo'):
+            filtros['tipo__in'] = params['tipo'].split(',')
+
+        columnas = self.AGRUPACIONES[agrupar]
+        qs = ResumenDiario.objects.filter(**filtros)
+        if agrupar == 'mes':
+            qs = qs.annotate(mes=TruncMonth('fecha'))
+        filas = (
+            qs.values(*columnas)
+            .annotate(
+                cantidad=Sum('cantidad'),
+                bruto=Sum('bruto'),
+                descuento=Sum('descuento'),
+                lineas=Sum('lineas'),
+            )
+            .annotate(neto=F('bruto') - F('descuento'))
+            .order_by(*columnas)
         )
-        serializer = VentaProductoSerializer(qs, many=True)
-        return Response(serializer.data)
+        return Response([
+            {
+                **{columna: fila[columna] for columna in columnas},
+                'cantidad': f"{fila['cantidad']:.2f}",
+                'bruto': f"{fila['bruto']:.2f}",
+                'descuento': f"{fila['descuento']:.2f}",
+                'neto': f"{fila['neto']:.2f}",
+                'lineas': fila['lineas'],
+            }
+            for fila in filas
+        ])
 
 
 class SaldoSingletonView(APIView):
@@ -336,10 +633,16 @@ class SaldoSingletonView(APIView):
 
     def patch(self, request):
         saldo = Saldo.get_singleton()
+        saldo_inicial_previo = saldo.saldo_inicial
         serializer = SaldoSerializer(saldo, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+            with transaction.atomic():
+                serializer.save()
+                if saldo.saldo_inicial != saldo_inicial_previo:
+                    # saldo_diferencia depende de saldo_inicial
+                    Transacciones.actualizar_todos_saldos_diferencia()
+                    saldo.refresh_from_db()
+            return Response(SaldoSerializer(saldo).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -350,6 +653,8 @@ def test_mysql_connection(request):
     Prueba la conexión a una base de datos MySQL remota.
     Espera: {host, port, mysqlUser, mysqlPassword}
     """
+    import MySQLdb
+
     data = request.data
     host = data.get('host')
     port = int(data.get('port', 3306))
@@ -379,6 +684,9 @@ def test_mysql_ssh_tunnel(request):
         mysql_host, mysql_port, mysqlUser, mysqlPassword
     }
     """
+    import MySQLdb
+    from sshtunnel import SSHTunnelForwarder
+
     data = request.data
     ssh_host = data.get('ssh_host')
     ssh_port = int(data.get('ssh_port', 22))
@@ -417,6 +725,7 @@ def ssh_status(request):
     Devuelve el estado del servicio OpenSSH Server en Windows o Linux.
     """
     import platform as pl
+    import subprocess
     os_name = pl.system().lower()
     if os_name == "windows":
         try:
@@ -458,6 +767,7 @@ def ssh_install(request):
     Instala el OpenSSH Server en Windows o muestra instrucciones en Linux.
     """
     import platform as pl
+    import subprocess
     os_name = pl.system().lower()
     if os_name == "windows":
         try:
@@ -484,6 +794,7 @@ def ssh_start(request):
     Inicia el servicio OpenSSH Server en Windows o Linux.
     """
     import platform as pl
+    import subprocess
     os_name = pl.system().lower()
     if os_name == "windows":
         try:
@@ -512,6 +823,7 @@ def create_ssh_tunnel(request):
     Solo debe llamarse en el modo HOST.
     """
     import socket
+    from sshtunnel import SSHTunnelForwarder
 
     global ssh_tunnel_server
 
@@ -594,42 +906,8 @@ def create_admin_users(request):
     Force creation of admin users and reset their passwords
     """
     try:
-        User = get_user_model()
-        
-        # Create or get admin user
-        admin_user, admin_created = User.objects.get_or_create(
-            username="admin",
-            defaults={
-                'email': "admin@example.com",
-                'is_staff': True,
-                'is_superuser': True,
-                'is_active': True
-            }
-        )
-        # Always set password (even if user exists)
-        admin_user.set_password("admin1234")
-        admin_user.is_staff = True
-        admin_user.is_superuser = True
-        admin_user.is_active = True
-        admin_user.save()
-        
-        # Create or get felipe user
-        felipe_user, felipe_created = User.objects.get_or_create(
-            username="felipe",
-            defaults={
-                'email': "felipe@example.com",
-                'is_staff': True,
-                'is_superuser': True,
-                'is_active': True
-            }
-        )
-        # Always set password (even if user exists)
-        felipe_user.set_password("admin")
-        felipe_user.is_staff = True
-        felipe_user.is_superuser = True
-        felipe_user.is_active = True
-        felipe_user.save()
-        
+        creados = crear_usuarios_iniciales(restablecer=True)
+        admin_created, felipe_created = creados['admin'], creados['felipe']
         return Response({
             'success': True,
             'admin_created': admin_created,
@@ -42,6 +42,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.RequestMetricsMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -53,6 +54,15 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Métricas por request (tiempo, cantidad de queries, tiempo de DB), ver api/middleware.py
+REQUEST_METRICS = {
+    "ENABLED": os.getenv("REQUEST_METRICS", "0") == "1",
+    "SLOW_REQUEST_MS": int(os.getenv("REQUEST_METRICS_SLOW_MS", "500")),
+    "MAX_QUERIES": int(os.getenv("REQUEST_METRICS_MAX_QUERIES", "50")),
+    "SLOWEST_SQL": int(os.getenv("REQUEST_METRICS_SLOWEST_SQL", "3")),
+    "HEADERS": True,
+}
+
 ROOT_URLCONF = "backend.urls"
 
 TEMPLATES = [
@@ -78,6 +88,51 @@ DATABASES = {
     'default': dj_database_url.config(default=os.environ.get('DATABASE_URL'))
 }
 
+# Cache (versiones para ETag, ver api/versiones.py, y reportes cacheados, ver
+# api/reportes.py). Backend: file (por defecto), db o locmem. Tiene que ser
+# compartida por todos los procesos que escriben en la base: los workers del
+# servidor y también los comandos de manage.py (import_products,
+# import_movimientos, seed_dataset, rebuild_rollup, shell). locmem sólo sirve
+# con un único proceso; db requiere `python manage.py createcachetable`.
+def _cache(backend, nombre):
+    if backend == "file":
+        return {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("API_CACHE_LOCATION", str(BASE_DIR / "cache")) + f"/{nombre}",
+        }
+    if backend == "db":
+        return {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": os.getenv("API_CACHE_TABLE", "api_cache"),
+            "KEY_PREFIX": nombre,
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": nombre,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+
+
+API_CACHE = os.getenv("API_CACHE", "file")
+CACHES = {
+    "default": _cache(API_CACHE, "default"),
+    "reportes": _cache(os.getenv("REPORT_CACHE", API_CACHE), "reportes"),
+}
+
+# Reportes cacheados, en el alias "reportes" (la variable REPORT_CACHE elige
+# otro backend, con los mismos valores y condiciones que API_CACHE): segundos
+# que se puede seguir sirviendo un resultado después de invalidado (0 = siempre
+# fresco) y vida máxima de cada entrada.
+REPORT_CACHE = {
+    "ALIAS": "reportes",
+    "MAX_STALENESS": int(os.getenv("REPORT_CACHE_MAX_STALENESS", "0")),
+    "TIMEOUT": int(os.getenv("REPORT_CACHE_TIMEOUT", "3600")),
+}
+
+# list/retrieve de los ViewSets armados desde .values() en lugar de los
+# serializers de DRF (misma salida, ver api/serializacion.py). 0 para desactivar.
+FAST_SERIALIZATION = os.getenv("API_FAST_SERIALIZATION", "1") == "1"
+
 # REST Framework & JWT
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
@@ -21,4 +21,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Production server for the Django backend, used by Electron instead of
+`manage.py runserver` (desktop and host mode, several PCs on the LAN).
+
+    python servidor.py                      # WSGI, 127.0.0.1:8000
+    python servidor.py --host 0.0.0.0       # host mode
+    python servidor.py --asgi --workers 4
+
+Linux/macOS: gunicorn with preloaded app, `--workers` processes (one per core
+by default) of `--threads` threads each and keep-alive. Windows, where gunicorn
+doesn't run: waitress with `--workers * --threads` threads in one process
+(uvicorn processes with --asgi). Before serving, the missing default users
+are created once (api/usuarios.py).
+
+Graceful shutdown: SIGTERM/SIGINT, or with `--stdin-control` the line `stop`
+(or closing stdin, e.g. if Electron dies) on standard input. In-flight requests
+finish (up to --graceful-timeout seconds) before exiting.
+"""
+import argparse
+import importlib
+import os
+import signal
+import sys
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+WSGI_APP = 'backend.wsgi:application'
+ASGI_APP = 'backend.asgi:application'
+WINDOWS = sys.platform == 'win32'
+
+
+def cantidad_workers():
+    """WEB_CONCURRENCY or one per core, between 2 and 8"""
+    if os.getenv('WEB_CONCURRENCY'):
+        return int(os.environ['WEB_CONCURRENCY'])
+    return max(2, min(os.cpu_count() or 1, 8))
+
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de producción del backend.')
+    parser.add_argument('--host', default=os.getenv('SERVER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('SERVER_PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=cantidad_workers(),
+                        help='Processes (default: WEB_CONCURRENCY or one per core, 2 to 8)')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVER_THREADS', '4')),
+                        help='Threads per process (WSGI)')
+    parser.add_argument('--asgi', action='store_true', help='Serve backend/asgi.py instead of backend/wsgi.py')
+    parser.add_argument('--keep-alive', type=int, default=5, help='Seconds an idle connection is kept open')
+    parser.add_argument('--timeout', type=int, default=120, help='Seconds before a stuck worker is restarted')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='Seconds in-flight requests get to finish on shutdown')
+    parser.add_argument('--stdin-control', action='store_true',
+                        help='Stop gracefully on a "stop" line or EOF on stdin (Electron)')
+    opciones = parser.parse_args(argv)
+    if opciones.workers < 1 or opciones.threads < 1:
+        parser.error('--workers y --threads deben ser mayores que cero')
+    return opciones
+
+
+def cargar(ruta):
+    """
+    Import the app and the URLconf (views, serializers), which Django would
+    otherwise import on the first request of each process
+    """
+    modulo, nombre = ruta.split(':')
+    aplicacion = getattr(importlib.import_module(modulo), nombre)
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    return aplicacion
+
+
+def aplicacion_asgi():
+    """uvicorn factory (each process imports it)"""
+    return cargar(ASGI_APP)
+
+
+def preparar():
+    """Idempotent start-up steps, once and before the server processes exist"""
+    import django
+    from django.db import DatabaseError, connections
+
+    django.setup()
+    from api.usuarios import crear_usuarios_iniciales
+    try:
+        crear_usuarios_iniciales()
+    except DatabaseError as exc:
+        # The database may not be configured yet: serve anyway (see /api/create-admin-users/)
+        print(f'No se pudieron crear los usuarios iniciales: {exc}', file=sys.stderr)
+    # Forked gunicorn workers must not inherit the connection
+    connections.close_all()
+
+
+def escuchar_stdin(detener):
+    """Call detener() on a `stop` line or EOF (parent process gone)"""
+    def leer():
+        for linea in sys.stdin:
+            if linea.strip().lower() == 'stop':
+                break
+        detener()
+
+    threading.Thread(target=leer, name='stdin-control', daemon=True).start()
+
+
+def _gunicorn(opciones):
+    from gunicorn.app.base import BaseApplication
+
+    configuracion = {
+        'bind': f'{opciones.host}:{opciones.port}',
+        'workers': opciones.workers,
+        'worker_class': 'uvicorn.workers.UvicornWorker' if opciones.asgi else 'gthread',
+        'threads': opciones.threads,
+        'preload_app': True,
+        'keepalive': opciones.keep_alive,
+        'timeout': opciones.timeout,
+        'graceful_timeout': opciones.graceful_timeout,
+        'accesslog': '-',
+        # gunicorn >= 26: no control socket in ~/.gunicorn shared by every instance
+        'control_socket_disable': True,
+    }
+    if opciones.stdin_control:
+        # The arbiter is this process: SIGTERM is gunicorn's graceful shutdown
+        configuracion['when_ready'] = lambda arbiter: escuchar_stdin(
+            lambda: os.kill(os.getpid(), signal.SIGTERM)
+        )
+
+    class Servidor(BaseApplication):
+        def load_config(self):
+            for clave, valor in configuracion.items():
+                if clave in self.cfg.settings:
+                    self.cfg.set(clave, valor)
+
+        def load(self):
+            return cargar(ASGI_APP if opciones.asgi else WSGI_APP)
+
+    Servidor().run()
+
+
+def _waitress(opciones):
+    from waitress import create_server
+    from waitress.task import ThreadedTaskDispatcher
+
+    class Despachador(ThreadedTaskDispatcher):
+        # run() calls shutdown() on KeyboardInterrupt: wait --graceful-timeout, not 5s
+        def shutdown(self, cancel_pending=True, timeout=5):
+            return super().shutdown(cancel_pending, opciones.graceful_timeout)
+
+    despachador = Despachador()
+    despachador.set_thread_count(opciones.workers * opciones.threads)
+    servidor = create_server(
+        cargar(WSGI_APP), host=opciones.host, port=opciones.port, _dispatcher=despachador,
+        channel_timeout=opciones.timeout,
+    )
+    if opciones.stdin_control:
+        escuchar_stdin(lambda: signal.raise_signal(signal.SIGINT))
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    servidor.print_listen('Sirviendo en http://{}:{}')
+    servidor.run()
+
+
+def _uvicorn(opciones):
+    import uvicorn
+
+    if opciones.stdin_control:
+        escuchar_stdin(lambda: signal.raise_signal(signal.SIGINT))
+    uvicorn.run(
+        'servidor:aplicacion_asgi', factory=True, host=opciones.host, port=opciones.port,
+        workers=opciones.workers, app_dir=BASE_DIR,
+        timeout_keep_alive=opciones.keep_alive, timeout_graceful_shutdown=opciones.graceful_timeout,
+    )
+
+
+def main(argv=None):
+    opciones = argumentos(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    preparar()
+    if not WINDOWS:
+        _gunicorn(opciones)
+    elif opciones.asgi:
+        _uvicorn(opciones)
+    else:
+        _waitress(opciones)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+# Superseded by the Django command (batched, read-only, with --dry-run):
+#   python manage.py import_products "Maderera Movimientos.xlsx" --sheet "STOCK FELI"
 import openpyxl
 import mysql.connector
 import warnings
@@ -1,11 +1,15 @@
 const { app, BrowserWindow, dialog } = require('electron')
 const { spawn } = require('child_process')
+const http = require('http')
 const path = require('path')
 const fs = require('fs')
 const { autoUpdater } = require('electron-updater')
 const os = require('os')
 
 let djangoProcess
+// Segundos que tienen las peticiones en curso para terminar al cerrar la app
+const APAGADO_SEGUNDOS = 10
+const BACKEND_URL = 'http://127.0.0.1:8000/api/'
 
 function getFrontendPath() {
   if (app.isPackaged) {
@@ -17,6 +21,25 @@ function getFrontendPath() {
   }
 }
 
+// Resuelve cuando el backend responde (cualquier estado HTTP) o al vencer el límite
+function esperarBackend(limiteMs = 30000, intervaloMs = 150) {
+  const inicio = Date.now()
+  return new Promise((resolve) => {
+    const intentar = () => {
+      const pedido = http.get(BACKEND_URL, { timeout: 1000 }, (res) => {
+        res.resume()
+        resolve(true)
+      })
+      pedido.on('timeout', () => pedido.destroy())
+      pedido.on('error', () => {
+        if (!djangoProcess || Date.now() - inicio > limiteMs) return resolve(false)
+        setTimeout(intentar, intervaloMs)
+      })
+    }
+    intentar()
+  })
+}
+
 function createWindow() {
   const frontendPath = getFrontendPath()
   console.log('Intentando cargar frontend en:', frontendPath)
@@ -71,9 +94,13 @@ app.whenReady().then(() => {
   const out = fs.openSync(path.join(tempDir, 'django_stdout.log'), 'a')
   const err = fs.openSync(path.join(tempDir, 'django_stderr.log'), 'a')
 
-  djangoProcess = spawn(pythonToUse, ['manage.py', 'runserver', '127.0.0.1:8000'], {
+  // Servidor de producción (gunicorn / waitress, ver backend/servidor.py).
+  // stdin queda conectado para pedirle un apagado ordenado al salir.
+  djangoProcess = spawn(pythonToUse, [
+    'servidor.py', '--stdin-control', '--graceful-timeout', String(APAGADO_SEGUNDOS)
+  ], {
     cwd: backendPath,
-    stdio: ['ignore', out, err],
+    stdio: ['pipe', out, err],
     env: { ...process.env }
   })
   djangoProcess.on('spawn', () => {
@@ -115,15 +142,44 @@ app.whenReady().then(() => {
     })
   }
 
-  setTimeout(createWindow, 3000)
+  esperarBackend().then((listo) => {
+    if (!listo) console.error('El backend no respondió a tiempo, se abre la ventana igual.')
+    createWindow()
+  })
 
   app.on('activate', () => {
     if (BrowserWindow.getAllWindows().length === 0) createWindow()
   })
 })
 
-// al cerrar la app, mata Django
+// Apagado ordenado: "stop" por stdin, y si no terminó a tiempo, kill
+function detenerDjango() {
+  return new Promise((resolve) => {
+    if (!djangoProcess || djangoProcess.exitCode !== null) return resolve()
+    const proceso = djangoProcess
+    djangoProcess = null
+    const limite = setTimeout(() => {
+      proceso.kill()
+      resolve()
+    }, (APAGADO_SEGUNDOS + 2) * 1000)
+    proceso.once('exit', () => {
+      clearTimeout(limite)
+      resolve()
+    })
+    proceso.stdin.end('stop\n')
+  })
+}
+
+// al cerrar la app, detiene Django
 app.on('window-all-closed', () => {
-  if (djangoProcess) djangoProcess.kill()
-  if (process.platform !== 'darwin') app.quit()
+  detenerDjango().then(() => {
+    if (process.platform !== 'darwin') app.quit()
+  })
+})
+
+app.on('before-quit', (event) => {
+  if (djangoProcess) {
+    event.preventDefault()
+    detenerDjango().then(() => app.quit())
+  }
 })